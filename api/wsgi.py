@@ -12,8 +12,22 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "project_settings")
 
 from django.core.wsgi import get_wsgi_application
 
+# Prefer the pre-built SQLite snapshot: copying or mapping it costs milliseconds,
+# while migrating and seeding can outlast the first request.
+from_snapshot = False
 try:
-    if os.getenv("AUTO_MIGRATE", "").lower() in ("1", "true", "yes", "on"):
+    import django
+
+    django.setup()
+    from otop_search_thailand.dbsnapshot import use_db_snapshot
+
+    from_snapshot = use_db_snapshot()
+except Exception:
+    # Fall back to migrate/seed below
+    pass
+
+try:
+    if not from_snapshot and os.getenv("AUTO_MIGRATE", "").lower() in ("1", "true", "yes", "on"):
         # Optionally run migrations on cold start (useful on serverless)
         import django
 
@@ -27,7 +41,7 @@ except Exception:
 
 # Optional: auto-seed data on cold start when DB is empty.
 try:
-    if os.getenv("AUTO_SEED", "").lower() in ("1", "true", "yes", "on"):
+    if not from_snapshot and os.getenv("AUTO_SEED", "").lower() in ("1", "true", "yes", "on"):
         import django
 
         django.setup()
@@ -62,7 +76,7 @@ try:
                         path = ""
             if path and _os.path.exists(path):
                 try:
-                    call_command("import_otop_json", "-i", path, verbosity=0)
+                    call_command("import_otop_json", "-i", path, "--build-snapshots", verbosity=0)
                 except Exception:
                     pass
 except Exception:
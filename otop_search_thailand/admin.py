@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Product, Province
+from .models import ImportManifest, Product, Province
 
 
 @admin.register(Province)
@@ -8,9 +8,7 @@ class ProvinceAdmin(admin.ModelAdmin):
     list_display = ("name", "slug", "product_count")
     search_fields = ("name",)
     prepopulated_fields = {"slug": ("name",)}
-
-    def product_count(self, obj):
-        return obj.products.count()
+    readonly_fields = ("product_count", "category_counts")
 
 
 @admin.register(Product)
@@ -18,3 +16,22 @@ class ProductAdmin(admin.ModelAdmin):
     list_display = ("name", "province", "category", "rating", "phone", "latitude", "longitude")
     list_filter = ("province", "category")
     search_fields = ("name", "province__name", "phone", "address")
+
+
+@admin.register(ImportManifest)
+class ImportManifestAdmin(admin.ModelAdmin):
+    list_display = (
+        "finished_at",
+        "source",
+        "delta",
+        "created",
+        "updated",
+        "unchanged",
+        "vanished",
+        "deleted",
+        "skipped",
+    )
+    readonly_fields = [f.name for f in ImportManifest._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,8 @@
+from django.apps import AppConfig
+
+
+class OtopSearchThailandConfig(AppConfig):
+    name = "otop_search_thailand"
+
+    def ready(self):
+        from . import signals  # noqa: F401
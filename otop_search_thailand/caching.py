@@ -0,0 +1,201 @@
+"""Response cache keyed on the catalogue data version.
+
+``cached_view`` stores whole responses in the ``OTOP_VIEW_CACHE_ALIAS`` cache
+(locmem, file-based or Redis; see ``CACHES``). An entry is served while its data
+version is current and its TTL has not run out, so imports and admin edits,
+which bump the version, are visible on the next request without any explicit
+invalidation.
+
+Only one worker rebuilds a missing or expired entry: it takes a short lock
+with ``cache.add``. Meanwhile the others serve the stale copy if there is one,
+as ``private, no-store`` without validators, or wait for the rebuilt entry.
+
+``cache_policy`` is the HTTP side: ``ETag``/``Last-Modified`` derived from the
+data version, answered with 304 before the view (or the database) runs, and a
+per-route ``Cache-Control`` for browsers and the CDN.
+"""
+
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .versioning import get_data_modified, get_data_version
+
+# Stale copies outlive their TTL by this factor, to be served while one worker rebuilds
+STALE_FACTOR = 2
+LOCK_TIMEOUT = 30
+LOCK_POLL = 0.05
+
+
+def _cache():
+    return caches[getattr(settings, "OTOP_VIEW_CACHE_ALIAS", "default")]
+
+
+def _enabled():
+    return getattr(settings, "OTOP_VIEW_CACHE", True)
+
+
+def _cache_key(name, request):
+    digest = hashlib.md5(request.get_full_path().encode("utf-8")).hexdigest()
+    return f"otop:view:{name}:{digest}"
+
+
+def _body(response, max_bytes):
+    """The full body of ``response`` if it fits in ``max_bytes``, else None.
+
+    A streaming body is read only up to the limit; past it the response keeps
+    streaming the rest to the client.
+    """
+    if not response.streaming:
+        return response.content if len(response.content) <= max_bytes else None
+    chunks, size = [], 0
+    stream = iter(response.streaming_content)
+    for chunk in stream:
+        chunks.append(chunk)
+        size += len(chunk)
+        if size > max_bytes:
+            response.streaming_content = _chain(chunks, stream)
+            return None
+    body = b"".join(chunks)
+    response.streaming_content = [body]
+    return body
+
+
+def _chain(head, tail):
+    yield from head
+    yield from tail
+
+
+def _to_entry(response, version, timeout, max_bytes):
+    if response.status_code != 200 or response.cookies or isinstance(response, FileResponse):
+        return None
+    cache_control = response.get("Cache-Control", "")
+    if "private" in cache_control or "no-store" in cache_control:
+        return None
+    body = _body(response, max_bytes)
+    if body is None:
+        return None
+    return {
+        "version": version,
+        "expires": time.time() + timeout,
+        "headers": list(response.items()),
+        "body": body,
+    }
+
+
+def _from_entry(entry, state):
+    response = HttpResponse(entry["body"])
+    for header, value in entry["headers"]:
+        response[header] = value
+    response["X-Cache"] = state
+    if state == "STALE":
+        # Rendered for an older data version: neither browsers nor the CDN may keep it
+        response["Cache-Control"] = "private, no-store"
+    return response
+
+
+def _fresh(entry, version):
+    return entry is not None and entry["version"] == version and entry["expires"] > time.time()
+
+
+def cached_view(name, timeout=300, max_bytes=1024 * 1024):
+    """Cache GET responses of a view for ``timeout`` seconds within one data version.
+
+    Bodies larger than ``max_bytes`` are not stored; the backend's own
+    ``MAX_ENTRIES`` bounds the number of entries.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD") or not _enabled():
+                return view(request, *args, **kwargs)
+            cache = _cache()
+            key = _cache_key(name, request)
+            version = get_data_version()
+            entry = cache.get(key)
+            if _fresh(entry, version):
+                return _from_entry(entry, "HIT")
+
+            lock = key + ":lock"
+            owner = cache.add(lock, 1, LOCK_TIMEOUT)
+            if not owner:
+                if entry is not None:
+                    return _from_entry(entry, "STALE")
+                # Another worker is building it; wait for its result rather than race it
+                deadline = time.monotonic() + LOCK_TIMEOUT
+                while time.monotonic() < deadline and cache.get(lock) is not None:
+                    time.sleep(LOCK_POLL)
+                    entry = cache.get(key)
+                    if _fresh(entry, version):
+                        return _from_entry(entry, "HIT")
+            try:
+                response = view(request, *args, **kwargs)
+                entry = _to_entry(response, version, timeout, max_bytes)
+                if entry is not None:
+                    cache.set(key, entry, timeout * STALE_FACTOR)
+            finally:
+                if owner:
+                    cache.delete(lock)
+            response["X-Cache"] = "MISS"
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+# Cache-Control per route; OTOP_CACHE_POLICIES overrides entries by route name.
+# Validators are cheap to check, so the CDN may serve stale copies while revalidating.
+CACHE_POLICIES = {
+    "default": {"max_age": 0, "s_maxage": 300, "stale_while_revalidate": 86400},
+    "api": {"max_age": 60, "s_maxage": 300, "stale_while_revalidate": 86400},
+}
+
+
+def get_policy(route):
+    policies = {**CACHE_POLICIES, **getattr(settings, "OTOP_CACHE_POLICIES", {})}
+    default = policies["api" if route.startswith("api_") else "default"]
+    return policies.get(route, default)
+
+
+def _etag(request, *args, **kwargs):
+    # The release keeps clients from revalidating old pages against a new deploy
+    release = getattr(settings, "OTOP_RELEASE", "")
+    version = get_data_version()
+    return f'W/"v{version}.{release}"' if release else f'W/"v{version}"'
+
+
+def _last_modified(request, *args, **kwargs):
+    return get_data_modified()
+
+
+def cache_policy(route):
+    """Validators from the data version and the ``Cache-Control`` of ``route``."""
+
+    def decorator(view):
+        conditional = condition(etag_func=_etag, last_modified_func=_last_modified)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional(request, *args, **kwargs)
+            if "no-store" in response.get("Cache-Control", ""):
+                # The current validators would pin content that is not current
+                for header in ("ETag", "Last-Modified"):
+                    if response.has_header(header):
+                        del response[header]
+            elif request.method in ("GET", "HEAD") and response.status_code in (200, 304):
+                policy = get_policy(route)
+                if policy:
+                    patch_cache_control(response, public=True, **policy)
+            return response
+
+        return wrapper
+
+    return decorator
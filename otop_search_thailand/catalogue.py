@@ -0,0 +1,300 @@
+"""Read-only, in-memory columnar copy of the catalogue.
+
+With ``OTOP_CATALOGUE_STORE = "memory"`` each worker loads the products once per
+data version into parallel columns: ``array`` buffers for ids, coordinates and
+ratings, small integer codes into interned province and category tables, and
+plain lists for the remaining text. The public APIs and the home page
+statistics then filter, sort and page without the ORM. When NumPy is installed
+the filters and counts run as vectorized operations over the same buffers.
+
+Names sort by code point, as SQLite's default collation does.
+"""
+
+import heapq
+import math
+import os
+import sys
+from array import array
+from bisect import bisect_right
+from collections import Counter
+from functools import cached_property
+
+from django.conf import settings
+
+from .geo import sample_key
+from .models import CatalogueStats, Product, Province
+from .pagination import decode_cursor, encode_cursor
+from .stats import TOP_N
+from .versioning import VersionedValue, get_data_version
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency
+    np = None
+
+LOAD_FIELDS = (
+    "id",
+    "name",
+    "province_id",
+    "category",
+    "rating",
+    "address",
+    "phone",
+    "lat",
+    "lng",
+    "description",
+    "image_url",
+)
+TEXT_COLUMNS = ("name", "address", "phone", "description", "image_url")
+
+
+def store_enabled():
+    return getattr(settings, "OTOP_CATALOGUE_STORE", "") == "memory"
+
+
+def _coordinate(value):
+    # NaN marks a missing coordinate inside the float buffers
+    return None if value != value else value
+
+
+class Catalogue:
+    def __init__(self, version, provinces, rows):
+        """``provinces`` are ``(id, name, slug)``; ``rows`` follow ``LOAD_FIELDS`` in id order."""
+        self.version = version
+        self.province_names = [sys.intern(name) for _, name, _ in provinces]
+        self.province_slugs = [slug for _, _, slug in provinces]
+        province_codes = {pk: code for code, (pk, _, _) in enumerate(provinces)}
+        self.slug_codes = {slug: code for code, slug in enumerate(self.province_slugs)}
+        self.categories = []
+        self.category_codes = {}
+
+        self.ids = array("q")
+        self.rating = array("d")
+        self.lat = array("d")
+        self.lng = array("d")
+        self.province = array("I")
+        self.category = array("I")
+        self.text = {column: [] for column in TEXT_COLUMNS}
+        for pk, name, province_id, category, rating, address, phone, lat, lng, desc, image in rows:
+            self.ids.append(pk)
+            self.rating.append(float(rating or 0))
+            self.lat.append(math.nan if lat is None else lat)
+            self.lng.append(math.nan if lng is None else lng)
+            self.province.append(province_codes[province_id])
+            code = self.category_codes.get(category)
+            if code is None:
+                code = self.category_codes[category] = len(self.categories)
+                self.categories.append(sys.intern(category))
+            self.category.append(code)
+            for column, value in zip(TEXT_COLUMNS, (name, address, phone, desc, image)):
+                self.text[column].append(value)
+
+        names, ids = self.text["name"], self.ids
+        self.by_name = array("I", sorted(range(len(ids)), key=lambda i: (names[i], ids[i])))
+        self.rank = array("I", [0]) * len(ids)
+        for rank, i in enumerate(self.by_name):
+            self.rank[i] = rank
+        if np is not None:
+            # Zero-copy views over the array buffers
+            self.np = {
+                column: np.frombuffer(getattr(self, column), dtype=dtype)
+                for column, dtype in (
+                    ("lat", np.float64),
+                    ("lng", np.float64),
+                    ("province", np.uint32),
+                    ("category", np.uint32),
+                    ("rank", np.uint32),
+                )
+            }
+        self.getters = {
+            "id": ids.__getitem__,
+            "name": names.__getitem__,
+            "province__name": lambda i: self.province_names[self.province[i]],
+            "category": lambda i: self.categories[self.category[i]],
+            "rating": self.rating.__getitem__,
+            "address": self.text["address"].__getitem__,
+            "phone": self.text["phone"].__getitem__,
+            "lat": lambda i: _coordinate(self.lat[i]),
+            "lng": lambda i: _coordinate(self.lng[i]),
+            "description": self.text["description"].__getitem__,
+            "image_url": self.text["image_url"].__getitem__,
+        }
+        self.nbytes = self._nbytes()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _nbytes(self):
+        arrays = (self.ids, self.rating, self.lat, self.lng, self.province, self.category)
+        total = sum(a.buffer_info()[1] * a.itemsize for a in arrays + (self.by_name, self.rank))
+        seen = set()
+        lists = [*self.text.values(), self.province_names, self.province_slugs, self.categories]
+        for values in lists:
+            total += sys.getsizeof(values)
+            for value in values:
+                if value is not None and id(value) not in seen:
+                    seen.add(id(value))
+                    total += sys.getsizeof(value)
+        return total
+
+    def rows(self, positions, lookups):
+        """Tuples of the ORM ``lookups`` (see ``PRODUCT_LOOKUPS``) for each position."""
+        getters = [self.getters[lookup] for lookup in lookups]
+        for i in positions:
+            yield tuple(get(i) for get in getters)
+
+    def located(self):
+        """Positions of products with coordinates, in id order."""
+        if np is not None:
+            return np.flatnonzero(~np.isnan(self.np["lat"]) & ~np.isnan(self.np["lng"]))
+        return [
+            i for i, (lat, lng) in enumerate(zip(self.lat, self.lng)) if lat == lat and lng == lng
+        ]
+
+    def within(self, bbox):
+        """Positions inside ``bbox`` (see ``geo.bbox_q``), in id order."""
+        min_lng, min_lat, max_lng, max_lat = bbox
+        wraps = min_lng > max_lng
+        if np is not None:
+            lat, lng = self.np["lat"], self.np["lng"]
+            mask = (lat >= min_lat) & (lat <= max_lat)
+            if wraps:
+                mask &= (lng >= min_lng) | (lng <= max_lng)
+            else:
+                mask &= (lng >= min_lng) & (lng <= max_lng)
+            return np.flatnonzero(mask)
+        return [
+            i
+            for i, (lat, lng) in enumerate(zip(self.lat, self.lng))
+            if min_lat <= lat <= max_lat
+            and ((lng >= min_lng or lng <= max_lng) if wraps else min_lng <= lng <= max_lng)
+        ]
+
+    def where(self, province_slug="", category=""):
+        """Positions matching the given filters; None when there are none (everything)."""
+        if not province_slug and not category:
+            return None
+        tests = []
+        if province_slug:
+            tests.append(("province", self.slug_codes.get(province_slug)))
+        if category:
+            tests.append(("category", self.category_codes.get(category)))
+        if any(code is None for _, code in tests):
+            return []
+        if np is not None:
+            mask = np.ones(len(self), dtype=bool)
+            for column, code in tests:
+                mask &= self.np[column] == code
+            return np.flatnonzero(mask)
+        columns = [(getattr(self, column), code) for column, code in tests]
+        return [i for i in range(len(self)) if all(col[i] == code for col, code in columns)]
+
+    def sample(self, positions, limit):
+        """The first ``limit`` of ``positions`` in ``geo.sampled`` order."""
+        ids = self.ids
+        return heapq.nsmallest(limit, positions, key=lambda i: (sample_key(ids[i]), ids[i]))
+
+    def page(self, positions, cursor=None, limit=20):
+        """``(positions, next_cursor)`` of one page by ``(name, id)``, as ``keyset_page``."""
+        start = 0
+        if cursor:
+            name, pk = decode_cursor(cursor, 2)
+            if not isinstance(name, str) or not isinstance(pk, int):
+                raise ValueError("Invalid cursor")
+            names, ids = self.text["name"], self.ids
+            start = bisect_right(self.by_name, (name, pk), key=lambda i: (names[i], ids[i]))
+        if positions is None:
+            chosen = self.by_name[start : start + limit + 1]
+        elif np is not None:
+            positions = np.asarray(positions, dtype=np.intp)
+            ranks = self.np["rank"][positions]
+            keep = ranks >= start
+            positions, ranks = positions[keep], ranks[keep]
+            chosen = positions[np.argsort(ranks, kind="stable")[: limit + 1]].tolist()
+        else:
+            rank = self.rank
+            chosen = heapq.nsmallest(
+                limit + 1, (i for i in positions if rank[i] >= start), key=rank.__getitem__
+            )
+        rows = list(chosen[:limit])
+        next_cursor = None
+        if len(chosen) > limit:
+            last = rows[-1]
+            next_cursor = encode_cursor([self.text["name"][last], self.ids[last]])
+        return rows, next_cursor
+
+    def _counts(self, column, size):
+        if np is not None:
+            return np.bincount(self.np[column], minlength=size).tolist()
+        counter = Counter(getattr(self, column))
+        return [counter[code] for code in range(size)]
+
+    @cached_property
+    def _stats(self):
+        category_counts = self._counts("category", len(self.categories))
+        top_categories = sorted(
+            (
+                {"category": category, "c": count}
+                for category, count in zip(self.categories, category_counts)
+                if category and count
+            ),
+            key=lambda row: (-row["c"], row["category"]),
+        )[:TOP_N]
+        province_counts = sorted(
+            (
+                {"name": name, "slug": slug, "product_total": count}
+                for name, slug, count in zip(
+                    self.province_names,
+                    self.province_slugs,
+                    self._counts("province", len(self.province_names)),
+                )
+            ),
+            key=lambda row: (-row["product_total"], row["name"]),
+        )
+        names, rating = self.text["name"], self.rating
+        top_products = [
+            {
+                "name": names[i],
+                "province": self.province_names[self.province[i]],
+                "province_slug": self.province_slugs[self.province[i]],
+                "category": self.categories[self.category[i]],
+                "rating": rating[i],
+                "image_url": self.text["image_url"][i],
+            }
+            for i in heapq.nsmallest(TOP_N, range(len(self)), key=lambda i: (-rating[i], names[i]))
+        ]
+        return CatalogueStats(
+            version=self.version,
+            total_products=len(self),
+            total_provinces=len(province_counts),
+            top_categories=top_categories,
+            province_counts=province_counts,
+            top_products=top_products,
+        )
+
+    def stats(self):
+        """An unsaved ``CatalogueStats`` equal to what ``stats.rebuild_stats`` would store."""
+        return self._stats
+
+    def report(self):
+        return {
+            "version": self.version,
+            "products": len(self),
+            "bytes": self.nbytes,
+            "pid": os.getpid(),
+            "numpy": np is not None,
+        }
+
+
+def load():
+    version = get_data_version()
+    provinces = list(Province.objects.order_by("id").values_list("id", "name", "slug"))
+    rows = Product.objects.order_by("id").values_list(*LOAD_FIELDS).iterator(chunk_size=2000)
+    return Catalogue(version, provinces, rows)
+
+
+_catalogue = VersionedValue(load)
+
+
+def get_catalogue():
+    return _catalogue.get()
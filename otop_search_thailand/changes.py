@@ -0,0 +1,94 @@
+"""Product change log for clients that sync incrementally.
+
+Every product insert, update and delete leaves a ``ProductChange`` row: the
+save signals write them one by one, the batch importer in bulk. Rows start
+unstamped; ``bump_data_version`` stamps them with the version it produces,
+so one import is one version however many rows it touched. A single save
+bumps first and writes its row already stamped. Only the last
+``OTOP_CHANGE_LOG_VERSIONS`` versions are kept; a client further behind is
+told to resync.
+"""
+
+from django.conf import settings
+
+from .models import CatalogueVersion, Product, ProductChange
+
+# Past this many changes a full download is about as cheap as the delta
+MAX_CHANGES = 5000
+# Retention is enforced on read, so expired rows can be deleted in batches
+COMPACT_EVERY = 50
+
+
+def _keep_versions():
+    return int(getattr(settings, "OTOP_CHANGE_LOG_VERSIONS", 500))
+
+
+def record(product_ids, action, version=None):
+    ProductChange.objects.bulk_create(
+        [ProductChange(version=version, product_id=pk, action=action) for pk in product_ids],
+        batch_size=1000,
+    )
+
+
+def stamp(version):
+    """Assign changes recorded without a version to ``version``."""
+    ProductChange.objects.filter(version__isnull=True).update(version=version)
+
+
+def unstamped():
+    """``(changed, deleted)`` ids of products whose changes await a version stamp."""
+    changed, deleted = set(), set()
+    rows = ProductChange.objects.filter(version__isnull=True).values_list("product_id", "action")
+    for pk, action in rows.iterator():
+        (deleted if action == ProductChange.DELETED else changed).add(pk)
+    return changed - deleted, deleted
+
+
+def compact(version):
+    """Delete changes past retention, every ``COMPACT_EVERY`` versions."""
+    floor = version - _keep_versions()
+    if version % COMPACT_EVERY or floor <= 0:
+        return
+    # Raise the floor first: a client must never get a delta with rows missing
+    CatalogueVersion.objects.filter(pk=1, compacted_to__lt=floor).update(compacted_to=floor)
+    ProductChange.objects.filter(version__lte=floor).delete()
+
+
+def changes_since(since, version):
+    """Net ``(inserted, updated, deleted)`` product ids in ``(since, version]``.
+
+    None when the log no longer reaches back to ``since`` (or the delta is too
+    large to be worth it) and the client has to download everything again.
+    """
+    compacted_to = (
+        CatalogueVersion.objects.filter(pk=1).values_list("compacted_to", flat=True).first() or 0
+    )
+    if since < max(compacted_to, version - _keep_versions()) or since > version:
+        return None
+    rows = list(
+        ProductChange.objects.filter(version__gt=since, version__lte=version)
+        .order_by("version", "id")
+        .values_list("product_id", "action")[: MAX_CHANGES + 1]
+    )
+    if len(rows) > MAX_CHANGES:
+        return None
+    first, last = {}, {}
+    for pk, action in rows:
+        first.setdefault(pk, action)
+        last[pk] = action
+    inserted, updated, deleted = [], [], []
+    for pk, action in last.items():
+        if action == ProductChange.DELETED:
+            # Created and deleted within the window: the client never saw it
+            if first[pk] != ProductChange.INSERTED:
+                deleted.append(pk)
+        elif first[pk] == ProductChange.INSERTED:
+            inserted.append(pk)
+        else:
+            updated.append(pk)
+    # Rows removed without a logged delete (raw SQL, say) still reach the client as deletes
+    live = set(Product.objects.filter(id__in=inserted + updated).values_list("id", flat=True))
+    deleted += [pk for pk in updated if pk not in live]
+    inserted = [pk for pk in inserted if pk in live]
+    updated = [pk for pk in updated if pk in live]
+    return sorted(inserted), sorted(updated), sorted(deleted)
@@ -0,0 +1,174 @@
+"""Zoom-aware marker clustering.
+
+Points are projected to Web Mercator and bucketed into a quadtree-aligned grid:
+a cell at zoom ``z`` is exactly four cells at ``z + 1``, so each level is built
+by merging the level above it. The index lives in process memory and is rebuilt
+lazily whenever the catalogue data version changes.
+"""
+
+import math
+
+from .models import Product
+from .versioning import VersionedValue
+
+MAX_ZOOM = 16
+# Cells are 2**-CELL_BITS of a 256px tile, i.e. a 64px clustering radius
+CELL_BITS = 2
+
+POINT_FIELDS = ("id", "name", "province__name", "category", "phone", "lat", "lng")
+
+
+def project(lng, lat):
+    """Longitude/latitude to normalized Web Mercator ``(x, y)`` in [0, 1]."""
+    x = (lng + 180.0) / 360.0
+    sin = min(max(math.sin(math.radians(lat)), -0.9999), 0.9999)
+    y = 0.5 - math.log((1 + sin) / (1 - sin)) / (4 * math.pi)
+    return min(max(x, 0.0), 1.0), min(max(y, 0.0), 1.0)
+
+
+def unproject(x, y):
+    lng = x * 360.0 - 180.0
+    lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y))))
+    return lng, lat
+
+
+class ClusterIndex:
+    def __init__(self, points):
+        """``points`` is a sequence of ``(x, y, properties)`` in Mercator space."""
+        self.points = list(points)
+        self.levels = {}
+        size = 1 << (MAX_ZOOM + CELL_BITS)
+        cells = {}
+        for i, (x, y, _) in enumerate(self.points):
+            key = (min(int(x * size), size - 1), min(int(y * size), size - 1))
+            cell = cells.get(key)
+            if cell is None:
+                cells[key] = [1, x, y, i]
+            else:
+                cell[0] += 1
+                cell[1] += x
+                cell[2] += y
+        self.levels[MAX_ZOOM] = cells
+        for zoom in range(MAX_ZOOM - 1, -1, -1):
+            parent = {}
+            for (cx, cy), (count, sx, sy, first) in self.levels[zoom + 1].items():
+                key = (cx >> 1, cy >> 1)
+                cell = parent.get(key)
+                if cell is None:
+                    parent[key] = [count, sx, sy, first]
+                else:
+                    cell[0] += count
+                    cell[1] += sx
+                    cell[2] += sy
+            self.levels[zoom] = parent
+
+    def _cells(self, zoom, bbox):
+        cells = self.levels[zoom]
+        size = 1 << (zoom + CELL_BITS)
+        min_lng, min_lat, max_lng, max_lat = bbox
+        ranges = [(min_lng, max_lng)] if min_lng <= max_lng else [(min_lng, 180), (-180, max_lng)]
+        _, y0 = project(0, max_lat)
+        _, y1 = project(0, min_lat)
+        cy0, cy1 = int(y0 * size), min(int(y1 * size), size - 1)
+        for west, east in ranges:
+            cx0 = int(project(west, 0)[0] * size)
+            cx1 = min(int(project(east, 0)[0] * size), size - 1)
+            span = (cx1 - cx0 + 1) * (cy1 - cy0 + 1)
+            if span <= len(cells):
+                for cx in range(cx0, cx1 + 1):
+                    for cy in range(cy0, cy1 + 1):
+                        cell = cells.get((cx, cy))
+                        if cell is not None:
+                            yield (cx, cy), cell
+            else:
+                for (cx, cy), cell in cells.items():
+                    if cx0 <= cx <= cx1 and cy0 <= cy <= cy1:
+                        yield (cx, cy), cell
+
+    def expansion_zoom(self, zoom, key):
+        """First zoom at which the cluster in cell ``key`` splits into several cells."""
+        keys = [key]
+        while zoom < MAX_ZOOM:
+            zoom += 1
+            level = self.levels[zoom]
+            keys = [
+                child
+                for cx, cy in keys
+                for child in (
+                    (2 * cx, 2 * cy),
+                    (2 * cx + 1, 2 * cy),
+                    (2 * cx, 2 * cy + 1),
+                    (2 * cx + 1, 2 * cy + 1),
+                )
+                if child in level
+            ]
+            if len(keys) > 1:
+                break
+        return zoom
+
+    def _feature(self, zoom, key, cell):
+        count, sx, sy, first = cell
+        if count == 1:
+            props = self.points[first][2]
+            lng, lat = props["lng"], props["lat"]
+            properties = {k: v for k, v in props.items() if k not in ("lat", "lng")}
+            properties.update(cluster=False, count=1)
+        else:
+            lng, lat = unproject(sx / count, sy / count)
+            properties = {
+                "cluster": True,
+                "count": count,
+                "expansion_zoom": self.expansion_zoom(zoom, key),
+            }
+        return {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [round(lng, 6), round(lat, 6)]},
+            "properties": properties,
+        }
+
+    def features(self, zoom, bbox):
+        """GeoJSON features for ``bbox`` at ``zoom``: clusters, or points when alone."""
+        zoom = min(max(int(zoom), 0), MAX_ZOOM)
+        for key, cell in self._cells(zoom, bbox):
+            yield self._feature(zoom, key, cell)
+
+    def tile_features(self, z, x, y):
+        """GeoJSON features for slippy-map tile ``z/x/y``."""
+        cells = self.levels[z]
+        span = 1 << CELL_BITS
+        for cx in range(x * span, (x + 1) * span):
+            for cy in range(y * span, (y + 1) * span):
+                cell = cells.get((cx, cy))
+                if cell is not None:
+                    yield self._feature(z, (cx, cy), cell)
+
+
+def build_index():
+    points = []
+    rows = (
+        Product.objects.filter(lat__isnull=False, lng__isnull=False)
+        .order_by("id")
+        .values_list(*POINT_FIELDS)
+        .iterator(chunk_size=2000)
+    )
+    for pk, name, province, category, phone, lat, lng in rows:
+        x, y = project(lng, lat)
+        props = {
+            "id": pk,
+            "name": name,
+            "province": province,
+            "category": category,
+            "phone": phone,
+            "lat": lat,
+            "lng": lng,
+        }
+        points.append((x, y, props))
+    return ClusterIndex(points)
+
+
+_index = VersionedValue(build_index)
+
+
+def get_index():
+    """The cluster index for the current data version, rebuilt on change."""
+    return _index.get()
@@ -0,0 +1,75 @@
+"""Denormalized product counters on ``Province``.
+
+``Province.product_count`` and ``Province.category_counts`` are adjusted one
+product at a time by the save/delete signals and recomputed in batch by the
+importer. ``check_province_counters`` compares them with the product table.
+"""
+
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Product, Province
+
+
+def _actual_counts(province_ids=None):
+    qs = Product.objects.order_by()
+    if province_ids is not None:
+        qs = qs.filter(province_id__in=province_ids)
+    counts = {}
+    for province_id, category, count in qs.values_list("province_id", "category").annotate(
+        c=Count("id")
+    ):
+        counts.setdefault(province_id, {})[category] = count
+    return counts
+
+
+def find_drift(province_ids=None):
+    """Provinces whose stored counters differ from the product table.
+
+    Returns ``(province, product_count, category_counts)`` with the correct values.
+    """
+    counts = _actual_counts(province_ids)
+    provinces = Province.objects.order_by("name")
+    if province_ids is not None:
+        provinces = provinces.filter(id__in=province_ids)
+    drift = []
+    for province in provinces:
+        categories = counts.get(province.id, {})
+        total = sum(categories.values())
+        if province.product_count != total or province.category_counts != categories:
+            drift.append((province, total, categories))
+    return drift
+
+
+def recount_provinces(province_ids=None):
+    """Recompute counters from the product table; returns the provinces fixed."""
+    fixed = []
+    for province, total, categories in find_drift(province_ids):
+        province.product_count = total
+        province.category_counts = categories
+        fixed.append(province)
+    # bulk_update sends no save signals, so counters never bump the data version
+    Province.objects.bulk_update(fixed, ["product_count", "category_counts"], batch_size=500)
+    return fixed
+
+
+def adjust(province_id, category, delta):
+    """Add ``delta`` products of ``category`` to province ``province_id``."""
+    with transaction.atomic():
+        row = (
+            Province.objects.select_for_update()
+            .filter(pk=province_id)
+            .values_list("product_count", "category_counts")
+            .first()
+        )
+        if row is None:
+            return
+        total, categories = row
+        count = categories.get(category, 0) + delta
+        if count > 0:
+            categories[category] = count
+        else:
+            categories.pop(category, None)
+        Province.objects.filter(pk=province_id).update(
+            product_count=max(total + delta, 0), category_counts=categories
+        )
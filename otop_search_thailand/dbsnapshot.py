@@ -0,0 +1,120 @@
+"""Pre-built SQLite database for serverless cold starts.
+
+``build_db_snapshot`` writes a migrated, indexed, analyzed and vacuumed copy of
+the SQLite catalogue at build time. On cold start ``use_db_snapshot`` checks
+that the snapshot has every migration this code knows about, then either copies
+it over the (missing) working database or, in ``immutable`` mode, points the
+default connection at the file in place, read-only and memory-mapped.
+"""
+
+import os
+import shutil
+import sqlite3
+
+from django.conf import settings
+from django.db import connections
+
+# Bytes of the database SQLite may memory-map instead of reading through the page cache
+MMAP_SIZE = 256 * 1024 * 1024
+MODES = ("copy", "immutable")
+
+
+def snapshot_path():
+    return str(getattr(settings, "OTOP_DB_SNAPSHOT", "") or "")
+
+
+def _open_read_only(path):
+    return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+
+def expected_migrations():
+    """``(app, name)`` of every migration on disk for the installed apps."""
+    from django.db.migrations.loader import MigrationLoader
+
+    return set(MigrationLoader(None, ignore_no_migrations=True).graph.nodes)
+
+
+def missing_migrations(path):
+    """Migrations the snapshot at ``path`` lacks; empty when its schema is current."""
+    conn = _open_read_only(path)
+    try:
+        applied = set(conn.execute("SELECT app, name FROM django_migrations"))
+    except sqlite3.DatabaseError:
+        applied = set()
+    finally:
+        conn.close()
+    return expected_migrations() - applied
+
+
+def build_db_snapshot(path=None, using="default"):
+    """Write the ``using`` SQLite database to ``path``; returns the data version it holds."""
+    from .stats import refresh_stats
+    from .versioning import get_data_version
+
+    path = path or snapshot_path()
+    if not path:
+        raise ValueError("OTOP_DB_SNAPSHOT is not configured")
+    connection = connections[using]
+    if connection.vendor != "sqlite":
+        raise ValueError("Database snapshots need the SQLite backend")
+    # Materialized rows must be current: an immutable snapshot cannot refresh them
+    refresh_stats()
+    version = get_data_version(fresh=True)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp = path + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    with connection.cursor() as cursor:
+        cursor.execute("VACUUM INTO %s", [tmp])
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.execute("ANALYZE")
+        conn.execute("PRAGMA journal_mode = DELETE")
+        conn.commit()
+    finally:
+        conn.close()
+    missing = missing_migrations(tmp)
+    if missing:
+        os.remove(tmp)
+        raise ValueError(f"Database is not fully migrated ({len(missing)} pending migrations)")
+    os.replace(tmp, path)
+    return version
+
+
+def _install_copy(snapshot, target):
+    if os.path.exists(target):
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+    # Copy beside the target and rename, so concurrent workers never see a partial file
+    tmp = f"{target}.{os.getpid()}.tmp"
+    shutil.copyfile(snapshot, tmp)
+    os.replace(tmp, target)
+
+
+def use_db_snapshot(using="default"):
+    """Serve ``using`` from the build-time snapshot; returns False when it cannot be used.
+
+    Must run before the first query on the connection.
+    """
+    snapshot = snapshot_path()
+    db = connections.settings[using]
+    if not snapshot or not os.path.exists(snapshot) or "sqlite3" not in db["ENGINE"]:
+        return False
+    mode = getattr(settings, "OTOP_DB_SNAPSHOT_MODE", "copy") or "copy"
+    if mode not in MODES:
+        raise ValueError(f"OTOP_DB_SNAPSHOT_MODE must be one of {', '.join(MODES)}")
+    if missing_migrations(snapshot):
+        return False
+
+    options = db.setdefault("OPTIONS", {})
+    options.setdefault("init_command", f"PRAGMA mmap_size = {MMAP_SIZE}")
+    if mode == "immutable":
+        # Nothing may write to the file, so SQLite skips locking and change detection
+        db["NAME"] = f"file:{os.path.abspath(snapshot)}?mode=ro&immutable=1"
+        options["uri"] = True
+    else:
+        _install_copy(snapshot, str(db["NAME"]))
+    connections[using].close()
+    return True
@@ -0,0 +1,178 @@
+"""Serving large static files (the raw ``otop.json`` feed) straight from disk.
+
+Responses are ``FileResponse`` objects over an open file, so under a WSGI
+server with ``wsgi.file_wrapper`` (gunicorn) the body goes out through
+``sendfile`` and the worker never holds the file in memory. On top of that:
+conditional requests (``ETag``/``Last-Modified``), single ``Range`` requests,
+and gzip/brotli sidecars (``otop.json.gz``/``.br``) written by
+``write_sidecars``.
+"""
+
+import gzip
+import os
+import shutil
+
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date, parse_http_date_safe
+
+from .snapshots import accepted_encodings, brotli, etag_matches
+
+SIDECARS = {"br": ".br", "gzip": ".gz"}
+CHUNK_SIZE = 1024 * 1024
+
+
+class FileRange:
+    """Read-only window ``[start, start + length)`` of an open binary file.
+
+    ``fileno`` stays available, so ``sendfile`` starts at the current offset and
+    stops at the response's ``Content-Length``.
+    """
+
+    def __init__(self, f, start, length):
+        f.seek(start)
+        self.f = f
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.f.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.f.fileno()
+
+    def close(self):
+        self.f.close()
+
+
+def write_sidecars(path):
+    """Write ``path.gz`` (and ``path.br`` when brotli is installed); returns their paths."""
+    written = []
+    tmp = path + ".gz.tmp"
+    with open(path, "rb") as src, gzip.GzipFile(tmp, "wb", compresslevel=9, mtime=0) as dst:
+        shutil.copyfileobj(src, dst, CHUNK_SIZE)
+    os.replace(tmp, path + ".gz")
+    written.append(path + ".gz")
+    if brotli is not None:
+        tmp = path + ".br.tmp"
+        compressor = brotli.Compressor(quality=11)
+        with open(path, "rb") as src, open(tmp, "wb") as dst:
+            for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                dst.write(compressor.process(chunk))
+            dst.write(compressor.finish())
+        os.replace(tmp, path + ".br")
+        written.append(path + ".br")
+    return written
+
+
+def _fresh_sidecar(path, stat, encoding):
+    sidecar = path + SIDECARS[encoding]
+    try:
+        # A sidecar older than the file it compresses is stale
+        return sidecar if os.stat(sidecar).st_mtime_ns >= stat.st_mtime_ns else None
+    except OSError:
+        return None
+
+
+def parse_range(header, size):
+    """``(start, length)`` for a single ``bytes=`` range, None to ignore it.
+
+    Raises ValueError when the range cannot be satisfied.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        # Multipart ranges are optional; answer with the whole file instead
+        return None
+    first, dash, last = spec.strip().partition("-")
+    if not dash:
+        return None
+    try:
+        if not first:
+            suffix = int(last)
+            if suffix <= 0:
+                raise ValueError("Unsatisfiable range")
+            start = max(size - suffix, 0)
+            end = size - 1
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        raise ValueError("Unsatisfiable range")
+    if start < 0 or start >= size or end < start:
+        raise ValueError("Unsatisfiable range")
+    return start, end - start + 1
+
+
+def _not_modified(request, etag, mtime):
+    if "HTTP_IF_NONE_MATCH" in request.META:
+        return etag_matches(request, etag)
+    since = parse_http_date_safe(request.META.get("HTTP_IF_MODIFIED_SINCE", ""))
+    return since is not None and int(mtime) <= since
+
+
+def _range_applies(request, etag, mtime):
+    """``If-Range`` must name the current representation, or the whole file is sent."""
+    condition = request.META.get("HTTP_IF_RANGE", "").strip()
+    if not condition:
+        return True
+    if condition.startswith('"'):
+        return condition == f'"{etag}"'
+    return parse_http_date_safe(condition) == int(mtime)
+
+
+def file_response(request, path, content_type, filename=None):
+    """Serve ``path`` with validators, ``Range`` and precompressed sidecars.
+
+    Raises OSError if the file cannot be opened.
+    """
+    stat = os.stat(path)
+    etag = f"{stat.st_mtime_ns:x}.{stat.st_size:x}"
+    filename = filename or os.path.basename(path)
+    if _not_modified(request, etag, stat.st_mtime):
+        response = HttpResponseNotModified()
+        response["ETag"] = f'"{etag}"'
+        response["Last-Modified"] = http_date(stat.st_mtime)
+        response["Vary"] = "Accept-Encoding"
+        return response
+
+    byte_range = None
+    raw_range = request.META.get("HTTP_RANGE", "")
+    if raw_range and _range_applies(request, etag, stat.st_mtime):
+        try:
+            byte_range = parse_range(raw_range, stat.st_size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{stat.st_size}"
+            return response
+
+    encoding = sidecar = None
+    if byte_range is None:
+        # Ranges address the identity bytes, so only whole-file responses are encoded
+        accepted = accepted_encodings(request)
+        for candidate in SIDECARS:
+            if candidate in accepted:
+                sidecar = _fresh_sidecar(path, stat, candidate)
+                if sidecar:
+                    encoding = candidate
+                    break
+
+    f = open(sidecar or path, "rb")
+    if byte_range is None:
+        response = FileResponse(f, content_type=content_type, filename=filename)
+        response["ETag"] = f'"{etag}-{encoding}"' if encoding else f'"{etag}"'
+        if encoding:
+            response["Content-Encoding"] = encoding
+    else:
+        start, length = byte_range
+        response = FileResponse(
+            FileRange(f, start, length), status=206, content_type=content_type, filename=filename
+        )
+        response["Content-Length"] = str(length)
+        response["Content-Range"] = f"bytes {start}-{start + length - 1}/{stat.st_size}"
+        response["ETag"] = f'"{etag}"'
+    response["Last-Modified"] = http_date(stat.st_mtime)
+    response["Accept-Ranges"] = "bytes"
+    response["Vary"] = "Accept-Encoding"
+    return response
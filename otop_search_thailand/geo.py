@@ -0,0 +1,135 @@
+"""Spatial helpers shared by the map APIs."""
+
+from django.db.models import F, Q
+from django.db.models.functions import Mod
+
+# Knuth's multiplicative hash spreads ids evenly; used as a stable sampling order
+_SAMPLE_MULTIPLIER = 2654435761
+_SAMPLE_MODULUS = 2**32
+
+
+def parse_bbox(raw):
+    """Parse ``minLng,minLat,maxLng,maxLat`` into floats, raising ValueError if invalid."""
+    parts = [p.strip() for p in raw.split(",")]
+    if len(parts) != 4:
+        raise ValueError("bbox must be minLng,minLat,maxLng,maxLat")
+    min_lng, min_lat, max_lng, max_lat = (float(p) for p in parts)
+    if not (-180 <= min_lng <= 180 and -180 <= max_lng <= 180):
+        raise ValueError("bbox longitude out of range")
+    if not (-90 <= min_lat <= max_lat <= 90):
+        raise ValueError("bbox latitude out of range")
+    return min_lng, min_lat, max_lng, max_lat
+
+
+def bbox_q(bbox, lat="latitude", lng="longitude"):
+    """``Q`` for points inside ``bbox``; a box with minLng > maxLng wraps the antimeridian."""
+    min_lng, min_lat, max_lng, max_lat = bbox
+    q = Q(**{f"{lat}__gte": min_lat, f"{lat}__lte": max_lat})
+    if min_lng <= max_lng:
+        return q & Q(**{f"{lng}__gte": min_lng, f"{lng}__lte": max_lng})
+    return q & (Q(**{f"{lng}__gte": min_lng}) | Q(**{f"{lng}__lte": max_lng}))
+
+
+def sampled(queryset):
+    """Order ``queryset`` by a deterministic pseudo-random key.
+
+    Truncating the result with a limit then yields an evenly spread sample that
+    is identical across requests, so cached responses and map markers are stable.
+    """
+    key = Mod(F("id") * _SAMPLE_MULTIPLIER, _SAMPLE_MODULUS)
+    return queryset.annotate(sample_key=key).order_by("sample_key", "id")
+
+
+def sample_key(pk):
+    """The ``sampled`` ordering key of id ``pk``, computed in Python."""
+    return pk * _SAMPLE_MULTIPLIER % _SAMPLE_MODULUS
+
+
+# ---------- Geohash ----------
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+# ~5 m cells; enough for any prefix the bbox cover asks for
+GEOHASH_PRECISION = 9
+
+
+def geohash_encode(lat, lng, precision=GEOHASH_PRECISION):
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    chars = []
+    bits = value = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            value = value * 2 + (lng >= mid)
+            lng_lo, lng_hi = (mid, lng_hi) if lng >= mid else (lng_lo, mid)
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            value = value * 2 + (lat >= mid)
+            lat_lo, lat_hi = (mid, lat_hi) if lat >= mid else (lat_lo, mid)
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits = value = 0
+    return "".join(chars)
+
+
+def _cell_size(precision):
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lng_bits)
+
+
+def geohash_cover(bbox, max_cells=16):
+    """Geohash prefixes whose cells together cover ``bbox``, as few and as fine as fit."""
+    min_lng, min_lat, max_lng, max_lat = bbox
+    spans = [(min_lng, max_lng)] if min_lng <= max_lng else [(min_lng, 180.0), (-180.0, max_lng)]
+    cover = [""]
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        height, width = _cell_size(precision)
+        rows = range(
+            int((min_lat + 90) // height), int(min(max_lat + 90, 179.999999) // height) + 1
+        )
+        cells = []
+        for west, east in spans:
+            cols = range(int((west + 180) // width), int(min(east + 180, 359.999999) // width) + 1)
+            cells += [(r, c) for r in rows for c in cols]
+        if len(cells) > max_cells:
+            break
+        cover = sorted(
+            {
+                geohash_encode((r + 0.5) * height - 90, (c + 0.5) * width - 180, precision)
+                for r, c in cells
+            }
+        )
+    return cover
+
+
+def _prefix_end(prefix):
+    """The first geohash after every hash starting with ``prefix``; "" when none is.
+
+    Only base32 characters are compared, and digits and lowercase letters sort
+    the same under byte order and linguistic collations, so the range holds on
+    any database collation (a punctuation sentinel such as "~" does not).
+    """
+    while prefix:
+        last = _BASE32.index(prefix[-1])
+        if last + 1 < len(_BASE32):
+            return prefix[:-1] + _BASE32[last + 1]
+        prefix = prefix[:-1]
+    return ""
+
+
+def geohash_q(bbox, field="geohash", max_cells=16):
+    """``Q`` of index-friendly range lookups on ``field`` covering ``bbox``.
+
+    The cover is coarser than the box, so combine it with ``bbox_q`` for an exact match.
+    """
+    q = Q()
+    for prefix in geohash_cover(bbox, max_cells):
+        if not prefix:
+            return Q()
+        end = _prefix_end(prefix)
+        cell = Q(**{f"{field}__gte": prefix})
+        q |= cell & Q(**{f"{field}__lt": end}) if end else cell
+    return q
@@ -0,0 +1,512 @@
+import hashlib
+import json
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+
+import django
+from django.db import DatabaseError, IntegrityError, connection, connections, models, transaction
+
+from . import changes
+from .models import GEO_FIELDS, Product, ProductChange, Province
+from .signals import bulk_import
+from .versioning import deferred_bumps
+
+# Product fields a feed record can set (see ``normalize_item``)
+FEED_FIELDS = (
+    'category',
+    'rating',
+    'price',
+    'description',
+    'image_url',
+    'address',
+    'phone',
+    'latitude',
+    'longitude',
+)
+
+
+def coerce_item(item):
+    # If the item is a JSON string, try to parse it
+    if isinstance(item, str):
+        item = json.loads(item)
+    return item
+
+
+def normalize_item(item):
+    """Map one raw OTOP record to ``(province_name, product_name, defaults)``.
+
+    Raises on values that cannot be coerced, so callers can log the record.
+    """
+    prov_name = (
+        item.get('province')
+        or item.get('จังหวัด')
+        or item.get('province_name')
+        or item.get('อำเภอ')
+        or 'Unknown'
+    )
+
+    def pick(*keys, default=''):
+        for k in keys:
+            if k in item and item[k] not in (None, ''):
+                return item[k]
+        return default
+
+    raw_name = pick('name', 'title', 'ชื่อสินค้า OTOP', 'ชื่อสินค้า', default='Unnamed')
+    raw_address = pick('address', 'ที่อยู่', 'ชื่อสถานที่จัดจำหน่าย', default='')
+    raw_phone = pick('phone', 'เบอร์โทรศัพท์', default='')
+    raw_lat = pick('latitude', 'LAT', 'lat', default=None)
+    raw_lng = pick('longitude', 'LONG', 'lng', default=None)
+
+    phone = ''
+    if raw_phone is not None:
+        phone = str(raw_phone).strip()
+
+    try:
+        latitude = float(raw_lat) if raw_lat not in (None, '') else None
+    except Exception:
+        latitude = None
+    try:
+        longitude = float(raw_lng) if raw_lng not in (None, '') else None
+    except Exception:
+        longitude = None
+
+    incoming = {
+        'category': str(pick('category', 'ชนิด', default='')),
+        'rating': float(pick('rating', 'คะแนน', default=0.0) or 0.0),
+        'price': float(pick('price', 'ราคา', default=0.0) or 0.0),
+        'description': str(pick('description', 'รายละเอียด', default='')),
+        'image_url': str(pick('image_url', 'image', 'รูปภาพ', default='')),
+        'address': str(raw_address),
+        'phone': phone,
+        'latitude': latitude,
+        'longitude': longitude,
+    }
+
+    product_name = str(raw_name)
+    if not product_name:
+        raise ValueError('Missing product name')
+
+    defaults = {k: v for k, v in incoming.items() if v not in (None, '')}
+    return prov_name, product_name, defaults
+
+
+def content_hash(prov_name, product_name, defaults, previous=None):
+    """Stable digest of one normalized record.
+
+    Repeated ``(name, province)`` keys in a feed chain through ``previous``, so
+    the final digest describes the merged state the importer writes.
+    """
+    payload = json.dumps(
+        [previous, prov_name, product_name, defaults],
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def feed_hashes(records):
+    """Map ``(province_name, product_name)`` to the final content hash of a feed."""
+    hashes = {}
+    for item in records:
+        try:
+            item = coerce_item(item)
+            if not isinstance(item, dict):
+                continue
+            prov_name, product_name, defaults = normalize_item(item)
+            key = (prov_name, product_name)
+            hashes[key] = content_hash(prov_name, product_name, defaults, hashes.get(key))
+        except Exception:
+            # Invalid records are reported by the import pass itself
+            continue
+    return hashes
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def as_stored(field_name, value):
+    """``value`` the way the database hands it back for ``Product.<field_name>``."""
+    field = Product._meta.get_field(field_name)
+    value = field.to_python(value)
+    if isinstance(field, models.DecimalField) and value is not None:
+        value = value.quantize(Decimal(1).scaleb(-field.decimal_places))
+    return value
+
+
+def vanished_product_ids(hashes):
+    """Ids of products missing from the feed ``hashes`` was computed from.
+
+    Rows written by non-delta or older imports carry no hash but are pruned all the same.
+    """
+    seen = {(str(prov_name), product_name) for prov_name, product_name in hashes}
+    qs = Product.objects.values_list('id', 'province__name', 'name')
+    return [pk for pk, prov_name, name in qs.iterator() if (prov_name, name) not in seen]
+
+
+def resolve_provinces(names, province_ids, dry_run=False):
+    """Fill ``province_ids`` (name -> id) for ``names``, creating missing provinces."""
+    missing = {n for n in names if n not in province_ids}
+    if not missing:
+        return province_ids
+    for pk, name in Province.objects.filter(name__in=missing).values_list('id', 'name'):
+        province_ids[name] = pk
+        missing.discard(name)
+    for name in sorted(missing, key=str):
+        if dry_run:
+            province_ids[name] = None
+            continue
+        province = Province(name=name)
+        province.save()
+        province_ids[name] = province.pk
+    return province_ids
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.skipped = 0
+        self.errors = []
+
+    def merge(self, other):
+        self.created += other.created
+        self.updated += other.updated
+        self.unchanged += other.unchanged
+        self.skipped += other.skipped
+        self.errors.extend(other.errors)
+
+    def skip(self, idx, error_type, message, item):
+        self.skipped += 1
+        self.errors.append((idx, error_type, message, item))
+
+    def skip_exception(self, idx, exc, item):
+        if isinstance(exc, IntegrityError):
+            error_type = 'IntegrityError'
+        elif isinstance(exc, DatabaseError):
+            error_type = 'DatabaseError'
+        else:
+            error_type = type(exc).__name__
+        self.skip(idx, error_type, str(exc), item)
+
+
+def prepare(idx, item, result):
+    """Parse one raw record into a dict, logging it on ``result`` if invalid."""
+    try:
+        item = coerce_item(item)
+    except Exception as e:
+        result.skip(idx, 'invalid_json_string', str(e), item)
+        return None
+    if not isinstance(item, dict):
+        result.skip(idx, 'not_a_object', 'Item is not a JSON object', repr(item))
+        return None
+    return item
+
+
+class RowImporter:
+    """The original per-record ``update_or_create`` path."""
+
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.result = ImportResult()
+
+    def feed(self, idx, item):
+        item = prepare(idx, item, self.result)
+        if item is None:
+            return
+        try:
+            # Use a transaction for each item to avoid partial writes on error
+            with transaction.atomic():
+                self._import_one(item)
+        except Exception as e:
+            self.result.skip_exception(idx, e, item)
+
+    def _import_one(self, item):
+        prov_name, product_name, defaults = normalize_item(item)
+        province, _ = Province.objects.get_or_create(name=prov_name)
+        if self.dry_run:
+            exists = Product.objects.filter(name=product_name, province=province).exists()
+            if exists:
+                if defaults:
+                    self.result.updated += 1
+            else:
+                self.result.created += 1
+            return
+        # Rewritten rows no longer match the hash of the last delta import
+        fields = {**defaults, 'content_hash': ''} if defaults else defaults
+        _, created_flag = Product.objects.update_or_create(
+            name=product_name, province=province, defaults=fields
+        )
+        if created_flag:
+            self.result.created += 1
+        elif defaults:
+            self.result.updated += 1
+
+    def close(self):
+        return self.result
+
+
+class BatchImporter:
+    """Chunked importer built on ``bulk_create``/``bulk_update``.
+
+    Provinces are resolved into an in-memory name -> id map and existing
+    ``(name, province)`` keys are loaded with one query per chunk. Updates go
+    through native ``ON CONFLICT`` upserts where the backend supports them.
+    A chunk that fails to write is replayed through :class:`RowImporter` so
+    each bad record still lands in the error log with the same counts as the
+    row path.
+
+    With ``hashes`` (see :func:`feed_hashes`) the importer runs in delta mode:
+    products whose stored ``content_hash`` matches the feed are left untouched
+    and counted as unchanged.
+    """
+
+    def __init__(self, dry_run=False, batch_size=500, hashes=None):
+        self.dry_run = dry_run
+        self.batch_size = max(1, int(batch_size))
+        self.hashes = hashes
+        self._touched = set()
+        # Product ids already in the change log for this run
+        self._logged = set()
+        self.result = ImportResult()
+        self.province_ids = {}
+        self._pending = []
+
+    def feed(self, idx, item):
+        item = prepare(idx, item, self.result)
+        if item is None:
+            return
+        try:
+            prov_name, product_name, defaults = normalize_item(item)
+        except Exception as e:
+            self.result.skip_exception(idx, e, item)
+            return
+        self._pending.append((idx, item, prov_name, product_name, defaults))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def close(self):
+        self.flush()
+        return self.result
+
+    def flush(self):
+        rows, self._pending = self._pending, []
+        if not rows:
+            return
+        try:
+            with transaction.atomic():
+                counts = self._write(rows)
+        except Exception:
+            self._replay(rows)
+            return
+        self.result.created += counts[0]
+        self.result.updated += counts[1]
+        self.result.unchanged += counts[2]
+
+    def _replay(self, rows):
+        # Drop ids cached inside the rolled back transaction
+        self.province_ids = {}
+        fallback = RowImporter(dry_run=self.dry_run)
+        fallback.result = self.result
+        for idx, item, *_ in rows:
+            fallback.feed(idx, item)
+
+    def _resolve_provinces(self, names):
+        resolve_provinces(names, self.province_ids, dry_run=self.dry_run)
+
+    def _existing_ids(self, keys):
+        pids = {pid for _, pid in keys if pid is not None}
+        if not pids:
+            return {}
+        names = {name for name, _ in keys}
+        qs = Product.objects.filter(province_id__in=pids, name__in=names)
+        rows = qs.values_list('name', 'province_id', 'id', 'content_hash', *FEED_FIELDS)
+        return {
+            (name, pid): (pk, digest, dict(zip(FEED_FIELDS, values)))
+            for name, pid, pk, digest, *values in rows
+        }
+
+    def _write(self, rows):
+        self._resolve_provinces({r[2] for r in rows})
+        existing = self._existing_ids(
+            {
+                (product_name, self.province_ids[prov_name])
+                for _, _, prov_name, product_name, _ in rows
+            }
+        )
+
+        created = updated = unchanged = 0
+        creates = {}
+        updates = {}
+        for _, _, prov_name, name, defaults in rows:
+            key = (name, self.province_ids[prov_name])
+            if self.hashes is None:
+                digest = ''
+            else:
+                digest = self.hashes.get((prov_name, name), '')
+                # A key written earlier in this run already carries its final hash, but
+                # later duplicates still have fields to merge
+                if (
+                    key in existing
+                    and digest
+                    and existing[key][1] == digest
+                    and key not in self._touched
+                ):
+                    unchanged += 1
+                    continue
+                self._touched.add(key)
+            if key in creates:
+                if defaults:
+                    updated += 1
+                    creates[key].update(defaults)
+            elif key in existing:
+                if defaults:
+                    updated += 1
+                    updates.setdefault(key, {}).update(defaults)
+                # Keep the stored hash in step with what this run writes
+                if defaults or digest:
+                    updates.setdefault(key, {})['content_hash'] = digest
+            else:
+                created += 1
+                creates[key] = {**defaults, 'content_hash': digest}
+
+        if not self.dry_run:
+            objs = []
+            for (name, pid), fields in creates.items():
+                obj = Product(name=name, province_id=pid, **fields)
+                obj.set_geo_fields()
+                objs.append(obj)
+            Product.objects.bulk_create(objs, batch_size=self.batch_size)
+            self._write_updates(updates, existing)
+            self._record_changes(objs, updates, existing)
+        return created, updated, unchanged
+
+    def _record_changes(self, objs, updates, existing):
+        created_ids = [obj.pk for obj in objs]
+        if None in created_ids:
+            # The backend could not return ids from bulk_create
+            keys = {(obj.name, obj.province_id) for obj in objs}
+            created_ids = [pk for pk, *_ in self._existing_ids(keys).values()]
+        changes.record(created_ids, ProductChange.INSERTED)
+        self._logged.update(created_ids)
+        # Rows rewritten with the values they already hold (a non-delta re-import, a key
+        # repeated in a later chunk) are not changes clients need to fetch again
+        updated_ids = []
+        for key, fields in updates.items():
+            pk, _, stored = existing[key]
+            if pk in self._logged:
+                continue
+            if any(
+                as_stored(name, value) != stored[name]
+                for name, value in fields.items()
+                if name != 'content_hash'
+            ):
+                updated_ids.append(pk)
+        changes.record(updated_ids, ProductChange.UPDATED)
+        self._logged.update(updated_ids)
+
+    def _write_updates(self, updates, existing):
+        # Only the fields present in a record may be overwritten, so group rows by field set
+        groups = {}
+        for (name, pid), fields in updates.items():
+            pk, _, stored = existing[(name, pid)]
+            obj = Product(pk=pk, name=name, province_id=pid, **fields)
+            if 'latitude' in fields or 'longitude' in fields:
+                # A record may carry only one coordinate; derive from the merged pair
+                obj.latitude = fields.get('latitude', stored['latitude'])
+                obj.longitude = fields.get('longitude', stored['longitude'])
+                obj.set_geo_fields()
+                fields = {**fields, **dict.fromkeys(GEO_FIELDS)}
+            groups.setdefault(tuple(sorted(fields)), []).append(obj)
+        native = connection.features.supports_update_conflicts_with_target
+        for fields, objs in groups.items():
+            if native:
+                # INSERT ... ON CONFLICT (name, province) DO UPDATE
+                Product.objects.bulk_create(
+                    objs,
+                    batch_size=self.batch_size,
+                    update_conflicts=True,
+                    unique_fields=['name', 'province'],
+                    update_fields=list(fields),
+                )
+            else:
+                Product.objects.bulk_update(objs, fields, batch_size=self.batch_size)
+
+
+# ---------- Parallel import ----------
+def partition_of(prov_name, workers):
+    return zlib.crc32(str(prov_name).encode('utf-8')) % workers
+
+
+def write_partitions(records, directory, workers):
+    """Spill records to one JSON Lines file per province partition.
+
+    ``UniqueConstraint(name, province)`` makes partitions independent, so each
+    file can be imported by its own worker. Records that cannot be normalized go
+    to partition 0, where the worker logs them under their original index.
+    Returns ``(paths, province_names)``.
+    """
+    paths = [os.path.join(directory, f'partition-{i}.jsonl') for i in range(workers)]
+    files = [open(path, 'w', encoding='utf-8') for path in paths]
+    provinces = set()
+    try:
+        for idx, item in enumerate(records, start=1):
+            part = 0
+            try:
+                parsed = coerce_item(item)
+                if isinstance(parsed, dict):
+                    prov_name = normalize_item(parsed)[0]
+                    part = partition_of(prov_name, workers)
+                    provinces.add(prov_name)
+            except Exception:
+                pass
+            files[part].write(json.dumps([idx, item], ensure_ascii=False))
+            files[part].write('\n')
+    finally:
+        for f in files:
+            f.close()
+    return paths, provinces
+
+
+def _init_worker():
+    django.setup()
+
+
+def import_partition(path, dry_run=False, batch_size=500, hashes=None):
+    importer = BatchImporter(dry_run=dry_run, batch_size=batch_size, hashes=hashes)
+    try:
+        # The parent bumps the data version and updates the search index and
+        # province counters once all partitions are in
+        with deferred_bumps(discard=True), bulk_import():
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    idx, item = json.loads(line)
+                    importer.feed(idx, item)
+            return importer.close()
+    finally:
+        connections.close_all()
+
+
+def import_parallel(paths, workers, dry_run=False, batch_size=500, hashes=None):
+    """Import partition files in a process pool, one DB connection per worker."""
+    # Forked children must not share the parent's sockets
+    connections.close_all()
+    result = ImportResult()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = []
+        for i, path in enumerate(paths):
+            part_hashes = None
+            if hashes is not None:
+                part_hashes = {k: v for k, v in hashes.items() if partition_of(k[0], workers) == i}
+            futures.append(pool.submit(import_partition, path, dry_run, batch_size, part_hashes))
+        for future in futures:
+            result.merge(future.result())
+    return result
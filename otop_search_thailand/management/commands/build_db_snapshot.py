@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Write a migrated, indexed and vacuumed SQLite snapshot of the catalogue for cold starts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', '-o', help='Snapshot file (defaults to settings.OTOP_DB_SNAPSHOT)'
+        )
+        parser.add_argument(
+            '--seed', metavar='PATH', help='Import this OTOP JSON file before writing the snapshot'
+        )
+
+    def handle(self, *args, **options):
+        import os
+
+        from django.core.management import call_command
+        from django.db import connection
+
+        from otop_search_thailand.dbsnapshot import build_db_snapshot, snapshot_path
+
+        # Deploys configured with DATABASE_URL have no SQLite catalogue to ship
+        if connection.vendor != 'sqlite':
+            self.stdout.write(
+                f'Skipping the database snapshot: the default database is {connection.vendor}.'
+            )
+            return
+
+        if options.get('seed'):
+            call_command('import_otop_json', '-i', options['seed'], stdout=self.stdout)
+        path = options.get('output') or snapshot_path()
+        try:
+            version = build_db_snapshot(path)
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Wrote {path} ({os.path.getsize(path)} bytes) for data version {version}'
+            )
+        )
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Write pre-serialized (and pre-compressed) API snapshots for the current data version'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', '-o', help='Snapshot directory (defaults to settings.OTOP_SNAPSHOT_DIR)'
+        )
+        parser.add_argument(
+            '--sidecars',
+            action='store_true',
+            help='Also write gzip/brotli sidecars of OTOP_JSON_PATH for /api/otop.json',
+        )
+
+    def handle(self, *args, **options):
+        import os
+
+        from django.conf import settings
+
+        from otop_search_thailand.downloads import write_sidecars
+        from otop_search_thailand.snapshots import build_snapshots, snapshot_dir
+
+        directory = options.get('output') or snapshot_dir()
+        try:
+            manifest = build_snapshots(directory)
+        except ValueError as e:
+            raise CommandError(str(e))
+        for name, entry in manifest['snapshots'].items():
+            variants = ', '.join(sorted(entry['files']))
+            self.stdout.write(f'{name}: {entry["size"]} bytes ({variants})')
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Built snapshots for data version {manifest["version"]} in {directory}'
+            )
+        )
+
+        raw = getattr(settings, 'OTOP_JSON_PATH', '')
+        if options.get('sidecars') and raw and os.path.exists(raw):
+            try:
+                for path in write_sidecars(raw):
+                    self.stdout.write(f'{path}: {os.path.getsize(path)} bytes')
+            except OSError as e:
+                self.stderr.write(f'Could not write sidecars for {raw}: {e}')
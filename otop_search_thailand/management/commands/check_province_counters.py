@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Compare Province.product_count / category_counts with the product table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Rewrite the drifted counters')
+
+    def handle(self, *args, **options):
+        from otop_search_thailand.counters import find_drift, recount_provinces
+
+        drift = find_drift()
+        for province, total, categories in drift:
+            self.stdout.write(
+                f'{province.name}: stored {province.product_count} '
+                f'{province.category_counts}, actual {total} {categories}'
+            )
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('Province counters are consistent.'))
+        elif options.get('fix'):
+            fixed = recount_provinces([province.id for province, _, _ in drift])
+            self.stdout.write(self.style.SUCCESS(f'Fixed {len(fixed)} provinces.'))
+        else:
+            raise CommandError(f'{len(drift)} provinces have drifted counters; rerun with --fix')
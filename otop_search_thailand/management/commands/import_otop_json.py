@@ -1,8 +1,10 @@
 import json
 import os
+import tempfile
 
 from django.core.management.base import BaseCommand, CommandError
-from django.db import DatabaseError, IntegrityError, transaction
+from django.db import connection, transaction
+from django.utils import timezone
 
 
 class Command(BaseCommand):
@@ -10,149 +12,168 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument('--input', '-i', help='Input JSON path', default='data/otop.json')
+        parser.add_argument(
+            '--format',
+            choices=('auto', 'json', 'jsonl'),
+            default='auto',
+            help='Input format; auto picks JSON Lines for .jsonl/.ndjson files',
+        )
         parser.add_argument(
             '--dry-run', action='store_true', help='Simulate import without writing to the database'
         )
+        parser.add_argument(
+            '--mode',
+            choices=('batch', 'row'),
+            default='batch',
+            help='batch: chunked bulk_create/bulk_update (default); row: per-item update_or_create',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500, help='Records per write chunk in batch mode'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Import province partitions in N processes (Postgres; SQLite runs serially)',
+        )
+        parser.add_argument(
+            '--delta',
+            action='store_true',
+            help='Only write records whose content hash changed since the last delta import',
+        )
+        parser.add_argument(
+            '--prune',
+            action='store_true',
+            help='With --delta, delete products missing from the feed',
+        )
+        parser.add_argument(
+            '--build-snapshots',
+            action='store_true',
+            help='Rebuild the pre-serialized API snapshots after importing',
+        )
+        parser.add_argument(
+            '--force', action='store_true', help='Re-import even if the source file is unchanged'
+        )
 
     def handle(self, *args, **options):
+        from otop_search_thailand.signals import bulk_import
+        from otop_search_thailand.stats import rebuild_stats
+        from otop_search_thailand.versioning import deferred_bumps, get_data_version
+
+        version = get_data_version(fresh=True)
+        # Save signals and bulk writes collapse into one catalogue data version bump,
+        # one search index update and one province recount
+        with deferred_bumps(), bulk_import():
+            self._import(options)
+        if get_data_version(fresh=True) != version:
+            rebuild_stats()
+
+        if options.get('build_snapshots') and not options.get('dry_run'):
+            from otop_search_thailand.snapshots import build_snapshots
+
+            try:
+                manifest = build_snapshots()
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write(f'Built API snapshots for data version {manifest["version"]}.')
+
+    def _import(self, options):
         in_path = options.get('input')
         dry_run = bool(options.get('dry_run'))
+        delta = bool(options.get('delta'))
+        fmt = options.get('format')
+        batch_size = options.get('batch_size') or 500
 
         if not in_path or not os.path.exists(in_path):
             raise CommandError(f'Input file not found: {in_path}')
-
-        from otop_search_thailand.models import Product, Province
-
-        with open(in_path, 'r', encoding='utf-8') as f:
-            raw = json.load(f)
-
-        # Normalize various possible JSON shapes to a list of dicts
-        data = raw
-        if isinstance(raw, dict):
-            for k in ('items', 'products', 'data', 'results'):
-                if k in raw and isinstance(raw[k], list):
-                    data = raw[k]
-                    break
+        if delta and options.get('mode') == 'row':
+            raise CommandError('--delta requires --mode batch')
+
+        from otop_search_thailand import changes
+        from otop_search_thailand.counters import recount_provinces
+        from otop_search_thailand.importing import (
+            BatchImporter,
+            ImportResult,
+            RowImporter,
+            feed_hashes,
+            file_sha256,
+            vanished_product_ids,
+        )
+        from otop_search_thailand.models import ImportManifest, Product
+        from otop_search_thailand.readers import iter_records
+        from otop_search_thailand.search import remove_products, update_products
+        from otop_search_thailand.versioning import bump_data_version
+
+        started_at = timezone.now()
+        source_sha256 = file_sha256(in_path)
+        hashes = None
+        source_unchanged = False
+        if delta:
+            last = ImportManifest.objects.first()
+            if last and last.source_sha256 == source_sha256 and not options.get('force'):
+                source_unchanged = True
+                since = f'Source unchanged since import at {last.finished_at:%Y-%m-%d %H:%M}; '
+                # The last import may not have pruned, so --prune still has work to do
+                if not options.get('prune'):
+                    self.stdout.write(self.style.SUCCESS(since + 'nothing to do.'))
+                    return
+                self.stdout.write(since + 'only pruning.')
+            # First pass: final content hash per (province, name), bounded by the key count
+            try:
+                hashes = feed_hashes(iter_records(in_path, fmt=fmt))
+            except ValueError as e:
+                raise CommandError(f'Could not read {in_path}: {e}')
+
+        workers = max(1, options.get('workers') or 1)
+        if workers > 1 and options.get('mode') == 'row':
+            raise CommandError('--workers requires --mode batch')
+        if workers > 1 and connection.vendor == 'sqlite':
+            self.stdout.write(
+                self.style.WARNING('SQLite allows a single writer; importing serially.')
+            )
+            workers = 1
+
+        log_dir = os.path.dirname(in_path) or '.'
+        os.makedirs(log_dir, exist_ok=True)
+        err_log_path = os.path.join(log_dir, 'import_errors.log')
+
+        # Records are streamed, so memory is bounded by --batch-size rather than the file
+        try:
+            if source_unchanged:
+                result = ImportResult()
+            elif workers > 1:
+                result = self._import_parallel(in_path, fmt, workers, dry_run, batch_size, hashes)
             else:
-                for v in raw.values():
-                    if isinstance(v, list):
-                        data = v
-                        break
+                if options.get('mode') == 'row':
+                    importer = RowImporter(dry_run=dry_run)
                 else:
-                    data = [raw]
-
-        if not isinstance(data, list):
-            raise CommandError('Unsupported JSON structure: expected list or object')
-
-        created = 0
-        updated = 0
-        skipped = 0
-        errors_log = []
-
-        os.makedirs(os.path.dirname(in_path), exist_ok=True)
-        err_log_path = os.path.join(os.path.dirname(in_path), 'import_errors.log')
-
-        for idx, item in enumerate(data, start=1):
-            # If the item is a JSON string, try to parse it
-            if isinstance(item, str):
-                try:
-                    item = json.loads(item)
-                except Exception as e:
-                    skipped += 1
-                    errors_log.append((idx, 'invalid_json_string', str(e), item))
-                    continue
-
-            if not isinstance(item, dict):
-                skipped += 1
-                errors_log.append((idx, 'not_a_object', 'Item is not a JSON object', repr(item)))
-                continue
-
-            try:
-                # Use a transaction for each item to avoid partial writes on error
-                with transaction.atomic():
-                    prov_name = (
-                        item.get('province')
-                        or item.get('จังหวัด')
-                        or item.get('province_name')
-                        or item.get('อำเภอ')
-                        or 'Unknown'
-                    )
-                    province, _ = Province.objects.get_or_create(name=prov_name)
-
-                    def pick(*keys, default=''):
-                        for k in keys:
-                            if k in item and item[k] not in (None, ''):
-                                return item[k]
-                        return default
-
-                    raw_name = pick('name', 'title', 'ชื่อสินค้า OTOP', 'ชื่อสินค้า', default='Unnamed')
-                    raw_address = pick('address', 'ที่อยู่', 'ชื่อสถานที่จัดจำหน่าย', default='')
-                    raw_phone = pick('phone', 'เบอร์โทรศัพท์', default='')
-                    raw_lat = pick('latitude', 'LAT', 'lat', default=None)
-                    raw_lng = pick('longitude', 'LONG', 'lng', default=None)
-
-                    phone = ''
-                    if raw_phone is not None:
-                        phone = str(raw_phone).strip()
-
-                    try:
-                        latitude = float(raw_lat) if raw_lat not in (None, '') else None
-                    except Exception:
-                        latitude = None
-                    try:
-                        longitude = float(raw_lng) if raw_lng not in (None, '') else None
-                    except Exception:
-                        longitude = None
-
-                    incoming = {
-                        'category': str(pick('category', 'ชนิด', default='')),
-                        'rating': float(pick('rating', 'คะแนน', default=0.0) or 0.0),
-                        'price': float(pick('price', 'ราคา', default=0.0) or 0.0),
-                        'description': str(pick('description', 'รายละเอียด', default='')),
-                        'image_url': str(pick('image_url', 'image', 'รูปภาพ', default='')),
-                        'address': str(raw_address),
-                        'phone': phone,
-                        'latitude': latitude,
-                        'longitude': longitude,
-                    }
-
-                    product_name = str(raw_name)
-                    if not product_name:
-                        raise ValueError('Missing product name')
-
-                    defaults = {k: v for k, v in incoming.items() if v not in (None, '')}
-
-                    if dry_run:
-                        exists = Product.objects.filter(
-                            name=product_name, province=province
-                        ).exists()
-                        if exists:
-                            if defaults:
-                                updated += 1
-                        else:
-                            created += 1
-                    else:
-                        obj, created_flag = Product.objects.update_or_create(
-                            name=product_name,
-                            province=province,
-                            defaults=defaults,
-                        )
-
-                        if created_flag:
-                            created += 1
-                        else:
-                            if defaults:
-                                updated += 1
-
-            except IntegrityError as e:
-                skipped += 1
-                errors_log.append((idx, 'IntegrityError', str(e), item))
-            except DatabaseError as e:
-                skipped += 1
-                errors_log.append((idx, 'DatabaseError', str(e), item))
-            except Exception as e:
-                skipped += 1
-                errors_log.append((idx, type(e).__name__, str(e), item))
+                    importer = BatchImporter(dry_run=dry_run, batch_size=batch_size, hashes=hashes)
+                for idx, item in enumerate(iter_records(in_path, fmt=fmt), start=1):
+                    importer.feed(idx, item)
+                result = importer.close()
+        except ValueError as e:
+            raise CommandError(f'Could not read {in_path}: {e}')
+
+        vanished = []
+        deleted = 0
+        if delta:
+            vanished = vanished_product_ids(hashes)
+            if options.get('prune') and not dry_run:
+                for start in range(0, len(vanished), batch_size):
+                    with transaction.atomic():
+                        deleted += Product.objects.filter(
+                            id__in=vanished[start : start + batch_size]
+                        ).delete()[0]
+
+        if not dry_run and (result.created or result.updated or deleted):
+            # Every write above is in the change log, unstamped until the bump
+            changed, removed = changes.unstamped()
+            bump_data_version()
+            update_products(changed)
+            remove_products(removed)
+            recount_provinces()
+
+        errors_log = sorted(result.errors, key=lambda rec: rec[0])
 
         # Write errors to log file for inspection
         if errors_log:
@@ -181,6 +202,41 @@ class Command(BaseCommand):
 
         self.stdout.write(
             self.style.SUCCESS(
-                f'Imported {created} products. Updated {updated}. Skipped {skipped} invalid entries.'
+                f'Imported {result.created} products. Updated {result.updated}. '
+                f'Skipped {result.skipped} invalid entries.'
             )
         )
+        if delta:
+            self.stdout.write(
+                f'Delta: {result.unchanged} unchanged, {len(vanished)} vanished, {deleted} deleted.'
+            )
+
+        if not dry_run:
+            ImportManifest.objects.create(
+                source=str(in_path)[:500],
+                source_sha256=source_sha256,
+                delta=delta,
+                created=result.created,
+                updated=result.updated,
+                unchanged=result.unchanged,
+                vanished=len(vanished),
+                deleted=deleted,
+                skipped=result.skipped,
+                started_at=started_at,
+            )
+
+    def _import_parallel(self, in_path, fmt, workers, dry_run, batch_size, hashes):
+        from otop_search_thailand.importing import (
+            import_parallel,
+            resolve_provinces,
+            write_partitions,
+        )
+        from otop_search_thailand.readers import iter_records
+
+        with tempfile.TemporaryDirectory(prefix='otop-import-') as tmp:
+            paths, provinces = write_partitions(iter_records(in_path, fmt=fmt), tmp, workers)
+            # Create provinces up front so workers never race on slug generation
+            resolve_provinces(provinces, {}, dry_run=dry_run)
+            result = import_parallel(paths, workers, dry_run, batch_size, hashes)
+        self.stdout.write(f'Imported {len(paths)} province partitions with {workers} workers.')
+        return result
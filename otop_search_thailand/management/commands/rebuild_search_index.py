@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the product search index from the database'
+
+    def handle(self, *args, **options):
+        from otop_search_thailand.search import get_backend
+
+        backend = get_backend()
+        backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt search index ({backend.name} backend)'))
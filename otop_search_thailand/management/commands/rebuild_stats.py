@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Recompute the materialized home page statistics from scratch'
+
+    def handle(self, *args, **options):
+        from otop_search_thailand.stats import rebuild_stats
+
+        stats = rebuild_stats()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Rebuilt stats for data version {stats.version}: '
+                f'{stats.total_products} products in {stats.total_provinces} provinces'
+            )
+        )
@@ -0,0 +1,271 @@
+"""Per-request timings, exposed as ``Server-Timing`` and Prometheus histograms.
+
+``MetricsMiddleware`` times each request, counts its database queries (through
+a connection execute wrapper) and measures the response size. Serialization is
+template rendering, timed by the ``TimedTemplates`` engine, or streaming the
+body. JSON responses are encoded inside their views and count as ``app`` time.
+Streamed bodies, the big feeds, are serialized after the view returns, so their
+serialization time, late queries and size are recorded when the stream ends;
+their ``Server-Timing`` header, sent first, has no ``ser`` or ``bytes`` entry.
+
+Histograms are per process: each worker answers ``/metrics`` with its own
+counts, which Prometheus sums across scrape targets. They reveal per-route
+traffic, so ``/metrics`` needs ``OTOP_METRICS_TOKEN`` (see ``authorized``).
+"""
+
+import bisect
+import hmac
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.http import FileResponse
+from django.template.backends.django import DjangoTemplates, Template
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (1024, 10240, 102400, 1048576, 10485760, 104857600)
+
+# name: (help, buckets)
+HISTOGRAMS = {
+    "otop_request_duration_seconds": ("Wall time per request", DURATION_BUCKETS),
+    "otop_db_queries": ("Database queries per request", QUERY_BUCKETS),
+    "otop_db_duration_seconds": ("Database time per request", DURATION_BUCKETS),
+    "otop_serialize_duration_seconds": (
+        "Time spent rendering templates or streaming the body",
+        DURATION_BUCKETS,
+    ),
+    "otop_response_bytes": ("Response body size", SIZE_BUCKETS),
+}
+
+
+def enabled():
+    return getattr(settings, "OTOP_METRICS", True)
+
+
+def authorized(request):
+    """Whether ``request`` may read ``/metrics``.
+
+    Scrapers send ``Authorization: Bearer <OTOP_METRICS_TOKEN>``; without a
+    token configured the endpoint is only served with ``DEBUG`` on.
+    """
+    token = getattr(settings, "OTOP_METRICS_TOKEN", "")
+    if not token:
+        return settings.DEBUG
+    scheme, _, given = request.headers.get("Authorization", "").partition(" ")
+    return scheme.lower() == "bearer" and hmac.compare_digest(given.strip(), token)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Registry:
+    """Histograms by name and view, plus request counts by view and status."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._requests = {}
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+            self._requests.clear()
+
+    def count(self, view, status):
+        with self._lock:
+            key = (view, status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+
+    def observe(self, view, **values):
+        with self._lock:
+            for name, value in values.items():
+                histogram = self._histograms.get((name, view))
+                if histogram is None:
+                    histogram = Histogram(HISTOGRAMS[name][1])
+                    self._histograms[(name, view)] = histogram
+                histogram.observe(value)
+
+    def render(self):
+        """The Prometheus text exposition format."""
+        with self._lock:
+            histograms = {key: (list(h.counts), h.sum) for key, h in self._histograms.items()}
+            requests = dict(self._requests)
+        lines = [
+            "# HELP otop_requests_total Requests by view and status",
+            "# TYPE otop_requests_total counter",
+        ]
+        for (view, status), count in sorted(requests.items()):
+            lines.append(f'otop_requests_total{{view="{view}",status="{status}"}} {count}')
+        for name, (help_text, buckets) in HISTOGRAMS.items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+            for (key, view), (counts, total) in sorted(histograms.items()):
+                if key != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip((*buckets, "+Inf"), counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_sum{{view="{view}"}} {total:.6f}')
+                lines.append(f'{name}_count{{view="{view}"}} {cumulative}')
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+# The timer of the request this thread is handling, for ``TimedTemplates``
+_active = threading.local()
+
+
+class RequestTimer:
+    """Execute wrapper counting the queries of one request and the time they take.
+
+    ``serializing`` collects template rendering time, less the queries run
+    while rendering.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.duration = 0.0
+        self.serializing = 0.0
+        self._connections = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.queries += 1
+
+    def install(self):
+        self._connections = connections.all()
+        for connection in self._connections:
+            connection.execute_wrappers.append(self)
+
+        _active.timer = self
+
+    def uninstall(self):
+        for connection in self._connections:
+            if self in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self)
+        self._connections = []
+        if getattr(_active, "timer", None) is self:
+            _active.timer = None
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        timer = getattr(_active, "timer", None)
+        if timer is None:
+            return super().render(context, request)
+        start, queried = time.perf_counter(), timer.duration
+        try:
+            return super().render(context, request)
+        finally:
+            timer.serializing += time.perf_counter() - start - (timer.duration - queried)
+
+
+class TimedTemplates(DjangoTemplates):
+    """``DjangoTemplates`` whose renders count as the request's serialization time."""
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code).template, self)
+
+
+def _view_name(request):
+    match = getattr(request, "resolver_match", None)
+    # Unmatched paths share one label, so scanners cannot inflate the series
+    return match.view_name if match and match.view_name else "unmatched"
+
+
+def _server_timing(total, timer, size=None):
+    entries = [
+        f"total;dur={total * 1000:.1f}",
+        f'db;dur={timer.duration * 1000:.1f};desc="{timer.queries} queries"',
+    ]
+    if size is not None:
+        entries += [f"ser;dur={timer.serializing * 1000:.1f}", f'bytes;desc="{size}"']
+    entries.append(f"app;dur={(total - timer.duration - timer.serializing) * 1000:.1f}")
+    return ", ".join(entries)
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not enabled():
+            return self.get_response(request)
+        timer = RequestTimer()
+        timer.install()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            timer.uninstall()
+            raise
+        elapsed = time.perf_counter() - start
+        view = _view_name(request)
+        registry.count(view, response.status_code)
+
+        if response.streaming and not isinstance(response, FileResponse):
+            response["Server-Timing"] = _server_timing(elapsed, timer)
+            # The stream is consumed after this returns, on its own thread-local state
+            _active.timer = None
+            response.streaming_content = self._measure_stream(
+                response.streaming_content, view, timer, start
+            )
+            return response
+        timer.uninstall()
+        if isinstance(response, FileResponse):
+            size = int(response.get("Content-Length") or 0)
+        else:
+            size = len(response.content)
+        response["Server-Timing"] = _server_timing(elapsed, timer, size)
+        registry.observe(
+            view,
+            otop_request_duration_seconds=elapsed,
+            otop_db_queries=timer.queries,
+            otop_db_duration_seconds=timer.duration,
+            otop_serialize_duration_seconds=timer.serializing,
+            otop_response_bytes=size,
+        )
+        return response
+
+    def _measure_stream(self, content, view, timer, start):
+        size = 0
+        serializing = 0.0
+        try:
+            chunks = iter(content)
+            while True:
+                begin = time.perf_counter()
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    break
+                finally:
+                    serializing += time.perf_counter() - begin
+                size += len(chunk)
+                yield chunk
+        finally:
+            timer.uninstall()
+            registry.observe(
+                view,
+                otop_request_duration_seconds=time.perf_counter() - start,
+                otop_db_queries=timer.queries,
+                otop_db_duration_seconds=timer.duration,
+                otop_serialize_duration_seconds=serializing,
+                otop_response_bytes=size,
+            )
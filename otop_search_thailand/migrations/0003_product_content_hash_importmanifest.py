@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('otop_search_thailand', '0002_alter_product_id_alter_province_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportManifest',
+            fields=[
+                (
+                    'id',
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name='ID'
+                    ),
+                ),
+                ('source', models.CharField(max_length=500)),
+                ('source_sha256', models.CharField(db_index=True, max_length=64)),
+                ('delta', models.BooleanField(default=False)),
+                ('created', models.PositiveIntegerField(default=0)),
+                ('updated', models.PositiveIntegerField(default=0)),
+                ('unchanged', models.PositiveIntegerField(default=0)),
+                ('vanished', models.PositiveIntegerField(default=0)),
+                ('deleted', models.PositiveIntegerField(default=0)),
+                ('skipped', models.PositiveIntegerField(default=0)),
+                ('started_at', models.DateTimeField()),
+                ('finished_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-finished_at', '-id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=40),
+        ),
+    ]
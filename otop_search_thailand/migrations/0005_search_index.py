@@ -0,0 +1,62 @@
+from django.db import DatabaseError, migrations, transaction
+
+FTS_TABLE = 'otop_product_fts'
+TRGM_INDEXES = (
+    ('otop_product_name_trgm', 'otop_search_thailand_product', 'name'),
+    ('otop_product_category_trgm', 'otop_search_thailand_product', 'category'),
+    ('otop_product_description_trgm', 'otop_search_thailand_product', 'description'),
+    ('otop_province_name_trgm', 'otop_search_thailand_province', 'name'),
+)
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        try:
+            with transaction.atomic(using=connection.alias):
+                schema_editor.execute(
+                    f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+                    "name, province, category, description, tokenize='trigram')"
+                )
+                schema_editor.execute(
+                    f'INSERT INTO {FTS_TABLE} (rowid, name, province, category, description) '
+                    'SELECT p.id, p.name, r.name, p.category, p.description '
+                    'FROM otop_search_thailand_product p '
+                    'JOIN otop_search_thailand_province r ON r.id = p.province_id'
+                )
+        except DatabaseError:
+            # SQLite older than 3.34 has no trigram tokenizer; search uses the memory backend
+            pass
+    elif connection.vendor == 'postgresql':
+        try:
+            with transaction.atomic(using=connection.alias):
+                schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+                # Matches the UPPER(col::text) LIKE that icontains compiles to
+                for name, table, column in TRGM_INDEXES:
+                    schema_editor.execute(
+                        f'CREATE INDEX IF NOT EXISTS {name} ON {table} '
+                        f'USING gin ((UPPER({column}::text)) gin_trgm_ops)'
+                    )
+        except DatabaseError:
+            # No permission to create the extension; icontains still works unindexed
+            pass
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+    elif connection.vendor == 'postgresql':
+        for name, _, _ in TRGM_INDEXES:
+            schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('otop_search_thailand', '0004_catalogueversion'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
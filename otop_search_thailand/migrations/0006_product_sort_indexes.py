@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('otop_search_thailand', '0005_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'id'], name='otop_search_categor_f493b5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['rating', 'id'], name='otop_search_rating_ec3ae5_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('otop_search_thailand', '0006_product_sort_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogueStats',
+            fields=[
+                (
+                    'id',
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name='ID'
+                    ),
+                ),
+                ('version', models.PositiveBigIntegerField(default=0)),
+                ('total_products', models.PositiveIntegerField(default=0)),
+                ('total_provinces', models.PositiveIntegerField(default=0)),
+                ('top_categories', models.JSONField(default=list)),
+                ('province_counts', models.JSONField(default=list)),
+                ('top_products', models.JSONField(default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'catalogue stats',
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:30
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_counters(apps, schema_editor):
+    Product = apps.get_model('otop_search_thailand', 'Product')
+    Province = apps.get_model('otop_search_thailand', 'Province')
+    counts = {}
+    rows = Product.objects.order_by().values_list('province_id', 'category').annotate(c=Count('id'))
+    for province_id, category, count in rows:
+        counts.setdefault(province_id, {})[category] = count
+    provinces = list(Province.objects.all())
+    for province in provinces:
+        province.category_counts = counts.get(province.id, {})
+        province.product_count = sum(province.category_counts.values())
+    Province.objects.bulk_update(provinces, ['product_count', 'category_counts'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('otop_search_thailand', '0007_cataloguestats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='province',
+            name='category_counts',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='province',
+            name='product_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
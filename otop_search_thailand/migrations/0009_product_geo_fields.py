@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:32
+
+from django.db import migrations, models
+
+from otop_search_thailand.geo import geohash_encode
+
+
+def fill_geo_fields(apps, schema_editor):
+    Product = apps.get_model('otop_search_thailand', 'Product')
+    located = Product.objects.filter(latitude__isnull=False, longitude__isnull=False)
+    batch = []
+    for product in located.only('id', 'latitude', 'longitude').iterator(chunk_size=2000):
+        product.lat = round(float(product.latitude), 6)
+        product.lng = round(float(product.longitude), 6)
+        product.geohash = geohash_encode(product.lat, product.lng)
+        batch.append(product)
+        if len(batch) >= 2000:
+            Product.objects.bulk_update(batch, ['lat', 'lng', 'geohash'])
+            batch = []
+    Product.objects.bulk_update(batch, ['lat', 'lng', 'geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('otop_search_thailand', '0008_province_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='geohash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=12),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='lat',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='lng',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['geohash'], name='otop_search_geohash_083184_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['lng', 'lat'], name='otop_search_lng_7838d5_idx'),
+        ),
+        migrations.RunPython(fill_geo_fields, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:45
+
+from django.db import migrations, models
+
+
+def mark_history_compacted(apps, schema_editor):
+    # Nothing before this migration was logged; clients behind it must resync
+    CatalogueVersion = apps.get_model('otop_search_thailand', 'CatalogueVersion')
+    CatalogueVersion.objects.update(compacted_to=models.F('version'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('otop_search_thailand', '0009_product_geo_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductChange',
+            fields=[
+                (
+                    'id',
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name='ID'
+                    ),
+                ),
+                ('version', models.PositiveBigIntegerField(blank=True, db_index=True, null=True)),
+                ('product_id', models.BigIntegerField()),
+                (
+                    'action',
+                    models.CharField(
+                        choices=[('i', 'inserted'), ('u', 'updated'), ('d', 'deleted')],
+                        max_length=1,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='catalogueversion',
+            name='compacted_to',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.RunPython(mark_history_compacted, migrations.RunPython.noop),
+    ]
@@ -1,11 +1,20 @@
 from django.db import models
 from django.utils.text import slugify
 
+from .geo import geohash_encode
+
+# Product columns derived by Product.set_geo_fields()
+GEO_FIELDS = ("lat", "lng", "geohash")
+
 
 class Province(models.Model):
     name = models.CharField(max_length=100, unique=True)
     slug = models.SlugField(max_length=120, unique=True, blank=True)
 
+    # Denormalized from Product, maintained by otop_search_thailand.counters
+    product_count = models.PositiveIntegerField(default=0, editable=False)
+    category_counts = models.JSONField(default=dict, blank=True, editable=False)
+
     def _generate_unique_slug(self, base):
         slug = slugify(base, allow_unicode=True)
         original = slug
@@ -39,14 +48,136 @@ class Product(models.Model):
     latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
 
+    # Derived from latitude/longitude by set_geo_fields(): float-native copies for the
+    # map APIs and a geohash whose prefixes turn bbox filters into index range scans
+    lat = models.FloatField(null=True, blank=True, editable=False)
+    lng = models.FloatField(null=True, blank=True, editable=False)
+    geohash = models.CharField(max_length=12, blank=True, default="", editable=False)
+
+    # Digest of the normalized feed record, maintained by import_otop_json --delta
+    content_hash = models.CharField(max_length=40, blank=True, default="", editable=False)
+
     class Meta:
         indexes = [
             models.Index(fields=["province", "category"]),
             models.Index(fields=["latitude", "longitude"]),
+            # Sortable columns of the DataTables search page
+            models.Index(fields=["category", "id"]),
+            models.Index(fields=["rating", "id"]),
+            models.Index(fields=["geohash"]),
+            models.Index(fields=["lng", "lat"]),
         ]
         constraints = [
             models.UniqueConstraint(fields=["name", "province"], name="uniq_product_in_province"),
         ]
 
+    # What the search index and the province counters are built from
+    INDEXED_FIELDS = ("name", "province_id", "category", "description")
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets the save signals tell whether the indexed fields moved without a query
+        if set(cls.INDEXED_FIELDS) <= set(field_names):
+            instance._loaded = instance.indexed_values()
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        # Loaded values are no longer known; the next save reads them from the row
+        self.__dict__.pop("_loaded", None)
+
+    def indexed_values(self):
+        return tuple(getattr(self, field) for field in self.INDEXED_FIELDS)
+
+    def set_geo_fields(self):
+        if self.latitude is None or self.longitude is None:
+            self.lat = self.lng = None
+            self.geohash = ""
+        else:
+            self.lat = round(float(self.latitude), 6)
+            self.lng = round(float(self.longitude), 6)
+            self.geohash = geohash_encode(self.lat, self.lng)
+
+    def save(self, *args, **kwargs):
+        self.set_geo_fields()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"latitude", "longitude"} & set(update_fields):
+            kwargs["update_fields"] = {*update_fields, *GEO_FIELDS}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.name
+
+
+class ImportManifest(models.Model):
+    source = models.CharField(max_length=500)
+    source_sha256 = models.CharField(max_length=64, db_index=True)
+    delta = models.BooleanField(default=False)
+
+    created = models.PositiveIntegerField(default=0)
+    updated = models.PositiveIntegerField(default=0)
+    unchanged = models.PositiveIntegerField(default=0)
+    vanished = models.PositiveIntegerField(default=0)
+    deleted = models.PositiveIntegerField(default=0)
+    skipped = models.PositiveIntegerField(default=0)
+
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-finished_at", "-id"]
+
+    def __str__(self):
+        return f"{self.source} @ {self.finished_at:%Y-%m-%d %H:%M}"
+
+
+class CatalogueVersion(models.Model):
+    """Single-row counter bumped whenever catalogue data changes."""
+
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    # ProductChange rows at or below this version have been compacted away
+    compacted_to = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"v{self.version}"
+
+
+class ProductChange(models.Model):
+    """One product insert, update or delete, for clients syncing incrementally."""
+
+    INSERTED = "i"
+    UPDATED = "u"
+    DELETED = "d"
+    ACTIONS = [(INSERTED, "inserted"), (UPDATED, "updated"), (DELETED, "deleted")]
+
+    # Null until bump_data_version stamps it with the version the change produced
+    version = models.PositiveBigIntegerField(null=True, blank=True, db_index=True)
+    # Not a foreign key: deletions outlive the product
+    product_id = models.BigIntegerField()
+    action = models.CharField(max_length=1, choices=ACTIONS)
+
+    def __str__(self):
+        return f"{self.get_action_display()} {self.product_id} @v{self.version}"
+
+
+class CatalogueStats(models.Model):
+    """Single-row, materialized home page statistics for one data version."""
+
+    version = models.PositiveBigIntegerField(default=0)
+    total_products = models.PositiveIntegerField(default=0)
+    total_provinces = models.PositiveIntegerField(default=0)
+    # [{"category", "c"}], most products first
+    top_categories = models.JSONField(default=list)
+    # [{"name", "slug", "product_total"}] for every province, most products first
+    province_counts = models.JSONField(default=list)
+    # [{"name", "province", "province_slug", "category", "rating", "image_url"}]
+    top_products = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "catalogue stats"
+
+    def __str__(self):
+        return f"stats v{self.version}"
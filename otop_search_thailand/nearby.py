@@ -0,0 +1,139 @@
+"""Nearest-product queries over an in-memory KD-tree.
+
+Coordinates are mapped onto the unit sphere as 3D vectors. The straight-line
+(chord) distance between two such vectors grows monotonically with their
+great-circle distance, so an ordinary Euclidean KD-tree answers k-nearest and
+radius queries exactly, with no special cases at the poles or the antimeridian.
+The tree is rebuilt when the catalogue data version changes.
+"""
+
+import heapq
+import math
+
+from .models import Product
+from .versioning import VersionedValue
+
+EARTH_RADIUS_KM = 6371.0088
+
+POINT_FIELDS = (
+    "id",
+    "name",
+    "province__name",
+    "category",
+    "rating",
+    "phone",
+    "lat",
+    "lng",
+)
+
+
+def to_vector(lat, lng):
+    phi, lam = math.radians(lat), math.radians(lng)
+    cos_phi = math.cos(phi)
+    return (cos_phi * math.cos(lam), cos_phi * math.sin(lam), math.sin(phi))
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * math.asin(min(chord / 2, 1.0))
+
+
+def km_to_chord(km):
+    return 2 * math.sin(min(km / EARTH_RADIUS_KM, math.pi) / 2)
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (
+        math.sin((phi2 - phi1) / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(math.sqrt(a), 1.0))
+
+
+class KDTree:
+    """Static 3D KD-tree; nodes are ``(vector, item, axis, left, right)`` tuples."""
+
+    def __init__(self, points):
+        """``points`` is a sequence of ``(vector, item)``."""
+        self.size = len(points)
+        self.root = self._build(list(points), 0)
+
+    def _build(self, points, depth):
+        if not points:
+            return None
+        axis = depth % 3
+        points.sort(key=lambda p: p[0][axis])
+        mid = len(points) // 2
+        vector, item = points[mid]
+        return (
+            vector,
+            item,
+            axis,
+            self._build(points[:mid], depth + 1),
+            self._build(points[mid + 1 :], depth + 1),
+        )
+
+    def nearest(self, target, k, max_chord=None):
+        """The ``k`` items closest to ``target`` as ``(chord, item)``, nearest first."""
+        if k <= 0:
+            return []
+        bound = math.inf if max_chord is None else max_chord**2
+        # Max-heap of the best k so far, keyed by negated squared distance
+        best = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            vector, item, axis, left, right = node
+            d2 = sum((a - b) ** 2 for a, b in zip(vector, target))
+            limit = -best[0][0] if len(best) == k else bound
+            if d2 <= limit:
+                entry = (-d2, id(node), item)
+                if len(best) < k:
+                    heapq.heappush(best, entry)
+                else:
+                    heapq.heapreplace(best, entry)
+            diff = target[axis] - vector[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            limit = -best[0][0] if len(best) == k else bound
+            # Push the far side first so the near side is explored first
+            if diff * diff <= limit:
+                stack.append(far)
+            stack.append(near)
+        return [(math.sqrt(-d), item) for d, _, item in sorted(best, reverse=True)]
+
+
+def build_tree():
+    points = []
+    rows = (
+        Product.objects.filter(lat__isnull=False, lng__isnull=False)
+        .order_by("id")
+        .values_list(*POINT_FIELDS)
+        .iterator(chunk_size=2000)
+    )
+    for pk, name, province, category, rating, phone, lat, lng in rows:
+        item = {
+            "id": pk,
+            "name": name,
+            "province": province,
+            "category": category,
+            "rating": float(rating or 0),
+            "phone": phone,
+            "lat": lat,
+            "lng": lng,
+        }
+        points.append((to_vector(lat, lng), item))
+    return KDTree(points)
+
+
+_tree = VersionedValue(build_tree)
+
+
+def nearby(lat, lng, k=10, radius_km=None):
+    """Products nearest to ``(lat, lng)``, each with ``distance_km``, nearest first."""
+    max_chord = None if radius_km is None else km_to_chord(radius_km)
+    results = []
+    for chord, item in _tree.get().nearest(to_vector(lat, lng), k, max_chord):
+        results.append({**item, "distance_km": round(chord_to_km(chord), 3)})
+    return results
@@ -0,0 +1,108 @@
+"""Keyset (seek) pagination helpers.
+
+Pages are addressed by an opaque cursor holding the sort key of the last row
+seen, so fetching page N costs the same as page 1 (no OFFSET scan).
+"""
+
+import base64
+import json
+
+from django.db import connection
+from django.db.models import Q
+
+
+def encode_cursor(values):
+    # Decimals (e.g. rating) round-trip as strings, which the ORM accepts in filters
+    raw = json.dumps(list(values), ensure_ascii=False, separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).rstrip(b"=").decode("ascii")
+
+
+def decode_cursor(cursor, size):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, UnicodeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def after(fields, values):
+    """``Q`` selecting rows strictly after ``values`` in ascending ``fields`` order.
+
+    Fields prefixed with ``-`` sort descending, matching ``order_by`` syntax.
+    """
+    clause = Q()
+    for i in reversed(range(len(fields))):
+        field = fields[i].lstrip("-")
+        op = "lt" if fields[i].startswith("-") else "gt"
+        step = Q(**{f"{field}__{op}": values[i]})
+        if i < len(fields) - 1:
+            step |= Q(**{field: values[i]}) & clause
+        clause = step
+    return clause
+
+
+def reverse_ordering(ordering):
+    return tuple(f[1:] if f.startswith("-") else "-" + f for f in ordering)
+
+
+def _fetch(queryset, ordering, cursor, limit):
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        queryset = queryset.filter(after(ordering, decode_cursor(cursor, len(ordering))))
+    rows = list(queryset[: limit + 1])
+    return rows[:limit], len(rows) > limit
+
+
+def keyset_window(queryset, ordering, after_cursor=None, before_cursor=None, limit=20, key=None):
+    """Return ``(rows, prev_cursor, next_cursor)`` for the page after or before a cursor.
+
+    ``key`` extracts the ordering values from a row (defaults to attribute access).
+    """
+    if key is None:
+
+        def key(row):
+            return [getattr(row, f.lstrip("-")) for f in ordering]
+
+    if before_cursor:
+        rows, has_prev = _fetch(queryset, reverse_ordering(ordering), before_cursor, limit)
+        rows.reverse()
+        has_next = True
+    else:
+        rows, has_next = _fetch(queryset, ordering, after_cursor, limit)
+        has_prev = bool(after_cursor)
+    prev_cursor = encode_cursor(key(rows[0])) if rows and has_prev else None
+    next_cursor = encode_cursor(key(rows[-1])) if rows and has_next else None
+    return rows, prev_cursor, next_cursor
+
+
+def keyset_page(queryset, ordering, cursor=None, limit=20, key=None):
+    """Return ``(rows, next_cursor)`` for one page of ``queryset`` ordered by ``ordering``."""
+    rows, _, next_cursor = keyset_window(queryset, ordering, cursor, limit=limit, key=key)
+    return rows, next_cursor
+
+
+# Below this many estimated rows an exact COUNT(*) is cheap enough
+EXACT_COUNT_THRESHOLD = 1000
+
+
+def estimated_count(queryset):
+    """Return ``(count, estimated)`` for ``queryset``.
+
+    On Postgres large results use the planner's row estimate instead of a
+    ``COUNT(*)``; other databases count exactly.
+    """
+    queryset = queryset.order_by()
+    if connection.vendor == "postgresql":
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        rows = int(plan[0]["Plan"]["Plan Rows"])
+        if rows > EXACT_COUNT_THRESHOLD:
+            return rows, True
+    return queryset.count(), False
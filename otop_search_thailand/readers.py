@@ -0,0 +1,194 @@
+"""Incremental readers for OTOP feeds.
+
+``iter_records`` yields one raw record at a time, so memory stays bounded by
+the read chunk plus the largest single record instead of the whole file.
+"""
+
+import json
+import os
+from contextlib import contextmanager
+
+JSON_LINES_EXTENSIONS = ('.jsonl', '.ndjson')
+CHUNK_SIZE = 64 * 1024
+
+_WS = ' \t\n\r'
+
+# Wrapper keys the importer looks for, in order of preference
+WRAPPER_KEYS = ('items', 'products', 'data', 'results')
+
+
+class _Stream:
+    def __init__(self, fh, chunk_size):
+        self.fh = fh
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def fill(self, size=None):
+        if self.eof:
+            return False
+        if self.pos:
+            # Drop what has already been consumed so the buffer never grows with the file
+            self.buf = self.buf[self.pos :]
+            self.pos = 0
+        data = self.fh.read(size or self.chunk_size)
+        if not data:
+            self.eof = True
+            return False
+        self.buf += data
+        return True
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WS:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, ch):
+        if self.peek() != ch:
+            raise ValueError(f'Malformed JSON: expected {ch!r} at offset {self.pos}')
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        size = self.chunk_size
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill(size):
+                    raise
+                size *= 2
+                continue
+            # A number can end exactly at the buffer edge, so make sure it is complete
+            if end == len(self.buf) and self.fill(size):
+                continue
+            self.pos = end
+            return value
+
+    def skip(self):
+        """Step over the array at the cursor, one element at a time."""
+        for _ in self.array():
+            pass
+
+    def array(self):
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            ch = self.peek()
+            self.pos += 1
+            if ch == ']':
+                return
+            if ch != ',':
+                raise ValueError(f'Malformed JSON array at offset {self.pos - 1}')
+
+    def members(self):
+        """Yield ``(key, is_array)``; the caller consumes the value itself."""
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            if self.peek() != '"':
+                raise ValueError(f'Malformed JSON object at offset {self.pos}')
+            key = self.value()
+            self.expect(':')
+            yield key, self.peek() == '['
+            ch = self.peek()
+            self.pos += 1
+            if ch == '}':
+                return
+            if ch != ',':
+                raise ValueError(f'Malformed JSON object at offset {self.pos - 1}')
+
+
+def _iter_wrapped(stream, reopen):
+    # The importer's long-standing choice: the first of WRAPPER_KEYS holding an
+    # array, else the first array, else the object itself as one record.
+    # ``items`` outranks everything and is streamed on sight; any other choice
+    # is only known at the closing brace and is streamed from a second pass.
+    scalars = {}
+    arrays = []
+    streamed = False
+    for key, is_array in stream.members():
+        if is_array and key == WRAPPER_KEYS[0] and not streamed:
+            streamed = True
+            yield from stream.array()
+        elif is_array:
+            arrays.append(key)
+            stream.skip()
+        else:
+            scalars[key] = stream.value()
+    if streamed:
+        return
+    if not arrays:
+        yield scalars
+        return
+    known = [key for key in WRAPPER_KEYS if key in arrays]
+    chosen = known[0] if known else arrays[0]
+    with reopen() as again:
+        for key, is_array in again.members():
+            if is_array and key == chosen:
+                yield from again.array()
+                return
+            if is_array:
+                again.skip()
+            else:
+                again.value()
+
+
+def _iter_json(stream, reopen):
+    first = stream.peek()
+    if first == '[':
+        yield from stream.array()
+    elif first == '{':
+        yield from _iter_wrapped(stream, reopen)
+    elif first:
+        raise ValueError('Unsupported JSON structure: expected list or object')
+    # As json.load: a truncated or doubled feed must not import whatever follows
+    if stream.peek():
+        raise ValueError('Extra data after JSON value')
+
+
+def _iter_lines(fh):
+    for line in fh:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            # Hand the raw line on so the importer can log it as invalid
+            yield line
+
+
+def iter_records(path, fmt='auto', chunk_size=CHUNK_SIZE, encoding='utf-8-sig'):
+    """Yield raw records from a JSON or JSON Lines file without loading it whole.
+
+    JSON input may be a bare array or an object wrapping the array (``items``,
+    ``products``, ``data``, ``results`` in that order of preference, else the
+    first array, such as ``Sheet1``).
+    ``fmt`` is ``'json'``, ``'jsonl'`` or ``'auto'`` (decided by file extension).
+    """
+    if fmt == 'auto':
+        ext = os.path.splitext(str(path))[1].lower()
+        fmt = 'jsonl' if ext in JSON_LINES_EXTENSIONS else 'json'
+
+    @contextmanager
+    def reopen():
+        with open(path, 'r', encoding=encoding) as fh:
+            yield _Stream(fh, chunk_size)
+
+    with open(path, 'r', encoding=encoding) as fh:
+        if fmt == 'jsonl':
+            yield from _iter_lines(fh)
+        else:
+            yield from _iter_json(_Stream(fh, chunk_size), reopen)
@@ -0,0 +1,312 @@
+"""Ranked product search over Thai text.
+
+Thai is written without spaces between words, so matching works on character
+trigrams rather than words: a term matches a field when the field contains it,
+which keeps the old ``icontains`` semantics. Backends:
+
+* ``fts5``    SQLite FTS5 table with the ``trigram`` tokenizer, ranked by bm25
+* ``pg_trgm`` Postgres GIN trigram indexes, ranked by word similarity
+* ``memory``  in-process inverted index, rebuilt when the data version changes
+
+``OTOP_SEARCH_BACKEND`` picks one; ``auto`` uses the database's own index when
+its migration could create it and falls back to ``memory``.
+"""
+
+import re
+import unicodedata
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Product, Province
+from .versioning import VersionedValue
+
+NGRAM = 3
+# Relative weight of a hit in name, province, category and description
+FIELD_WEIGHTS = (10.0, 5.0, 5.0, 1.0)
+
+_ZERO_WIDTH = re.compile("[\u200b\u200c\u200d\ufeff]")
+
+
+def normalize(text):
+    text = unicodedata.normalize("NFC", text or "")
+    return _ZERO_WIDTH.sub("", text).casefold()
+
+
+def query_terms(query):
+    """Whitespace-separated terms of ``query``; every term must match."""
+    terms = []
+    for term in normalize(query).split():
+        if term not in terms:
+            terms.append(term)
+    return terms
+
+
+def ngrams(text, n=NGRAM):
+    return {text[i : i + n] for i in range(len(text) - n + 1)}
+
+
+def _escape_like(term):
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _product_documents():
+    qs = Product.objects.order_by("id")
+    return qs.values_list("id", "name", "province__name", "category", "description").iterator(
+        chunk_size=2000
+    )
+
+
+class MemoryBackend:
+    name = "memory"
+
+    def __init__(self):
+        self._index = VersionedValue(self._build)
+
+    def available(self):
+        return True
+
+    def _build(self):
+        docs = {}
+        postings = {}
+        for pid, *fields in _product_documents():
+            fields = tuple(normalize(f) for f in fields)
+            docs[pid] = fields
+            for gram in ngrams("\n".join(fields)):
+                postings.setdefault(gram, set()).add(pid)
+        return docs, postings
+
+    def rebuild(self):
+        self._index.clear()
+
+    def update(self, ids):
+        # Saves bump the data version, which rebuilds the index on next use
+        pass
+
+    def delete(self, ids):
+        pass
+
+    def filter(self, queryset, query):
+        return queryset.filter(id__in=self.search(query))
+
+    def search(self, query, limit=None):
+        terms = query_terms(query)
+        if not terms:
+            return []
+        docs, postings = self._index.get()
+        candidates = None
+        for term in terms:
+            for gram in ngrams(term):
+                hits = postings.get(gram, set())
+                candidates = hits if candidates is None else candidates & hits
+                if not candidates:
+                    return []
+        if candidates is None:
+            # Every term is shorter than a trigram: scan the documents
+            candidates = docs.keys()
+        ranked = []
+        for pid in candidates:
+            fields = docs[pid]
+            score = 0.0
+            for term in terms:
+                hit = sum(w for w, field in zip(FIELD_WEIGHTS, fields) if term in field)
+                if not hit:
+                    break
+                score += hit + (FIELD_WEIGHTS[0] if fields[0].startswith(term) else 0)
+            else:
+                ranked.append((-score, fields[0], pid))
+        ranked.sort()
+        return [pid for _, _, pid in ranked[:limit]]
+
+
+class SQLiteFTSBackend:
+    """FTS5 ``trigram`` table keyed by product id (SQLite 3.34+)."""
+
+    name = "fts5"
+    table = "otop_product_fts"
+
+    def __init__(self):
+        self._available = False
+
+    def available(self):
+        if not self._available and connection.vendor == "sqlite":
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [self.table]
+                )
+                self._available = cursor.fetchone() is not None
+        return self._available
+
+    def _insert_sql(self, where=""):
+        return (
+            f"INSERT INTO {self.table} (rowid, name, province, category, description) "
+            f"SELECT p.id, p.name, r.name, p.category, p.description "
+            f"FROM {Product._meta.db_table} p JOIN {Province._meta.db_table} r "
+            f"ON r.id = p.province_id {where}"
+        )
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+            cursor.execute(self._insert_sql())
+
+    def _chunks(self, ids, size=500):
+        ids = list(ids)
+        for start in range(0, len(ids), size):
+            chunk = ids[start : start + size]
+            yield chunk, ", ".join(["%s"] * len(chunk))
+
+    def update(self, ids):
+        with connection.cursor() as cursor:
+            for chunk, marks in self._chunks(ids):
+                cursor.execute(f"DELETE FROM {self.table} WHERE rowid IN ({marks})", chunk)
+                cursor.execute(self._insert_sql(f"WHERE p.id IN ({marks})"), chunk)
+
+    def delete(self, ids):
+        with connection.cursor() as cursor:
+            for chunk, marks in self._chunks(ids):
+                cursor.execute(f"DELETE FROM {self.table} WHERE rowid IN ({marks})", chunk)
+
+    def _where(self, terms):
+        # The trigram tokenizer only indexes terms of three or more characters
+        long_terms = [t for t in terms if len(t) >= NGRAM]
+        where, params = [], []
+        if long_terms:
+            where.append(f"{self.table} MATCH %s")
+            params.append(" AND ".join('"%s"' % t.replace('"', '""') for t in long_terms))
+        for term in terms:
+            if len(term) < NGRAM:
+                pattern = f"%{_escape_like(term)}%"
+                where.append(
+                    "("
+                    + " OR ".join(
+                        f"{col} LIKE %s ESCAPE '\\'"
+                        for col in ("name", "province", "category", "description")
+                    )
+                    + ")"
+                )
+                params += [pattern] * 4
+        return " AND ".join(where), params, bool(long_terms)
+
+    def filter(self, queryset, query):
+        terms = query_terms(query)
+        if not terms:
+            return queryset.none()
+        where, params, _ = self._where(terms)
+        return queryset.filter(
+            id__in=RawSQL(f"SELECT rowid FROM {self.table} WHERE {where}", params)
+        )
+
+    def search(self, query, limit=None):
+        terms = query_terms(query)
+        if not terms:
+            return []
+        where, params, ranked = self._where(terms)
+        weights = ", ".join(str(w) for w in FIELD_WEIGHTS)
+        order = f"bm25({self.table}, {weights}), name" if ranked else "name"
+        sql = f"SELECT rowid FROM {self.table} WHERE {where} ORDER BY {order}, rowid LIMIT %s"
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params + [-1 if limit is None else limit])
+            return [row[0] for row in cursor.fetchall()]
+
+
+class TrigramBackend:
+    """Postgres ``pg_trgm``: GIN indexes serve the ``icontains`` filters."""
+
+    name = "pg_trgm"
+
+    def __init__(self):
+        self._available = None
+
+    def available(self):
+        # Migration 0005 carries on without the extension when it may not create it
+        if self._available is None and connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+                self._available = cursor.fetchone() is not None
+        return bool(self._available)
+
+    def rebuild(self):
+        # GIN indexes are maintained by Postgres itself
+        pass
+
+    def update(self, ids):
+        pass
+
+    def delete(self, ids):
+        pass
+
+    def filter(self, queryset, query):
+        terms = query_terms(query)
+        if not terms:
+            return queryset.none()
+        for term in terms:
+            provinces = Province.objects.filter(name__icontains=term).values("id")
+            queryset = queryset.filter(
+                Q(name__icontains=term)
+                | Q(category__icontains=term)
+                | Q(description__icontains=term)
+                | Q(province_id__in=provinces)
+            )
+        return queryset
+
+    def search(self, query, limit=None):
+        from django.contrib.postgres.search import TrigramWordSimilarity
+
+        terms = query_terms(query)
+        if not terms:
+            return []
+        qs = self.filter(Product.objects.all(), query)
+        text = " ".join(terms)
+        weight_name, weight_province, weight_category, _ = FIELD_WEIGHTS
+        rank = (
+            weight_name * TrigramWordSimilarity(text, "name")
+            + weight_province * TrigramWordSimilarity(text, "province__name")
+            + weight_category * TrigramWordSimilarity(text, "category")
+        )
+        ids = qs.annotate(rank=rank).order_by("-rank", "name", "id").values_list("id", flat=True)
+        return list(ids if limit is None else ids[:limit])
+
+
+BACKENDS = {cls.name: cls() for cls in (MemoryBackend, SQLiteFTSBackend, TrigramBackend)}
+
+
+def get_backend():
+    name = getattr(settings, "OTOP_SEARCH_BACKEND", "auto") or "auto"
+    if name != "auto":
+        return BACKENDS[name]
+    for candidate in ("pg_trgm", "fts5"):
+        if BACKENDS[candidate].available():
+            return BACKENDS[candidate]
+    return BACKENDS["memory"]
+
+
+def search(query, limit=None):
+    """Ids of products matching every term of ``query``, best match first."""
+    return get_backend().search(query, limit)
+
+
+def filter_products(queryset, query):
+    """Narrow ``queryset`` to products matching ``query``, without ranking."""
+    return get_backend().filter(queryset, query)
+
+
+def search_products(query, limit=None, offset=0):
+    """``Product`` instances (province joined) in relevance order."""
+    ids = search(query, None if limit is None else offset + limit)[offset:]
+    found = Product.objects.select_related("province").in_bulk(ids)
+    return [found[pk] for pk in ids if pk in found]
+
+
+def rebuild_index():
+    get_backend().rebuild()
+
+
+def update_products(ids):
+    get_backend().update(ids)
+
+
+def remove_products(ids):
+    get_backend().delete(ids)
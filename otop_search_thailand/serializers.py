@@ -0,0 +1,125 @@
+import json
+
+from django.db.models import Q
+
+from .models import Product
+
+# (output key, ORM lookup) in the order the public API has always emitted them
+PRODUCT_JSON_FIELDS = (
+    ("name", "name"),
+    ("province", "province__name"),
+    ("category", "category"),
+    ("rating", "rating"),
+    ("address", "address"),
+    ("phone", "phone"),
+    ("lat", "lat"),
+    ("lng", "lng"),
+    ("description", "description"),
+    ("image_url", "image_url"),
+)
+
+PRODUCT_LOOKUPS = {"id": "id", **dict(PRODUCT_JSON_FIELDS)}
+
+CHUNK_SIZE = 500
+
+
+# Decimal columns are exposed as JSON numbers
+CONVERTERS = {
+    "rating": lambda value: float(value or 0),
+}
+
+
+def product_row_to_dict(row, keys=None):
+    keys = keys or [key for key, _ in PRODUCT_JSON_FIELDS]
+    item = dict(zip(keys, row))
+    for key, convert in CONVERTERS.items():
+        if key in item:
+            item[key] = convert(item[key])
+    return item
+
+
+def parse_fields(raw):
+    """Validate a ``?fields=a,b`` projection; returns the keys in request order."""
+    if not raw:
+        return [key for key, _ in PRODUCT_JSON_FIELDS]
+    keys = []
+    for key in raw.split(","):
+        key = key.strip()
+        if key not in PRODUCT_LOOKUPS:
+            raise ValueError(f"Unknown field: {key}")
+        if key not in keys:
+            keys.append(key)
+    return keys
+
+
+PRODUCT_JSON_LOOKUPS = [lookup for _, lookup in PRODUCT_JSON_FIELDS]
+
+
+def _product_rows(queryset, chunk_size):
+    return queryset.values_list(*PRODUCT_JSON_LOOKUPS).iterator(chunk_size=chunk_size)
+
+
+def _iter_joined(items, chunk_size):
+    # Comma-join encoded items in groups so each yielded piece carries many rows
+    encode = json.JSONEncoder(ensure_ascii=False).encode
+    buf = []
+    sep = ""
+    for item in items:
+        buf.append(encode(item))
+        if len(buf) >= chunk_size:
+            yield sep + ",".join(buf)
+            sep = ","
+            buf = []
+    if buf:
+        yield sep + ",".join(buf)
+
+
+def iter_products_json(queryset=None, chunk_size=CHUNK_SIZE, rows=None):
+    """Yield ``/api/products.json`` as text chunks without building model instances.
+
+    Rows come from ``values_list().iterator()``, so at most ``chunk_size`` rows
+    are held in memory at a time. ``rows``, tuples in ``PRODUCT_JSON_FIELDS``
+    order, replace the query.
+    """
+    if rows is None:
+        if queryset is None:
+            queryset = Product.objects.order_by("id")
+        rows = _product_rows(queryset, chunk_size)
+    yield "["
+    yield from _iter_joined(map(product_row_to_dict, rows), chunk_size)
+    yield "]"
+
+
+def located():
+    return Q(lat__isnull=False, lng__isnull=False)
+
+
+def product_row_to_feature(row):
+    item = product_row_to_dict(row)
+    return {
+        "type": "Feature",
+        "geometry": {"type": "Point", "coordinates": [item["lng"], item["lat"]]},
+        "properties": {
+            "name": item["name"],
+            "province": item["province"],
+            "category": item["category"],
+            "rating": item["rating"],
+            "image_url": item["image_url"],
+            "address": item["address"],
+            "phone": item["phone"],
+        },
+    }
+
+
+def iter_products_geojson(queryset=None, chunk_size=CHUNK_SIZE, rows=None):
+    """Yield ``/api/products.geojson`` as text chunks.
+
+    A custom ``queryset`` or ``rows`` must already exclude products without coordinates.
+    """
+    if rows is None:
+        if queryset is None:
+            queryset = Product.objects.filter(located()).order_by("id")
+        rows = _product_rows(queryset, chunk_size)
+    yield '{"type":"FeatureCollection","features":['
+    yield from _iter_joined(map(product_row_to_feature, rows), chunk_size)
+    yield "]}"
@@ -0,0 +1,81 @@
+import threading
+from contextlib import contextmanager
+
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import changes, counters, search
+from .models import Product, ProductChange, Province
+from .versioning import bump_data_version
+
+_bulk = threading.local()
+
+
+@contextmanager
+def bulk_import():
+    """Skip per-row search and counter upkeep; the caller rebuilds both afterwards."""
+    _bulk.depth = getattr(_bulk, "depth", 0) + 1
+    try:
+        yield
+    finally:
+        _bulk.depth -= 1
+
+
+def _per_row():
+    return not getattr(_bulk, "depth", 0)
+
+
+def _log(product_ids, action):
+    # Bump first, so the log rows are written already stamped with the new version
+    changes.record(product_ids, action, bump_data_version(stamp=False))
+
+
+@receiver(pre_save, sender=Product)
+def product_saving(sender, instance, **kwargs):
+    # What the search index and counters hold for the row before this save
+    instance._previous = None
+    if _per_row() and not instance._state.adding:
+        instance._previous = getattr(instance, "_loaded", None) or (
+            Product.objects.filter(pk=instance.pk).values_list(*Product.INDEXED_FIELDS).first()
+        )
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, created, **kwargs):
+    current = instance.indexed_values()
+    if _per_row():
+        previous = None if created else getattr(instance, "_previous", None)
+        if current != previous:
+            search.update_products([instance.pk])
+        # (province_id, category)
+        if previous is None or previous[1:3] != current[1:3]:
+            if previous is not None:
+                counters.adjust(*previous[1:3], -1)
+            counters.adjust(*current[1:3], 1)
+    instance._loaded = current
+    _log([instance.pk], ProductChange.INSERTED if created else ProductChange.UPDATED)
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    if _per_row():
+        search.remove_products([instance.pk])
+        counters.adjust(instance.province_id, instance.category, -1)
+    _log([instance.pk], ProductChange.DELETED)
+
+
+@receiver(post_save, sender=Province)
+def province_saved(sender, instance, created, **kwargs):
+    if created:
+        bump_data_version()
+        return
+    # Product payloads carry the province name
+    ids = list(instance.products.values_list("id", flat=True))
+    if _per_row():
+        search.update_products(ids)
+    _log(ids, ProductChange.UPDATED)
+
+
+@receiver(post_delete, sender=Province)
+def province_deleted(sender, instance, **kwargs):
+    bump_data_version()
@@ -0,0 +1,190 @@
+"""Pre-serialized, pre-compressed API snapshots.
+
+``build_snapshots`` writes each API payload once per catalogue data version,
+with gzip (and brotli, when installed) variants next to it. The API views hand
+those files out directly and fall back to live generation when no snapshot
+matches the current data version.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils import timezone
+
+from .serializers import iter_products_geojson, iter_products_json
+from .versioning import get_data_version
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+SNAPSHOTS = {
+    "products.json": iter_products_json,
+    "products.geojson": iter_products_geojson,
+}
+CONTENT_TYPE = "application/json; charset=utf-8"
+MANIFEST_NAME = "manifest.json"
+
+_lock = threading.Lock()
+_manifest_cache = {"key": None, "manifest": None}
+
+
+def snapshot_dir():
+    return str(getattr(settings, "OTOP_SNAPSHOT_DIR", "") or "")
+
+
+def _write_variants(directory, base, chunks):
+    """Stream ``chunks`` into identity/gzip/br files; returns ``(etag, size, files)``."""
+    files = {"identity": base, "gzip": base + ".gz"}
+    if brotli is not None:
+        files["br"] = base + ".br"
+    tmp = {enc: os.path.join(directory, name + ".tmp") for enc, name in files.items()}
+
+    digest = hashlib.sha256()
+    size = 0
+    raw = open(tmp["identity"], "wb")
+    gz = gzip.GzipFile(tmp["gzip"], "wb", compresslevel=9, mtime=0)
+    br_file = open(tmp["br"], "wb") if brotli is not None else None
+    br = brotli.Compressor(quality=11) if brotli is not None else None
+    try:
+        for chunk in chunks:
+            data = chunk.encode("utf-8")
+            digest.update(data)
+            size += len(data)
+            raw.write(data)
+            gz.write(data)
+            if br is not None:
+                br_file.write(br.process(data))
+        if br is not None:
+            br_file.write(br.finish())
+    finally:
+        raw.close()
+        gz.close()
+        if br_file is not None:
+            br_file.close()
+    for enc, name in files.items():
+        os.replace(tmp[enc], os.path.join(directory, name))
+    return digest.hexdigest()[:32], size, files
+
+
+def build_snapshots(directory=None):
+    """Serialize every API snapshot for the current data version and return the manifest."""
+    directory = directory or snapshot_dir()
+    if not directory:
+        raise ValueError("OTOP_SNAPSHOT_DIR is not configured")
+    os.makedirs(directory, exist_ok=True)
+
+    # Read the version first: a concurrent change then makes this build stale, never wrong
+    version = get_data_version(fresh=True)
+    entries = {}
+    for name, generate in SNAPSHOTS.items():
+        stem, ext = os.path.splitext(name)
+        etag, size, files = _write_variants(directory, f"{stem}.v{version}{ext}", generate())
+        entries[name] = {"etag": etag, "size": size, "files": files}
+
+    manifest = {
+        "version": version,
+        "built_at": timezone.now().isoformat(),
+        "snapshots": entries,
+    }
+    tmp_path = os.path.join(directory, MANIFEST_NAME + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, os.path.join(directory, MANIFEST_NAME))
+
+    # Drop artifacts of older versions
+    keep = {n for e in entries.values() for n in e["files"].values()}
+    prefixes = tuple(os.path.splitext(name)[0] + ".v" for name in SNAPSHOTS)
+    for filename in os.listdir(directory):
+        if filename.startswith(prefixes) and filename not in keep:
+            try:
+                os.remove(os.path.join(directory, filename))
+            except OSError:
+                pass
+    return manifest
+
+
+def load_manifest(directory=None):
+    directory = directory or snapshot_dir()
+    path = os.path.join(directory, MANIFEST_NAME) if directory else ""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    with _lock:
+        if _manifest_cache["key"] == key:
+            return _manifest_cache["manifest"]
+    try:
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    with _lock:
+        _manifest_cache["key"] = key
+        _manifest_cache["manifest"] = manifest
+    return manifest
+
+
+def current_snapshot(name):
+    """Return the manifest entry for ``name`` if it matches the live data version."""
+    manifest = load_manifest()
+    if not manifest or manifest.get("version") != get_data_version():
+        return None
+    return manifest["snapshots"].get(name)
+
+
+def accepted_encodings(request):
+    accepted = set()
+    for part in request.META.get("HTTP_ACCEPT_ENCODING", "").split(","):
+        token, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(token.strip().lower())
+    return accepted
+
+
+def etag_matches(request, etag):
+    """True if ``If-None-Match`` names ``etag`` or one of its encoded variants."""
+    header = request.META.get("HTTP_IF_NONE_MATCH", "")
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag.strip('"').split("-", 1)[0] == etag:
+            return True
+    return False
+
+
+def snapshot_response(request, name):
+    """Serve snapshot ``name`` with a strong ETag, or return None to generate live."""
+    entry = current_snapshot(name)
+    if entry is None:
+        return None
+    files = entry["files"]
+    accepted = accepted_encodings(request)
+    encoding = next((enc for enc in ("br", "gzip") if enc in files and enc in accepted), None)
+    etag = f'"{entry["etag"]}-{encoding}"' if encoding else f'"{entry["etag"]}"'
+
+    if etag_matches(request, entry["etag"]):
+        response = HttpResponseNotModified()
+    else:
+        path = os.path.join(snapshot_dir(), files[encoding or "identity"])
+        try:
+            fh = open(path, "rb")
+        except OSError:
+            return None
+        response = FileResponse(fh, content_type=CONTENT_TYPE, filename=name)
+        if encoding:
+            response["Content-Encoding"] = encoding
+    response["ETag"] = etag
+    response["Vary"] = "Accept-Encoding"
+    return response
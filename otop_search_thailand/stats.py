@@ -0,0 +1,85 @@
+"""Materialized catalogue statistics for the home page.
+
+``rebuild_stats`` runs the aggregate queries once and stores the result in the
+single ``CatalogueStats`` row, tagged with the data version it describes. The
+importer rebuilds it after every import. Any other change bumps the data
+version; reads never write, so until the next rebuild ``get_stats`` computes
+the stats in memory, once per data version in each worker.
+"""
+
+from django.db.models import Count, F
+
+from .models import CatalogueStats, Product, Province
+from .versioning import VersionedValue, get_data_version
+
+TOP_N = 8
+
+
+def compute_stats(version=None):
+    """An unsaved ``CatalogueStats`` row for ``version`` (the current one by default)."""
+    if version is None:
+        version = get_data_version(fresh=True)
+    top_categories = list(
+        Product.objects.exclude(category="")
+        .values("category")
+        .annotate(c=Count("id"))
+        .order_by("-c", "category")[:TOP_N]
+    )
+    province_counts = list(
+        Province.objects.order_by("-product_count", "name").values(
+            "name", "slug", product_total=F("product_count")
+        )
+    )
+    top_products = [
+        {
+            "name": name,
+            "province": province,
+            "province_slug": slug,
+            "category": category,
+            "rating": float(rating or 0),
+            "image_url": image_url,
+        }
+        for name, province, slug, category, rating, image_url in Product.objects.order_by(
+            "-rating", "name"
+        ).values_list(
+            "name", "province__name", "province__slug", "category", "rating", "image_url"
+        )[
+            :TOP_N
+        ]
+    ]
+    return CatalogueStats(
+        pk=1,
+        version=version,
+        total_products=Product.objects.count(),
+        total_provinces=len(province_counts),
+        top_categories=top_categories,
+        province_counts=province_counts,
+        top_products=top_products,
+    )
+
+
+def rebuild_stats(version=None):
+    stats = compute_stats(version)
+    stats.save()
+    return stats
+
+
+_computed = VersionedValue(compute_stats)
+
+
+def _stored_stats():
+    stats = CatalogueStats.objects.filter(pk=1).first()
+    # A row newer than this worker's memoized version is fine too
+    if stats is not None and stats.version >= get_data_version():
+        return stats
+    return None
+
+
+def get_stats():
+    """Stats for the current data version: the stored row unless it is stale."""
+    return _stored_stats() or _computed.get()
+
+
+def refresh_stats():
+    """Like ``get_stats``, but a stale row is rebuilt and stored."""
+    return _stored_stats() or rebuild_stats()
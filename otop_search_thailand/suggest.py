@@ -0,0 +1,99 @@
+"""Prefix autocomplete over product, province and category names.
+
+Names are normalized and kept in one sorted array, so the entries for a prefix
+are a contiguous slice found by binary search. Besides the full name, every
+later word of a name is keyed too ("Krabi Batik" is found by "bat"). The array
+is built once per catalogue data version.
+"""
+
+import heapq
+from bisect import bisect_left
+from urllib.parse import urlencode
+
+from django.db.models import Count, Max
+from django.urls import reverse
+
+from .management.commands.seed_th_provinces import TH_PROVINCES
+from .models import Product, Province
+from .search import normalize
+from .versioning import VersionedValue
+
+# Sorts after every character a prefix can continue with
+_HIGH = "\U0010ffff"
+
+
+class SuggestIndex:
+    def __init__(self, entries):
+        """``entries`` are ``(text, kind, weight, url)`` with ``weight`` in [0, 1]."""
+        self.entries = list(entries)
+        keyed = []
+        for i, (text, _, _, _) in enumerate(self.entries):
+            key = normalize(text)
+            keyed.append((key, i, True))
+            words = key.split()
+            for n in range(1, len(words)):
+                keyed.append((" ".join(words[n:]), i, False))
+        keyed.sort()
+        self.keys = [key for key, _, _ in keyed]
+        self.refs = [(i, full) for _, i, full in keyed]
+
+    def suggest(self, prefix, limit=10):
+        prefix = " ".join(normalize(prefix).split())
+        if not prefix:
+            return []
+        lo = bisect_left(self.keys, prefix)
+        hi = bisect_left(self.keys, prefix + _HIGH, lo)
+        scores = {}
+        for i, full in self.refs[lo:hi]:
+            # Matching the start of the whole name beats matching a later word
+            score = self.entries[i][2] + (1.0 if full else 0.0)
+            if score > scores.get(i, -1.0):
+                scores[i] = score
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0]))
+        return [
+            {"text": text, "type": kind, "url": url}
+            for text, kind, _, url in (self.entries[i] for i, _ in best)
+        ]
+
+
+def build_index():
+    products_url = reverse("products")
+
+    def search_url(text):
+        return f"{products_url}?{urlencode({'q': text})}"
+
+    entries = []
+    # A name shared by several provinces is suggested once, at its best rating
+    names = Product.objects.values("name").annotate(best=Max("rating")).values_list("name", "best")
+    for name, rating in names.iterator():
+        entries.append((name, "product", float(rating or 0) / 5, search_url(name)))
+
+    provinces = {
+        name: (slug, count)
+        for name, slug, count in Province.objects.annotate(c=Count("products")).values_list(
+            "name", "slug", "c"
+        )
+    }
+    top = max([count for _, count in provinces.values()] + [1])
+    for name in sorted(set(TH_PROVINCES) | set(provinces)):
+        slug, count = provinces.get(name, (None, 0))
+        url = reverse("province_detail", args=[slug]) if slug else search_url(name)
+        entries.append((name, "province", count / top, url))
+
+    categories = list(
+        Product.objects.exclude(category="")
+        .values("category")
+        .annotate(c=Count("id"))
+        .values_list("category", "c")
+    )
+    top = max([count for _, count in categories] + [1])
+    for category, count in categories:
+        entries.append((category, "category", count / top, search_url(category)))
+    return SuggestIndex(entries)
+
+
+_index = VersionedValue(build_index)
+
+
+def suggest(prefix, limit=10):
+    return _index.get().suggest(prefix, limit)
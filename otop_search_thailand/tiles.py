@@ -0,0 +1,70 @@
+"""Per-tile GeoJSON for slippy maps.
+
+Tiles are cut from the cluster index on first request and kept in a
+byte-bounded LRU cache. A tile's content only changes with the catalogue data
+version, so the whole cache is dropped when the version moves on.
+"""
+
+import json
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .clustering import MAX_ZOOM, get_index
+from .versioning import get_data_version
+
+_lock = threading.Lock()
+_tiles = OrderedDict()
+_state = {"version": None, "bytes": 0}
+
+
+def _max_bytes():
+    return int(getattr(settings, "OTOP_TILE_CACHE_BYTES", 32 * 1024 * 1024))
+
+
+def validate_tile(z, x, y):
+    if not 0 <= z <= MAX_ZOOM:
+        raise ValueError(f"z must be between 0 and {MAX_ZOOM}")
+    if not (0 <= x < 1 << z and 0 <= y < 1 << z):
+        raise ValueError("tile x/y out of range for zoom")
+
+
+def render_tile(z, x, y):
+    features = list(get_index().tile_features(z, x, y))
+    data = {"type": "FeatureCollection", "features": features}
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def clear_cache():
+    with _lock:
+        _tiles.clear()
+        _state["version"] = None
+        _state["bytes"] = 0
+
+
+def get_tile(z, x, y):
+    """Return ``(version, body)`` for tile ``z/x/y``, rendering it on a cache miss."""
+    validate_tile(z, x, y)
+    version = get_data_version()
+    key = (z, x, y)
+    with _lock:
+        if _state["version"] != version:
+            _tiles.clear()
+            _state["version"] = version
+            _state["bytes"] = 0
+        body = _tiles.get(key)
+        if body is not None:
+            _tiles.move_to_end(key)
+            return version, body
+
+    body = render_tile(z, x, y)
+    limit = _max_bytes()
+    with _lock:
+        if _state["version"] == version and key not in _tiles and len(body) <= limit:
+            _tiles[key] = body
+            _state["bytes"] += len(body)
+            while _state["bytes"] > limit:
+                _, evicted = _tiles.popitem(last=False)
+                _state["bytes"] -= len(evicted)
+    return version, body
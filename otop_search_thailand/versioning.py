@@ -0,0 +1,139 @@
+"""Process-wide catalogue data version.
+
+The version lives in the database (``CatalogueVersion``) so every worker sees
+bumps made by ``import_otop_json`` or the admin. Reads are memoized for
+``OTOP_DATA_VERSION_TTL`` seconds so hot paths rarely touch the database.
+"""
+
+import threading
+import time
+import weakref
+from contextlib import contextmanager, nullcontext
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import changes
+from .models import CatalogueVersion
+
+_lock = threading.Lock()
+_memo = {"version": None, "modified": None, "expires": 0.0}
+_deferred = threading.local()
+_versioned = weakref.WeakSet()
+
+
+def _ttl():
+    return float(getattr(settings, "OTOP_DATA_VERSION_TTL", 2))
+
+
+def clear_cache():
+    with _lock:
+        _memo["version"] = None
+        _memo["modified"] = None
+        _memo["expires"] = 0.0
+        values = list(_versioned)
+    for value in values:
+        value.clear()
+
+
+def _read(fresh):
+    now = time.monotonic()
+    with _lock:
+        if not fresh and _memo["version"] is not None and now < _memo["expires"]:
+            return _memo["version"], _memo["modified"]
+    try:
+        row = CatalogueVersion.objects.filter(pk=1).values_list("version", "updated_at").first()
+    except DatabaseError:
+        # Table not migrated yet (cold start); treat as the empty catalogue
+        row = None
+    version, modified = row or (0, None)
+    with _lock:
+        _memo["version"] = version
+        _memo["modified"] = modified
+        _memo["expires"] = now + _ttl()
+    return version, modified
+
+
+def get_data_version(fresh=False):
+    return _read(fresh)[0]
+
+
+def get_data_modified(fresh=False):
+    """When the data version last changed; None before the first bump."""
+    return _read(fresh)[1]
+
+
+def bump_data_version(stamp=True):
+    """Increment the catalogue version and return the new value.
+
+    ``stamp`` assigns change-log rows recorded without a version (by the batch
+    importer or inside ``deferred_bumps``) to the new one. The save signals
+    record theirs after the bump, already stamped, and pass False.
+    """
+    if getattr(_deferred, "depth", 0):
+        _deferred.pending = True
+        return None
+    modified = timezone.now()
+    with transaction.atomic() if stamp else nullcontext():
+        updated = CatalogueVersion.objects.filter(pk=1).update(
+            version=F("version") + 1, updated_at=modified
+        )
+        if updated:
+            version = CatalogueVersion.objects.values_list("version", flat=True).get(pk=1)
+        else:
+            row = CatalogueVersion.objects.create(pk=1, version=1)
+            version, modified = row.version, row.updated_at
+        if stamp:
+            changes.stamp(version)
+        changes.compact(version)
+    clear_cache()
+    with _lock:
+        _memo["version"] = version
+        _memo["modified"] = modified
+        _memo["expires"] = time.monotonic() + _ttl()
+    return version
+
+
+@contextmanager
+def deferred_bumps(discard=False):
+    """Collapse the bumps made inside the block (e.g. by save signals) into one.
+
+    With ``discard`` the pending bump is dropped, for callers that bump themselves.
+    """
+    _deferred.depth = getattr(_deferred, "depth", 0) + 1
+    try:
+        yield
+    finally:
+        _deferred.depth -= 1
+        if not _deferred.depth and getattr(_deferred, "pending", False):
+            _deferred.pending = False
+            if not discard:
+                bump_data_version()
+
+
+class VersionedValue:
+    """A process-local value built by ``build()`` and rebuilt when the data version changes."""
+
+    def __init__(self, build):
+        self.build = build
+        self._lock = threading.Lock()
+        self._cache = (None, None)
+        with _lock:
+            _versioned.add(self)
+
+    def get(self):
+        version = get_data_version()
+        cached_version, value = self._cache
+        if value is not None and cached_version == version:
+            return value
+        with self._lock:
+            cached_version, value = self._cache
+            if value is None or cached_version != version:
+                value = self.build()
+                self._cache = (version, value)
+            return value
+
+    def clear(self):
+        self._cache = (None, None)
@@ -1,42 +1,75 @@
 import os
-from functools import lru_cache
 
 from django.conf import settings
-from django.db import models
-from django.db.models import Count
-from django.http import HttpResponse, JsonResponse
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseNotModified,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404, render
 
+from . import metrics
+from .caching import cache_policy, cached_view
+from .catalogue import get_catalogue, store_enabled
+from .changes import changes_since
+from .clustering import MAX_ZOOM, get_index
+from .downloads import file_response
+from .geo import bbox_q, geohash_q, parse_bbox, sampled
 from .models import Product, Province
+from .nearby import nearby
+from .pagination import estimated_count, keyset_page, keyset_window
+from .search import filter_products, search_products
+from .serializers import (
+    PRODUCT_JSON_LOOKUPS,
+    PRODUCT_LOOKUPS,
+    iter_products_geojson,
+    iter_products_json,
+    located,
+    parse_fields,
+    product_row_to_dict,
+)
+from .snapshots import etag_matches, snapshot_response
+from .stats import TOP_N, get_stats
+from .suggest import suggest
+from .tiles import get_tile
+from .versioning import VersionedValue, get_data_version
 
 
 # ---------- Home / About ----------
 def healthz(request):
-    return JsonResponse({"status": "ok"})
+    payload = {"status": "ok"}
+    if store_enabled():
+        # Per-worker footprint of the in-memory catalogue
+        payload["catalogue"] = get_catalogue().report()
+    return JsonResponse(payload)
 
 
-def home(request):
-    total_products = Product.objects.count()
-    total_provinces = Province.objects.count()
-    top_categories = (
-        Product.objects.values('category')
-        .exclude(category="")
-        .annotate(c=Count('id'))
-        .order_by('-c')[:8]
+def metrics_view(request):
+    """This worker's request histograms in the Prometheus text format."""
+    # Unauthorized scrapers see no endpoint at all
+    if not metrics.enabled() or not metrics.authorized(request):
+        raise Http404
+    return HttpResponse(
+        metrics.registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
     )
-    top_provinces = Province.objects.annotate(product_total=Count('products')).order_by(
-        '-product_total', 'name'
-    )[:8]
-    top_products = Product.objects.order_by('-rating', 'name')[:8]
+
+
+@cache_policy("home")
+@cached_view("home", timeout=600)
+def home(request):
+    stats = get_catalogue().stats() if store_enabled() else get_stats()
     return render(
         request,
         "home.html",
         {
-            "total_products": total_products,
-            "total_provinces": total_provinces,
-            "top_categories": top_categories,
-            "top_provinces": top_provinces,
-            "top_products": top_products,
+            "total_products": stats.total_products,
+            "total_provinces": stats.total_provinces,
+            "top_categories": stats.top_categories,
+            "top_provinces": stats.province_counts[:TOP_N],
+            "top_products": stats.top_products,
         },
     )
 
@@ -46,28 +79,89 @@ def about(request):
 
 
 # ---------- Products / Provinces ----------
+# Exact catalogue size, recounted only when the data version changes
+_product_total = VersionedValue(lambda: Product.objects.count())
+
+LIST_PAGE_SIZE = 50
+MAX_SEARCH_PAGE = 100
+
+
+def _page_url(request, **params):
+    query = request.GET.copy()
+    for key in ("after", "before", "page"):
+        query.pop(key, None)
+    for key, value in params.items():
+        if value:
+            query[key] = value
+    return f"?{query.urlencode()}"
+
+
+def _keyset_context(request, queryset, ordering):
+    """Page ``queryset`` by ``?after=``/``?before=`` cursors; None for a bad cursor."""
+    try:
+        products, prev_cursor, next_cursor = keyset_window(
+            queryset,
+            ordering,
+            request.GET.get("after"),
+            request.GET.get("before"),
+            limit=LIST_PAGE_SIZE,
+            key=lambda p: [getattr(p, f.lstrip("-")) for f in ordering],
+        )
+    except ValueError:
+        return None
+    return {
+        "products": products,
+        "prev_url": _page_url(request, before=prev_cursor) if prev_cursor else None,
+        "next_url": _page_url(request, after=next_cursor) if next_cursor else None,
+    }
+
+
+@cache_policy("products_list")
 def products_list(request):
-    qs = Product.objects.select_related("province").order_by("name")
     q = request.GET.get("q", "").strip()
     if q:
-        qs = qs.filter(
-            models.Q(name__icontains=q)
-            | models.Q(province__name__icontains=q)
-            | models.Q(category__icontains=q)
-            | models.Q(description__icontains=q)
+        # Relevance-ranked; every whitespace-separated term must match
+        try:
+            page = min(max(int(request.GET.get("page", 1)), 1), MAX_SEARCH_PAGE)
+        except ValueError:
+            page = 1
+        offset = (page - 1) * LIST_PAGE_SIZE
+        products = search_products(q, limit=LIST_PAGE_SIZE + 1, offset=offset)
+        has_next = len(products) > LIST_PAGE_SIZE and page < MAX_SEARCH_PAGE
+        total, estimated = estimated_count(filter_products(Product.objects.all(), q))
+        context = {
+            "products": products[:LIST_PAGE_SIZE],
+            "prev_url": _page_url(request, page=page - 1) if page > 1 else None,
+            "next_url": _page_url(request, page=page + 1) if has_next else None,
+        }
+    else:
+        context = _keyset_context(
+            request, Product.objects.select_related("province"), ("name", "id")
         )
-    return render(request, "products_list.html", {"products": qs, "q": q})
+        if context is None:
+            return HttpResponseBadRequest("Invalid cursor")
+        total, estimated = _product_total.get(), False
+    context.update(q=q, total=total, estimated=estimated)
+    return render(request, "products_list.html", context)
 
 
+@cache_policy("province_list")
+@cached_view("province_list", timeout=600)
 def province_list(request):
-    provinces = Province.objects.annotate(product_total=Count("products")).order_by("name")
+    provinces = Province.objects.order_by("name")
     return render(request, "provinces.html", {"provinces": provinces})
 
 
+@cache_policy("province_detail")
+@cached_view("province_detail", timeout=600)
 def province_detail(request, slug):
     province = get_object_or_404(Province, slug=slug)
-    products = Product.objects.filter(province=province).order_by("-rating", "name")
-    return render(request, "province_detail.html", {"province": province, "products": products})
+    products = Product.objects.filter(province=province)
+    context = _keyset_context(request, products, ("-rating", "name", "id"))
+    if context is None:
+        return HttpResponseBadRequest("Invalid cursor")
+    context.update(province=province, total=province.product_count, estimated=False)
+    return render(request, "province_detail.html", context)
 
 
 # ---------- Search + Map ----------
@@ -92,62 +186,337 @@ def map_view(request):
 
 
 # ---------- APIs ----------
+@cache_policy("api_products_json")
 def api_products_json(request):
-    data = [
-        {
-            "name": p.name,
-            "province": p.province.name,
-            "category": p.category,
-            "rating": float(p.rating or 0),
-            "address": p.address,
-            "phone": p.phone,
-            "lat": float(p.latitude) if p.latitude is not None else None,
-            "lng": float(p.longitude) if p.longitude is not None else None,
-            "description": p.description,
-            "image_url": p.image_url,
-        }
-        for p in Product.objects.select_related("province").all()
-    ]
-    return JsonResponse(data, safe=False)
+    response = snapshot_response(request, "products.json")
+    if response is not None:
+        return response
+    rows = None
+    if store_enabled():
+        catalogue = get_catalogue()
+        rows = catalogue.rows(range(len(catalogue)), PRODUCT_JSON_LOOKUPS)
+    return StreamingHttpResponse(
+        iter_products_json(rows=rows), content_type="application/json; charset=utf-8"
+    )
 
 
+@cache_policy("api_products_geojson")
 def api_products_geojson(request):
-    feats = []
-    for p in Product.objects.select_related("province").all():
-        if p.latitude is None or p.longitude is None:
-            continue
-        feats.append(
+    """All products as GeoJSON; ``?bbox=minLng,minLat,maxLng,maxLat`` and ``?limit=`` narrow it."""
+    if request.GET.get("bbox", "").strip() or request.GET.get("limit", "").strip():
+        return _filtered_geojson(request)
+    # The whole feed comes from its snapshot or is streamed; it is too large to cache
+    response = snapshot_response(request, "products.geojson")
+    if response is not None:
+        return response
+    if store_enabled():
+        return _catalogue_geojson("", "")
+    return StreamingHttpResponse(
+        iter_products_geojson(), content_type="application/json; charset=utf-8"
+    )
+
+
+@cached_view("api_products_geojson", max_bytes=2 * 1024 * 1024)
+def _filtered_geojson(request):
+    raw_bbox = request.GET.get("bbox", "").strip()
+    raw_limit = request.GET.get("limit", "").strip()
+    if store_enabled():
+        return _catalogue_geojson(raw_bbox, raw_limit)
+    qs = Product.objects.filter(located())
+    try:
+        if raw_bbox:
+            bbox = parse_bbox(raw_bbox)
+            # The geohash ranges narrow the scan via the index; bbox_q trims the edges
+            qs = qs.filter(geohash_q(bbox) & bbox_q(bbox, lat="lat", lng="lng"))
+        if raw_limit:
+            limit = int(raw_limit)
+            if limit < 1:
+                raise ValueError("limit must be positive")
+            qs = sampled(qs)[:limit]
+        else:
+            qs = qs.order_by("id")
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return StreamingHttpResponse(
+        iter_products_geojson(qs), content_type="application/json; charset=utf-8"
+    )
+
+
+def _catalogue_geojson(raw_bbox, raw_limit):
+    catalogue = get_catalogue()
+    try:
+        positions = catalogue.within(parse_bbox(raw_bbox)) if raw_bbox else catalogue.located()
+        if raw_limit:
+            limit = int(raw_limit)
+            if limit < 1:
+                raise ValueError("limit must be positive")
+            positions = catalogue.sample(positions, limit)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return StreamingHttpResponse(
+        iter_products_geojson(rows=catalogue.rows(positions, PRODUCT_JSON_LOOKUPS)),
+        content_type="application/json; charset=utf-8",
+    )
+
+
+WORLD_BBOX = (-180.0, -90.0, 180.0, 90.0)
+
+
+@cache_policy("api_clusters")
+def api_clusters(request):
+    """Clustered map markers as GeoJSON for ``?zoom=`` and ``?bbox=minLng,minLat,maxLng,maxLat``."""
+    try:
+        zoom = int(request.GET.get("zoom", 0))
+        if not 0 <= zoom <= MAX_ZOOM:
+            raise ValueError(f"zoom must be between 0 and {MAX_ZOOM}")
+        raw_bbox = request.GET.get("bbox", "").strip()
+        bbox = parse_bbox(raw_bbox) if raw_bbox else WORLD_BBOX
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    features = list(get_index().features(zoom, bbox))
+    return JsonResponse(
+        {"type": "FeatureCollection", "features": features},
+        json_dumps_params={"ensure_ascii": False},
+    )
+
+
+TILE_MAX_AGE = 300
+TILE_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def api_tile(request, z, x, y):
+    """GeoJSON for slippy-map tile ``z/x/y``; clusters at low zoom, products when apart.
+
+    Tiles only change with the data version (sent as ``X-Data-Version``). A
+    request carrying the current version as ``?v=`` is cacheable forever.
+    """
+    try:
+        version, body = get_tile(z, x, y)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    etag = f"{version}.{z}.{x}.{y}"
+    if etag_matches(request, etag):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type="application/geo+json; charset=utf-8")
+    if request.GET.get("v") == str(version):
+        response["Cache-Control"] = f"public, max-age={TILE_IMMUTABLE_MAX_AGE}, immutable"
+    else:
+        response["Cache-Control"] = f"public, max-age={TILE_MAX_AGE}"
+    response["ETag"] = f'"{etag}"'
+    response["X-Data-Version"] = str(version)
+    return response
+
+
+SUGGEST_SIZE = 10
+MAX_SUGGEST_SIZE = 20
+
+
+@cache_policy("api_suggest")
+def api_suggest(request):
+    """Prefix suggestions over product, province and category names: ``?q=&limit=``."""
+    try:
+        limit = min(max(int(request.GET.get("limit", SUGGEST_SIZE)), 1), MAX_SUGGEST_SIZE)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    q = request.GET.get("q", "")
+    return JsonResponse(
+        {"query": q, "results": suggest(q, limit)}, json_dumps_params={"ensure_ascii": False}
+    )
+
+
+# DataTables column data -> ORM lookup
+DATATABLES_COLUMNS = {
+    "name": "name",
+    "province": "province__name",
+    "category": "category",
+    "rating": "rating",
+}
+DATATABLES_MAX_LENGTH = 100
+
+
+@cache_policy("api_products_datatables")
+def api_products_datatables(request):
+    """DataTables server-side processing: ``draw``, ``start``, ``length``, ``search``, ``order``."""
+    params = request.GET
+    try:
+        draw = int(params.get("draw", 0))
+        start = max(int(params.get("start", 0)), 0)
+        length = int(params.get("length", 10))
+        if not 1 <= length <= DATATABLES_MAX_LENGTH:
+            # -1 ("show all") included: the point is to never send the whole table
+            length = DATATABLES_MAX_LENGTH
+        ordering = []
+        i = 0
+        while f"order[{i}][column]" in params:
+            column = int(params[f"order[{i}][column]"])
+            data = params.get(f"columns[{column}][data]", "")
+            if data not in DATATABLES_COLUMNS:
+                raise ValueError(f"Unknown column: {data}")
+            prefix = "-" if params.get(f"order[{i}][dir]") == "desc" else ""
+            ordering.append(prefix + DATATABLES_COLUMNS[data])
+            i += 1
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    total = _product_total.get()
+    qs = Product.objects.all()
+    query = params.get("search[value]", "").strip()
+    if query:
+        qs = filter_products(qs, query)
+        filtered = qs.count()
+    else:
+        filtered = total
+    keys = list(DATATABLES_COLUMNS)
+    rows = qs.order_by(*ordering, "id").values_list(*DATATABLES_COLUMNS.values())
+    return JsonResponse(
+        {
+            "draw": draw,
+            "recordsTotal": total,
+            "recordsFiltered": filtered,
+            "data": [product_row_to_dict(row, keys) for row in rows[start : start + length]],
+        },
+        json_dumps_params={"ensure_ascii": False},
+    )
+
+
+NEARBY_SIZE = 10
+MAX_NEARBY_SIZE = 100
+
+
+@cache_policy("api_products_nearby")
+def api_products_nearby(request):
+    """Products nearest to ``?lat=&lng=``, limited by ``k`` and optional ``radius_km``."""
+    try:
+        lat = float(request.GET["lat"])
+        lng = float(request.GET["lng"])
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            raise ValueError("lat/lng out of range")
+        k = min(max(int(request.GET.get("k", NEARBY_SIZE)), 1), MAX_NEARBY_SIZE)
+        radius_km = request.GET.get("radius_km")
+        if radius_km is not None:
+            radius_km = float(radius_km)
+            if not radius_km > 0:
+                raise ValueError("radius_km must be positive")
+    except KeyError:
+        return JsonResponse({"error": "lat and lng are required"}, status=400)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return JsonResponse(
+        {"results": nearby(lat, lng, k, radius_km)}, json_dumps_params={"ensure_ascii": False}
+    )
+
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+@cache_policy("api_products_page")
+@cached_view("api_products_page")
+def api_products_page(request):
+    """Keyset-paginated products with ``?fields=`` projection.
+
+    Query: ``cursor``, ``limit``, ``fields``, ``province`` (slug), ``category``.
+    """
+    try:
+        keys = parse_fields(request.GET.get("fields", ""))
+        limit = min(max(int(request.GET.get("limit", PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    slug = request.GET.get("province", "").strip()
+    category = request.GET.get("category", "").strip()
+    if store_enabled():
+        catalogue = get_catalogue()
+        try:
+            positions, next_cursor = catalogue.page(
+                catalogue.where(slug, category), request.GET.get("cursor"), limit
+            )
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        rows = catalogue.rows(positions, [PRODUCT_LOOKUPS[k] for k in keys])
+        return JsonResponse(
             {
-                "type": "Feature",
-                "geometry": {
-                    "type": "Point",
-                    "coordinates": [float(p.longitude), float(p.latitude)],
-                },
-                "properties": {
-                    "name": p.name,
-                    "province": p.province.name,
-                    "category": p.category,
-                    "rating": float(p.rating or 0),
-                    "image_url": p.image_url,
-                    "address": p.address,
-                    "phone": p.phone,
-                },
-            }
+                "results": [product_row_to_dict(row, keys) for row in rows],
+                "next_cursor": next_cursor,
+            },
+            json_dumps_params={"ensure_ascii": False},
         )
-    return JsonResponse({"type": "FeatureCollection", "features": feats})
 
+    qs = Product.objects.all()
+    if slug:
+        province_id = Province.objects.filter(slug=slug).values_list("id", flat=True).first()
+        qs = qs.filter(province_id=province_id)
+    if category:
+        qs = qs.filter(category=category)
 
-@lru_cache(maxsize=1)
-def _cached_file_bytes(mtime):
-    with open(settings.OTOP_JSON_PATH, 'rb') as f:
-        return f.read()
+    # name and id always travel along for the cursor
+    qs = qs.values_list(*(PRODUCT_LOOKUPS[k] for k in keys), "name", "id")
+    try:
+        rows, next_cursor = keyset_page(
+            qs, ("name", "id"), request.GET.get("cursor"), limit, key=lambda row: row[-2:]
+        )
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return JsonResponse(
+        {
+            "results": [product_row_to_dict(row[:-2], keys) for row in rows],
+            "next_cursor": next_cursor,
+        },
+        json_dumps_params={"ensure_ascii": False},
+    )
+
+
+@cache_policy("api_products_changes")
+def api_products_changes(request):
+    """Products inserted, updated and deleted since data version ``?since=``.
+
+    ``fields`` projects the returned products as in ``/api/products/``. When the
+    change log no longer covers ``since`` the answer is ``"resync": true`` and
+    the client should download ``/api/products.json`` again.
+    """
+    try:
+        since = int(request.GET["since"])
+        if since < 0:
+            raise ValueError("since must not be negative")
+        keys = parse_fields(request.GET.get("fields", ""))
+    except KeyError:
+        return JsonResponse({"error": "since is required"}, status=400)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    if "id" not in keys:
+        keys = ["id", *keys]
+
+    version = get_data_version()
+    delta = changes_since(since, version)
+    if delta is None:
+        return JsonResponse({"version": version, "since": since, "resync": True})
+    inserted, updated, deleted = delta
+    rows = (
+        Product.objects.filter(id__in=inserted + updated)
+        .order_by("id")
+        .values_list(*(PRODUCT_LOOKUPS[k] for k in keys))
+    )
+    return JsonResponse(
+        {
+            "version": version,
+            "since": since,
+            "resync": False,
+            "inserted": inserted,
+            "updated": updated,
+            "deleted": deleted,
+            "products": [product_row_to_dict(row, keys) for row in rows],
+        },
+        json_dumps_params={"ensure_ascii": False},
+    )
 
 
 def api_file_json(request):
+    """The raw feed at ``OTOP_JSON_PATH``, streamed from disk with Range and sidecar support."""
     path = getattr(settings, 'OTOP_JSON_PATH', None)
-    if not path or not os.path.exists(path):
+    try:
+        return file_response(request, path, "application/json; charset=utf-8", "otop.json")
+    except (OSError, TypeError):
         return JsonResponse(
             {"error": "OTOP_JSON_PATH not configured or file not found"}, status=404
         )
-    mtime = os.path.getmtime(path)
-    return HttpResponse(_cached_file_bytes(mtime), content_type='application/json; charset=utf-8')
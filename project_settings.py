@@ -1,3 +1,4 @@
+import json
 import os
 from pathlib import Path
 
@@ -56,6 +57,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'otop_search_thailand.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -69,7 +71,8 @@ ROOT_URLCONF = 'urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that reports render time in Server-Timing
+        'BACKEND': 'otop_search_thailand.metrics.TimedTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -140,3 +143,67 @@ _default_otop_json = BASE_DIR / 'otop.json'
 OTOP_JSON_PATH = os.environ.get('OTOP_JSON_PATH') or (
     str(_default_otop_json) if _default_otop_json.exists() else ''
 )
+
+# Pre-serialized API snapshots (python manage.py build_snapshots). On serverless
+# only /tmp is writable.
+_is_serverless = bool(os.environ.get('VERCEL') or os.environ.get('AWS_LAMBDA_FUNCTION_NAME'))
+OTOP_SNAPSHOT_DIR = os.environ.get('OTOP_SNAPSHOT_DIR') or (
+    '/tmp/otop-snapshots' if _is_serverless else str(BASE_DIR / 'snapshots')
+)
+
+# SQLite database built by `python manage.py build_db_snapshot`. On cold start
+# api/wsgi.py copies it into place ('copy') or opens it read-only ('immutable').
+OTOP_DB_SNAPSHOT = os.environ.get('OTOP_DB_SNAPSHOT') or str(BASE_DIR / 'data' / 'otop.sqlite3')
+OTOP_DB_SNAPSHOT_MODE = os.environ.get('OTOP_DB_SNAPSHOT_MODE', 'copy')
+
+# Seconds a worker may reuse the catalogue data version before re-reading it
+OTOP_DATA_VERSION_TTL = float(os.environ.get('OTOP_DATA_VERSION_TTL', '2'))
+
+# Upper bound for the in-process cache of rendered map tiles (/api/tiles/z/x/y)
+OTOP_TILE_CACHE_BYTES = int(os.environ.get('OTOP_TILE_CACHE_BYTES', str(32 * 1024 * 1024)))
+
+# 'memory' answers the read-only APIs and home page from a per-worker columnar
+# copy of the catalogue (otop_search_thailand.catalogue) instead of the ORM
+OTOP_CATALOGUE_STORE = os.environ.get('OTOP_CATALOGUE_STORE', '')
+
+# Product search backend: auto, fts5 (SQLite), pg_trgm (Postgres) or memory
+OTOP_SEARCH_BACKEND = os.environ.get('OTOP_SEARCH_BACKEND', 'auto')
+
+# Backend of the data-version keyed response cache (otop_search_thailand.caching):
+# locmem (per process), file (shared by the workers on one host) or redis (any
+# Redis-compatible server at OTOP_CACHE_URL, shared by every host)
+_cache_backend = os.environ.get('OTOP_CACHE_BACKEND', 'locmem')
+_cache_options = {'MAX_ENTRIES': int(os.environ.get('OTOP_CACHE_MAX_ENTRIES', '1000'))}
+if _cache_backend == 'redis':
+    _cache = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('OTOP_CACHE_URL', 'redis://127.0.0.1:6379/1'),
+    }
+elif _cache_backend == 'file':
+    _cache = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('OTOP_CACHE_DIR')
+        or ('/tmp/otop-cache' if _is_serverless else str(BASE_DIR / 'cache')),
+        'OPTIONS': _cache_options,
+    }
+else:
+    _cache = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'otop',
+        'OPTIONS': _cache_options,
+    }
+CACHES = {'default': _cache}
+OTOP_VIEW_CACHE = os.environ.get('OTOP_VIEW_CACHE', '1').lower() in ('1', 'true', 'yes', 'on')
+
+# Cache-Control per route name for the catalogue views, e.g.
+# {"home": {"max_age": 0, "s_maxage": 600, "stale_while_revalidate": 86400}};
+# "default" covers pages and "api" the JSON APIs (otop_search_thailand.caching)
+OTOP_CACHE_POLICIES = json.loads(os.environ.get('OTOP_CACHE_POLICIES') or '{}')
+# Part of every ETag, so a new deploy never revalidates pages rendered by the old one
+OTOP_RELEASE = os.environ.get('OTOP_RELEASE') or os.environ.get('VERCEL_GIT_COMMIT_SHA', '')[:12]
+# Data versions the /api/products/changes log reaches back; older clients resync
+OTOP_CHANGE_LOG_VERSIONS = int(os.environ.get('OTOP_CHANGE_LOG_VERSIONS', '500'))
+# Server-Timing headers and /metrics (otop_search_thailand.metrics)
+OTOP_METRICS = os.environ.get('OTOP_METRICS', '1').lower() in ('1', 'true', 'yes', 'on')
+# Bearer token for /metrics; without one it is only served with DEBUG on
+OTOP_METRICS_TOKEN = os.environ.get('OTOP_METRICS_TOKEN', '')
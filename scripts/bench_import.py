@@ -0,0 +1,69 @@
+"""Compare the batch and row import paths of ``import_otop_json``.
+
+Runs against a throwaway test database created from the configured backend, so
+it is safe to point at Supabase/Postgres via DATABASE_URL.
+
+    python scripts/bench_import.py [path/to/otop.json] [--batch-size 500]
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+
+import django
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project_settings')
+django.setup()
+
+from django.core.management import call_command  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+
+from otop_search_thailand.models import Product, Province  # noqa: E402
+
+
+def run(path, mode, batch_size):
+    started = time.perf_counter()
+    call_command(
+        'import_otop_json',
+        '-i',
+        path,
+        '--mode',
+        mode,
+        '--batch-size',
+        str(batch_size),
+        stdout=io.StringIO(),
+    )
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path', nargs='?', default=os.path.join(PROJECT_ROOT, 'otop.json'))
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, keepdb=False)
+    try:
+        for mode in ('row', 'batch'):
+            Product.objects.all().delete()
+            Province.objects.all().delete()
+            insert = run(args.path, mode, args.batch_size)
+            update = run(args.path, mode, args.batch_size)
+            print(
+                f'{mode:>5}: insert {insert:7.2f}s  re-import {update:7.2f}s  '
+                f'rows={Product.objects.count()}'
+            )
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
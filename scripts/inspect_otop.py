@@ -1,37 +1,19 @@
-import json
+import os
+import sys
+from itertools import islice
 from pathlib import Path
 
-path = Path(r'D:\Django\otop\otop.json')
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from otop_search_thailand.readers import iter_records  # noqa: E402
+
+path = Path(sys.argv[1] if len(sys.argv) > 1 else r'D:\Django\otop\otop.json')
 if not path.exists():
     print('FILE_NOT_FOUND', path)
     raise SystemExit(1)
 
-with path.open('rb') as f:
-    raw = f.read()
-try:
-    s = raw.decode('utf-8')
-except Exception:
-    try:
-        s = raw.decode('latin-1')
-    except Exception:
-        s = raw.decode('utf-8', errors='replace')
-
-data = json.loads(s)
-if isinstance(data, dict):
-    # try to find list container
-    for k in ('items', 'products', 'data', 'results'):
-        if k in data and isinstance(data[k], list):
-            data = data[k]
-            break
-    else:
-        # find first list value
-        for v in data.values():
-            if isinstance(v, list):
-                data = v
-                break
-
-print('TOTAL_ITEMS', len(data) if isinstance(data, list) else 1)
-
 
 def show_item(i, item):
     print('\n--- ITEM', i, '---')
@@ -42,8 +24,9 @@ def show_item(i, item):
         print('NON_DICT_ITEM:', repr(item)[:200])
 
 
-if isinstance(data, list):
-    for i, item in enumerate(data[:5], start=1):
-        show_item(i, item)
-else:
-    show_item(1, data)
+# Stream the records so large feeds never have to fit in memory
+records = iter_records(path)
+head = list(islice(records, 5))
+for i, item in enumerate(head, start=1):
+    show_item(i, item)
+print('\nTOTAL_ITEMS', len(head) + sum(1 for _ in records))
@@ -9,9 +9,15 @@ document.addEventListener('DOMContentLoaded', () => {
   const $ = window.jQuery;
   const table = document.getElementById('otopTable');
   if (table && $ && $.fn.dataTable) {
+    // Server-paged tables hold one page only: sort it, but leave paging to the server
+    const serverPaged = table.hasAttribute('data-server-paged');
     $(table).DataTable({
       pageLength: 10,
       lengthMenu: [10, 25, 50, 100],
+      paging: !serverPaged,
+      searching: !serverPaged,
+      info: !serverPaged,
+      order: serverPaged ? [] : [[0, 'asc']],
       language: { url: "https://cdn.datatables.net/plug-ins/1.13.7/i18n/th.json" }
     });
   }
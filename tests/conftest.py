@@ -0,0 +1,17 @@
+import pytest
+from django.core.cache import cache
+
+from otop_search_thailand import tiles, versioning
+
+
+@pytest.fixture(autouse=True)
+def _fresh_data_version():
+    # Transactions roll back between tests, so the memoized version and the
+    # caches keyed by it must too
+    for module in (versioning, tiles):
+        module.clear_cache()
+    cache.clear()
+    yield
+    for module in (versioning, tiles):
+        module.clear_cache()
+    cache.clear()
@@ -0,0 +1,348 @@
+import io
+import json
+from decimal import Decimal
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+
+from otop_search_thailand import geo
+from otop_search_thailand.geo import geohash_cover, geohash_encode, geohash_q
+from otop_search_thailand.models import CatalogueStats, Product, Province
+
+
+def _content(response):
+    if response.streaming:
+        return b"".join(response.streaming_content)
+    return response.content
+
+
+@pytest.fixture
+def catalogue(db):
+    krabi = Province.objects.create(name="กระบี่")
+    surin = Province.objects.create(name="สุรินทร์")
+    Product.objects.create(
+        name="เค้กสินโอชา",
+        province=krabi,
+        category="อาหาร",
+        rating=Decimal("4.5"),
+        phone="075-612246",
+        latitude=Decimal("8.064682"),
+        longitude=Decimal("98.915269"),
+    )
+    Product.objects.create(name="ผ้าไหม", province=surin, category="ผ้า")
+    return [krabi, surin]
+
+
+def test_products_json_streams_current_fields(client, catalogue):
+    r = client.get("/api/products.json")
+    assert r.status_code == 200
+    data = json.loads(_content(r))
+    assert data == [
+        {
+            "name": "เค้กสินโอชา",
+            "province": "กระบี่",
+            "category": "อาหาร",
+            "rating": 4.5,
+            "address": "",
+            "phone": "075-612246",
+            "lat": 8.064682,
+            "lng": 98.915269,
+            "description": "",
+            "image_url": None,
+        },
+        {
+            "name": "ผ้าไหม",
+            "province": "สุรินทร์",
+            "category": "ผ้า",
+            "rating": 0.0,
+            "address": "",
+            "phone": "",
+            "lat": None,
+            "lng": None,
+            "description": "",
+            "image_url": None,
+        },
+    ]
+
+
+@pytest.mark.django_db
+def test_products_json_empty(client):
+    assert json.loads(_content(client.get("/api/products.json"))) == []
+
+
+def test_products_json_chunk_boundaries(catalogue):
+    from otop_search_thailand.serializers import iter_products_json
+
+    chunks = list(iter_products_json(chunk_size=1))
+    assert len(chunks) == 4
+    assert [p["name"] for p in json.loads("".join(chunks))] == ["เค้กสินโอชา", "ผ้าไหม"]
+
+
+def test_products_page_walks_keyset_cursor(client, catalogue):
+    krabi, surin = catalogue
+    for i in range(5):
+        Product.objects.create(name=f"ขนม {i}", province=krabi, category="อาหาร")
+    names, cursor = [], None
+    while True:
+        params = {"limit": 2, "fields": "name,province"}
+        if cursor:
+            params["cursor"] = cursor
+        data = client.get("/api/products/", params).json()
+        assert all(set(item) == {"name", "province"} for item in data["results"])
+        names += [item["name"] for item in data["results"]]
+        cursor = data["next_cursor"]
+        if not cursor:
+            break
+    assert names == sorted(Product.objects.values_list("name", flat=True))
+
+
+def test_products_page_filters_and_errors(client, catalogue):
+    krabi, surin = catalogue
+    data = client.get("/api/products/", {"province": surin.slug, "fields": "name,lat"}).json()
+    assert data == {"results": [{"name": "ผ้าไหม", "lat": None}], "next_cursor": None}
+    data = client.get("/api/products/", {"category": "อาหาร", "fields": "rating"}).json()
+    assert data["results"] == [{"rating": 4.5}]
+    assert client.get("/api/products/", {"fields": "secret"}).status_code == 400
+    assert client.get("/api/products/", {"cursor": "!!"}).status_code == 400
+
+
+def test_geojson_bbox_and_sampling(client, catalogue):
+    krabi, _ = catalogue
+    for i in range(6):
+        Product.objects.create(name=f"p{i}", province=krabi, latitude=14 + i, longitude=100 + i)
+
+    def names(params):
+        data = json.loads(_content(client.get("/api/products.geojson", params)))
+        return [f["properties"]["name"] for f in data["features"]]
+
+    assert names({"bbox": "98,7,99,9"}) == ["เค้กสินโอชา"]
+    assert sorted(names({"bbox": "100,14,102.5,16.5"})) == ["p0", "p1", "p2"]
+    sample = names({"limit": 3})
+    assert len(sample) == 3 and sample == names({"limit": 3})
+    assert names({"limit": 2}) == sample[:2]
+    assert client.get("/api/products.geojson", {"bbox": "1,2,3"}).status_code == 400
+
+
+def test_geohash_cover_contains_bbox_points(catalogue):
+    assert geohash_encode(57.64911, 10.40744) == "u4pruydqq"
+    cake = Product.objects.get(name="เค้กสินโอชา")
+    assert (cake.lat, cake.lng, cake.geohash) == (
+        8.064682,
+        98.915269,
+        geohash_encode(8.064682, 98.915269),
+    )
+    assert Product.objects.get(name="ผ้าไหม").geohash == ""
+
+    bbox = (98.9, 8.0, 99.0, 8.1)
+    cover = geohash_cover(bbox)
+    assert 1 <= len(cover) <= 16 and any(cake.geohash.startswith(p) for p in cover)
+    assert list(Product.objects.filter(geohash_q(bbox)).values_list("name", flat=True)) == [
+        "เค้กสินโอชา"
+    ]
+    # Ranges end at the next base32 prefix, which every collation orders alike
+    assert [geo._prefix_end(p) for p in ("u4pr", "u4pz", "zz")] == ["u4ps", "u4q", ""]
+    # Boxes across the antimeridian are covered on both sides
+    cover = geohash_cover((179.5, -1, -179.5, 1))
+    assert geohash_encode(0, 179.9)[: len(cover[0])] in cover
+    assert geohash_encode(0, -179.9)[: len(cover[0])] in cover
+
+    cake.longitude = Decimal("98.5")
+    cake.save(update_fields=["longitude"])
+    cake.refresh_from_db()
+    assert cake.lng == 98.5 and cake.geohash == geohash_encode(8.064682, 98.5)
+
+
+def test_clusters_split_with_zoom_and_follow_data_version(client, catalogue):
+    krabi, _ = catalogue
+    for i in range(3):
+        Product.objects.create(name=f"c{i}", province=krabi, latitude=14 + i / 100, longitude=100)
+
+    def features(zoom, bbox="97,5,106,21"):
+        r = client.get("/api/clusters.geojson", {"zoom": zoom, "bbox": bbox})
+        return r.json()["features"]
+
+    low = features(3)
+    assert sorted(f["properties"]["count"] for f in low) == [1, 3]
+    cluster = next(f for f in low if f["properties"]["cluster"])
+    assert 3 < cluster["properties"]["expansion_zoom"] <= 16
+    points = features(16)
+    assert len(points) == 4 and not any(f["properties"]["cluster"] for f in points)
+    assert {f["properties"]["name"] for f in features(16, "97,7,99,9")} == {"เค้กสินโอชา"}
+
+    Product.objects.create(name="c3", province=krabi, latitude=14.005, longitude=100)
+    assert sorted(f["properties"]["count"] for f in features(3)) == [1, 4]
+    assert client.get("/api/clusters.geojson", {"zoom": 30}).status_code == 400
+
+
+def test_tiles_cached_until_data_version_changes(client, catalogue, settings):
+    from otop_search_thailand import tiles
+
+    # z=6 tile holding the Krabi product
+    r = client.get("/api/tiles/6/49/30")
+    assert r.status_code == 200
+    names = [f["properties"].get("name") for f in json.loads(r.content)["features"]]
+    assert names == ["เค้กสินโอชา"]
+    version = r["X-Data-Version"]
+    assert r["Cache-Control"] == "public, max-age=300"
+    assert list(tiles._tiles) == [(6, 49, 30)]
+
+    assert client.get("/api/tiles/6/49/30", HTTP_IF_NONE_MATCH=r["ETag"]).status_code == 304
+    r = client.get("/api/tiles/6/49/30", {"v": version})
+    assert "immutable" in r["Cache-Control"]
+
+    # Least recently used tiles go first once the byte budget is exceeded
+    settings.OTOP_TILE_CACHE_BYTES = len(r.content) + 10
+    assert json.loads(client.get("/api/tiles/6/0/0").content)["features"] == []
+    assert list(tiles._tiles) == [(6, 0, 0)]
+
+    krabi, _ = catalogue
+    Product.objects.create(name="ใหม่", province=krabi, latitude=8.1, longitude=98.9)
+    r = client.get("/api/tiles/6/49/30")
+    assert r["X-Data-Version"] != version
+    assert json.loads(r.content)["features"][0]["properties"]["count"] == 2
+    assert client.get("/api/tiles/2/4/0").status_code == 400
+
+
+def test_suggest_prefixes_ranked_by_weight(client, catalogue):
+    krabi, surin = catalogue
+    Product.objects.create(name="ผ้าทอ", province=surin, category="ผ้า", rating=Decimal("3"))
+    Product.objects.create(name="ผ้าบาติก", province=krabi, category="ผ้า", rating=Decimal("5"))
+    Product.objects.create(name="Krabi Batik", province=krabi, category="ผ้า")
+
+    def suggest(q, **params):
+        data = client.get("/api/suggest", {"q": q, **params}).json()
+        return [(s["type"], s["text"]) for s in data["results"]]
+
+    assert suggest("ผ้า") == [
+        ("product", "ผ้าบาติก"),
+        ("category", "ผ้า"),
+        ("product", "ผ้าทอ"),
+        ("product", "ผ้าไหม"),
+    ]
+    assert suggest("ผ้า", limit=1) == [("product", "ผ้าบาติก")]
+    assert suggest("bat") == [("product", "Krabi Batik")]
+    # All 77 provinces are suggested, with a page link once they exist
+    assert suggest("กระ") == [("province", "กระบี่")]
+    assert suggest("ชลบุ") == [("province", "ชลบุรี")]
+    result = client.get("/api/suggest", {"q": "สุริ"}).json()["results"][0]
+    assert result["url"] == reverse("province_detail", args=[surin.slug])
+    assert suggest("") == []
+
+
+def test_datatables_server_side(client, catalogue):
+    krabi, _ = catalogue
+    for i in range(3):
+        Product.objects.create(name=f"ขนม {i}", province=krabi, category="อาหาร", rating=i)
+    base = {
+        "draw": 3,
+        "columns[0][data]": "name",
+        "columns[1][data]": "province",
+        "columns[2][data]": "category",
+        "columns[3][data]": "rating",
+    }
+
+    data = client.get(
+        "/api/products/datatables",
+        {**base, "start": 1, "length": 2, "order[0][column]": 3, "order[0][dir]": "desc"},
+    ).json()
+    assert (data["draw"], data["recordsTotal"], data["recordsFiltered"]) == (3, 5, 5)
+    assert [row["name"] for row in data["data"]] == ["ขนม 2", "ขนม 1"]
+    assert set(data["data"][0]) == {"name", "province", "category", "rating"}
+
+    data = client.get(
+        "/api/products/datatables",
+        {**base, "search[value]": "ขนม", "order[0][column]": 0, "length": -1},
+    ).json()
+    assert data["recordsFiltered"] == 3
+    assert [row["name"] for row in data["data"]] == ["ขนม 0", "ขนม 1", "ขนม 2"]
+
+    bad = {**base, "order[0][column]": 9}
+    assert client.get("/api/products/datatables", bad).status_code == 400
+
+
+def test_html_lists_are_paginated(client, catalogue, monkeypatch):
+    from otop_search_thailand import views
+
+    krabi, _ = catalogue
+    monkeypatch.setattr(views, "LIST_PAGE_SIZE", 2)
+    for i in range(4):
+        Product.objects.create(name=f"ขนม {i}", province=krabi, rating=i)
+
+    def walk(url, params=None):
+        pages = []
+        r = client.get(url, params)
+        while True:
+            products = list(r.context["products"])
+            pages.append([p.name for p in products])
+            if not r.context["next_url"]:
+                return pages, r
+            r = client.get(url + r.context["next_url"])
+
+    pages, last = walk("/products/")
+    assert [n for page in pages for n in page] == sorted(
+        Product.objects.values_list("name", flat=True)
+    )
+    assert all(len(page) <= 2 for page in pages) and last.context["total"] == 6
+    back = client.get("/products/" + last.context["prev_url"])
+    assert [p.name for p in back.context["products"]] == pages[-2]
+
+    pages, _ = walk(f"/provinces/{krabi.slug}/")
+    assert pages == [["เค้กสินโอชา", "ขนม 3"], ["ขนม 2", "ขนม 1"], ["ขนม 0"]]
+
+    pages, _ = walk("/products/", {"q": "ขนม"})
+    assert sorted(n for page in pages for n in page) == [f"ขนม {i}" for i in range(4)]
+    assert client.get("/products/", {"after": "!!"}).status_code == 400
+
+
+def test_home_reads_materialized_stats(client, catalogue, django_assert_num_queries):
+    krabi, _ = catalogue
+    call_command("rebuild_stats", stdout=io.StringIO())
+    # The data version is memoized, leaving a single read of the stats row
+    with django_assert_num_queries(1):
+        r = client.get("/")
+    assert (r.context["total_products"], r.context["total_provinces"]) == (2, 2)
+    assert r.context["top_products"][0]["name"] == "เค้กสินโอชา"
+    assert r.context["top_provinces"][0]["product_total"] == 1
+
+    Product.objects.create(name="ขนม", province=krabi, category="อาหาร")
+    r = client.get("/")
+    assert r.context["total_products"] == 3
+    assert r.context["top_categories"][0] == {"category": "อาหาร", "c": 2}
+    assert r.context["top_provinces"][0]["name"] == "กระบี่"
+    # A read leaves the stale row for the next rebuild to replace
+    assert CatalogueStats.objects.get().total_products == 2
+
+
+def test_kdtree_matches_brute_force():
+    import random
+
+    from otop_search_thailand.nearby import KDTree, chord_to_km, haversine_km, to_vector
+
+    rng = random.Random(7)
+    coords = [(rng.uniform(5, 21), rng.uniform(97, 106)) for _ in range(500)]
+    tree = KDTree([(to_vector(lat, lng), i) for i, (lat, lng) in enumerate(coords)])
+    for lat, lng in [(13.75, 100.5), (18.8, 98.98), (7.0, 100.0)]:
+        expected = sorted(range(len(coords)), key=lambda i: haversine_km(lat, lng, *coords[i]))
+        found = tree.nearest(to_vector(lat, lng), 5)
+        assert [i for _, i in found] == expected[:5]
+        d = haversine_km(lat, lng, *coords[expected[0]])
+        assert abs(chord_to_km(found[0][0]) - d) < 1e-6
+
+
+def test_nearby_endpoint(client, catalogue):
+    krabi, _ = catalogue
+    Product.objects.create(name="ใกล้", province=krabi, latitude=8.07, longitude=98.92)
+    Product.objects.create(name="ไกล", province=krabi, latitude=13.75, longitude=100.5)
+
+    def names(**params):
+        data = client.get("/api/products/nearby", params).json()
+        return [(r["name"], r["distance_km"]) for r in data["results"]]
+
+    results = names(lat=8.065, lng=98.915, k=2)
+    assert [n for n, _ in results] == ["เค้กสินโอชา", "ใกล้"]
+    assert results[0][1] < 0.1 < results[1][1] < 2
+    assert [n for n, _ in names(lat=8.065, lng=98.915, radius_km=5)] == ["เค้กสินโอชา", "ใกล้"]
+    assert len(names(lat=8.065, lng=98.915, k=10)) == 3
+    assert client.get("/api/products/nearby", {"lat": 8}).status_code == 400
+    assert client.get("/api/products/nearby", {"lat": 95, "lng": 0}).status_code == 400
@@ -0,0 +1,145 @@
+import threading
+import time
+
+import pytest
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory
+
+from otop_search_thailand import caching
+from otop_search_thailand.caching import cached_view
+from otop_search_thailand.models import Product, Province
+from otop_search_thailand.versioning import get_data_version
+
+
+@pytest.fixture
+def province(db):
+    province = Province.objects.create(name="กระบี่")
+    Product.objects.create(name="เค้กสินโอชา", province=province)
+    return province
+
+
+def test_pages_cached_until_data_version_changes(client, province):
+    url = f"/provinces/{province.slug}/"
+    assert client.get(url)["X-Cache"] == "MISS"
+    r = client.get(url)
+    assert r["X-Cache"] == "HIT" and "เค้กสินโอชา" in r.content.decode()
+    assert client.get(url, {"after": "x"})["X-Cache"] == "MISS"
+
+    Product.objects.create(name="ผ้าบาติก", province=province)
+    r = client.get(url)
+    assert r["X-Cache"] == "MISS" and "ผ้าบาติก" in r.content.decode()
+    assert client.get("/api/products/")["X-Cache"] == "MISS"
+    assert client.get("/api/products/")["X-Cache"] == "HIT"
+
+
+def test_errors_and_large_bodies_are_not_stored(client, province, settings):
+    assert client.get("/api/products/", {"cursor": "!!"}).status_code == 400
+    assert client.get("/api/products/", {"cursor": "!!"})["X-Cache"] == "MISS"
+
+    view = cached_view("big", max_bytes=10)(lambda request: HttpResponse(b"x" * 11))
+    request = RequestFactory().get("/big")
+    assert view(request)["X-Cache"] == "MISS"
+    assert view(request)["X-Cache"] == "MISS"
+
+    settings.OTOP_VIEW_CACHE = False
+    assert not client.get("/").has_header("X-Cache")
+
+
+def test_only_one_worker_rebuilds(db):
+    calls = []
+
+    @cached_view("slow")
+    def slow(request):
+        calls.append(1)
+        time.sleep(0.2)
+        return HttpResponse(b"done")
+
+    # Read the version here, so the threads never need a database connection
+    get_data_version()
+    responses = []
+    factory = RequestFactory()
+    threads = [
+        threading.Thread(target=lambda: responses.append(slow(factory.get("/slow"))))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert sorted(r["X-Cache"] for r in responses) == ["HIT"] * 4 + ["MISS"]
+    assert {r.content for r in responses} == {b"done"}
+
+
+def test_stale_copy_served_while_another_worker_rebuilds(db):
+    body = [b"v1"]
+    view = cached_view("stale", timeout=0.1)(lambda request: HttpResponse(body[0]))
+    request = RequestFactory().get("/stale")
+    view(request)
+    time.sleep(0.15)
+    body[0] = b"v2"
+
+    key = caching._cache_key("stale", request)
+    cache.add(key + ":lock", 1, 30)
+    r = view(request)
+    assert r["X-Cache"] == "STALE" and r.content == b"v1"
+    cache.delete(key + ":lock")
+    r = view(request)
+    assert r["X-Cache"] == "MISS" and r.content == b"v2"
+
+
+def test_stale_page_carries_no_validators(client, province):
+    r = client.get("/provinces/")
+    Province.objects.create(name="ชลบุรี")
+    key = caching._cache_key("province_list", RequestFactory().get("/provinces/"))
+    cache.add(key + ":lock", 1, 30)
+
+    stale = client.get("/provinces/", HTTP_IF_NONE_MATCH=r["ETag"])
+    assert stale.status_code == 200 and stale["X-Cache"] == "STALE"
+    assert "ชลบุรี" not in stale.content.decode()
+    assert stale["Cache-Control"] == "private, no-store"
+    assert not stale.has_header("ETag") and not stale.has_header("Last-Modified")
+
+    cache.delete(key + ":lock")
+    fresh = client.get("/provinces/")
+    assert fresh["X-Cache"] == "MISS" and "ชลบุรี" in fresh.content.decode()
+    assert fresh["ETag"] != r["ETag"] and "public" in fresh["Cache-Control"]
+
+
+def test_file_backend(client, province, settings, tmp_path):
+    settings.CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": str(tmp_path / "cache"),
+        }
+    }
+    assert client.get("/provinces/")["X-Cache"] == "MISS"
+    assert client.get("/provinces/")["X-Cache"] == "HIT"
+    assert any((tmp_path / "cache").iterdir())
+
+
+@pytest.mark.parametrize("url", ["/", "/products/", "/provinces/", "/api/products.json"])
+def test_conditional_get_skips_the_database(client, province, url, django_assert_num_queries):
+    r = client.get(url)
+    assert r["ETag"] and r.has_header("Last-Modified")
+    assert "s-maxage=300" in r["Cache-Control"] and "stale-while-revalidate" in r["Cache-Control"]
+
+    with django_assert_num_queries(0):
+        assert client.get(url, HTTP_IF_NONE_MATCH=r["ETag"]).status_code == 304
+        not_modified = client.get(url, HTTP_IF_MODIFIED_SINCE=r["Last-Modified"])
+    assert not_modified.status_code == 304 and not_modified["ETag"] == r["ETag"]
+
+    Product.objects.create(name="ผ้าบาติก", province=province)
+    assert client.get(url, HTTP_IF_NONE_MATCH=r["ETag"]).status_code == 200
+
+
+def test_cache_policy_per_route(client, province, settings):
+    settings.OTOP_CACHE_POLICIES = {"province_detail": {"max_age": 30, "s_maxage": 3600}}
+    settings.OTOP_RELEASE = "abc123"
+    r = client.get(f"/provinces/{province.slug}/")
+    assert r["Cache-Control"] == "public, max-age=30, s-maxage=3600"
+    assert r["ETag"].endswith('.abc123"')
+    assert "max-age=60" in client.get("/api/products/")["Cache-Control"]
+    # Errors are not cacheable by the CDN
+    assert not client.get("/api/products/", {"cursor": "!!"}).has_header("Cache-Control")
@@ -0,0 +1,106 @@
+from decimal import Decimal
+
+import pytest
+
+from otop_search_thailand import catalogue
+from otop_search_thailand.models import Product, Province
+
+
+@pytest.fixture(autouse=True)
+def uncached(settings):
+    # Both stores answer the same URLs, which the response cache would conflate
+    settings.OTOP_VIEW_CACHE = False
+
+
+@pytest.fixture(params=["python", "numpy"])
+def vectorized(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(catalogue, "np", None)
+
+
+@pytest.fixture
+def products(db):
+    provinces = [Province.objects.create(name=name) for name in ("กระบี่", "สุรินทร์", "น่าน")]
+    Province.objects.create(name="ตาก")
+    for i in range(12):
+        # Names repeat across provinces, so paging has to break ties by id
+        Product.objects.create(
+            name=f"สินค้า {i % 4}",
+            province=provinces[i % 3],
+            category=["ผ้า", "อาหาร", ""][i % 3],
+            rating=Decimal(i % 6),
+            latitude=Decimal(7 + i) if i % 4 else None,
+            longitude=Decimal(98 + i / 2) if i % 4 else None,
+            image_url=f"https://example.com/{i}.jpg" if i % 2 else None,
+        )
+
+
+def _both(client, settings, path, params=None):
+    """The response body from the ORM and from the in-memory catalogue."""
+    bodies = []
+    for store in ("", "memory"):
+        settings.OTOP_CATALOGUE_STORE = store
+        response = client.get(path, params or {})
+        content = b"".join(response.streaming_content) if response.streaming else response.content
+        bodies.append((response.status_code, content))
+    return bodies
+
+
+@pytest.mark.parametrize(
+    "path, params",
+    [
+        ("/api/products.json", {}),
+        ("/api/products.geojson", {}),
+        ("/api/products.geojson", {"bbox": "98,8,102,14"}),
+        ("/api/products.geojson", {"bbox": "98,8,102,14", "limit": 3}),
+        ("/api/products.geojson", {"limit": 4}),
+        ("/api/products.geojson", {"bbox": "1,2,3"}),
+        ("/api/products/", {"limit": 5}),
+        ("/api/products/", {"limit": 2, "category": "ผ้า", "fields": "name,rating,lat"}),
+        ("/api/products/", {"province": "สุรินทร์", "limit": 100}),
+        ("/api/products/", {"province": "nowhere"}),
+        ("/api/products/", {"cursor": "!!"}),
+    ],
+)
+def test_store_matches_orm(client, settings, products, vectorized, path, params):
+    orm, memory = _both(client, settings, path, params)
+    assert orm == memory
+
+
+def test_store_walks_the_same_pages(client, settings, products, vectorized):
+    cursors = {"": None, "memory": None}
+    for _ in range(4):
+        pages = []
+        for store in cursors:
+            settings.OTOP_CATALOGUE_STORE = store
+            params = {"limit": 4, "category": "ผ้า"}
+            if cursors[store]:
+                params["cursor"] = cursors[store]
+            data = client.get("/api/products/", params).json()
+            cursors[store] = data["next_cursor"]
+            pages.append(data)
+        assert pages[0] == pages[1]
+
+
+def test_store_serves_home_stats_without_queries(
+    client, settings, products, vectorized, django_assert_num_queries
+):
+    orm = client.get("/").context
+    settings.OTOP_CATALOGUE_STORE = "memory"
+    catalogue.get_catalogue()
+    with django_assert_num_queries(0):
+        memory = client.get("/").context
+    for key in ("total_products", "total_provinces", "top_categories", "top_provinces"):
+        assert orm[key] == memory[key]
+    assert orm["top_products"] == memory["top_products"]
+
+
+def test_store_reloads_on_data_version_and_reports_memory(client, settings, products):
+    settings.OTOP_CATALOGUE_STORE = "memory"
+    report = client.get("/healthz").json()["catalogue"]
+    assert report["products"] == 12 and report["bytes"] > 0
+
+    Product.objects.filter(name="สินค้า 0").first().delete()
+    assert client.get("/healthz").json()["catalogue"]["products"] == 11
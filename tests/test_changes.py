@@ -0,0 +1,134 @@
+import json
+
+import pytest
+from django.core.management import call_command
+
+from otop_search_thailand.models import Product, Province
+from otop_search_thailand.versioning import get_data_version
+
+
+@pytest.fixture
+def province(db):
+    return Province.objects.create(name="กระบี่")
+
+
+def _changes(client, since, **params):
+    r = client.get("/api/products/changes", {"since": since, **params})
+    assert r.status_code == 200
+    return r.json()
+
+
+def test_saves_and_deletes(client, province):
+    cake = Product.objects.create(name="เค้ก", province=province)
+    snack = Product.objects.create(name="ขนม", province=province)
+    since = get_data_version()
+
+    cake.rating = 4.5
+    cake.save()
+    snack_pk = snack.pk
+    snack.delete()
+    cloth = Product.objects.create(name="ผ้า", province=province, lat=8.06, lng=98.91)
+    gone = Product.objects.create(name="ชั่วคราว", province=province)
+    gone.delete()
+
+    data = _changes(client, since, fields="name,rating")
+    assert data["version"] == get_data_version() and not data["resync"]
+    assert (data["inserted"], data["updated"]) == ([cloth.pk], [cake.pk])
+    # Created and deleted since the client last looked: nothing to tell it
+    assert data["deleted"] == [snack_pk]
+    assert data["products"] == [
+        {"id": cake.pk, "name": "เค้ก", "rating": 4.5},
+        {"id": cloth.pk, "name": "ผ้า", "rating": 0.0},
+    ]
+    assert _changes(client, data["version"])["products"] == []
+
+
+def test_province_rename_updates_its_products(client, province):
+    product = Product.objects.create(name="เค้ก", province=province)
+    since = get_data_version()
+    province.name = "จังหวัดกระบี่"
+    province.save()
+    data = _changes(client, since, fields="province")
+    assert data["updated"] == [product.pk]
+    assert data["products"] == [{"id": product.pk, "province": "จังหวัดกระบี่"}]
+
+
+def test_batch_import(client, db, tmp_path):
+    path = tmp_path / "otop.json"
+
+    def run(records, *args):
+        path.write_text(json.dumps(records, ensure_ascii=False), encoding="utf-8")
+        call_command("import_otop_json", "-i", str(path), "--mode", "batch", "--delta", *args)
+
+    run([{"name": "เค้ก", "province": "กระบี่"}, {"name": "ขนม", "province": "กระบี่"}])
+    assert sorted(_changes(client, 0)["inserted"]) == sorted(
+        Product.objects.values_list("id", flat=True)
+    )
+
+    since = get_data_version()
+    run(
+        [
+            {"name": "เค้ก", "province": "กระบี่", "rating": 5},
+            {"name": "ผ้า", "province": "กระบี่"},
+        ],
+        "--prune",
+    )
+    data = _changes(client, since)
+    cake, cloth = Product.objects.get(name="เค้ก"), Product.objects.get(name="ผ้า")
+    assert (data["inserted"], data["updated"]) == ([cloth.pk], [cake.pk])
+    assert len(data["deleted"]) == 1 and not Product.objects.filter(pk__in=data["deleted"])
+
+    # Unchanged rows are not reported again
+    since = get_data_version()
+    run(
+        [
+            {"name": "เค้ก", "province": "กระบี่", "rating": 5},
+            {"name": "ผ้า", "province": "กระบี่", "category": "ผ้า"},
+        ]
+    )
+    data = _changes(client, since)
+    assert (data["inserted"], data["updated"], data["deleted"]) == ([], [cloth.pk], [])
+
+
+def test_batch_reimport_logs_nothing(client, db, tmp_path):
+    path = tmp_path / "otop.json"
+    records = [
+        {"name": "เค้ก", "province": "กระบี่", "rating": 4.5, "lat": 8.06, "lng": 98.91},
+        {"name": "ขนม", "province": "กระบี่", "price": 12.5},
+        # Repeated in a later chunk with the values it already has
+        {"name": "เค้ก", "province": "กระบี่", "rating": 4.5},
+    ]
+    path.write_text(json.dumps(records, ensure_ascii=False), encoding="utf-8")
+
+    def run():
+        call_command(
+            "import_otop_json", "-i", str(path), "--mode", "batch", "--batch-size", "2", "--force"
+        )
+
+    run()
+    assert len(_changes(client, 0)["inserted"]) == 2
+    since = get_data_version()
+    run()
+    data = _changes(client, since)
+    assert (data["inserted"], data["updated"], data["deleted"]) == ([], [], [])
+
+
+def test_resync_when_log_does_not_reach(client, province, settings):
+    settings.OTOP_CHANGE_LOG_VERSIONS = 2
+    for i in range(4):
+        Product.objects.create(name=f"สินค้า {i}", province=province)
+    version = get_data_version()
+    assert _changes(client, version - 2)["inserted"]
+    assert _changes(client, version - 3) == {
+        "version": version,
+        "since": version - 3,
+        "resync": True,
+    }
+    assert _changes(client, version + 1)["resync"]
+
+
+def test_bad_requests(client, db):
+    assert client.get("/api/products/changes").status_code == 400
+    assert client.get("/api/products/changes", {"since": "-1"}).status_code == 400
+    assert client.get("/api/products/changes", {"since": "x"}).status_code == 400
+    assert client.get("/api/products/changes", {"since": 0, "fields": "nope"}).status_code == 400
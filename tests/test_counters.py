@@ -0,0 +1,82 @@
+import io
+
+import pytest
+from django.core.management import CommandError, call_command
+
+from otop_search_thailand.models import Product, Province
+
+
+def _counters(province):
+    province.refresh_from_db()
+    return province.product_count, province.category_counts
+
+
+@pytest.mark.django_db
+def test_signals_keep_counters_current():
+    krabi = Province.objects.create(name="กระบี่")
+    surin = Province.objects.create(name="สุรินทร์")
+    cake = Product.objects.create(name="เค้ก", province=krabi, category="อาหาร")
+    Product.objects.create(name="ขนม", province=krabi, category="อาหาร")
+    assert _counters(krabi) == (2, {"อาหาร": 2})
+
+    cake.category = "ของฝาก"
+    cake.save()
+    assert _counters(krabi) == (2, {"อาหาร": 1, "ของฝาก": 1})
+
+    cake.province = surin
+    cake.save()
+    assert _counters(krabi) == (1, {"อาหาร": 1})
+    assert _counters(surin) == (1, {"ของฝาก": 1})
+
+    cake.delete()
+    assert _counters(surin) == (0, {})
+
+
+@pytest.mark.django_db
+def test_save_skips_index_upkeep_when_indexed_fields_stay(django_assert_num_queries):
+    krabi = Province.objects.create(name="กระบี่")
+    Product.objects.create(name="เค้ก", province=krabi, category="อาหาร")
+    cake = Product.objects.get(name="เค้ก")
+    cake.rating = 4
+    # The product UPDATE, the version bump (UPDATE + SELECT) and its change-log row
+    with django_assert_num_queries(4):
+        cake.save()
+
+    # Moved through another instance: after a refresh the row is re-read before counting
+    other = Product.objects.get(pk=cake.pk)
+    other.category = "ของฝาก"
+    other.save()
+    cake.refresh_from_db()
+    cake.category = "ผ้า"
+    cake.save()
+    assert _counters(krabi) == (1, {"ผ้า": 1})
+
+
+@pytest.mark.django_db
+def test_checker_reports_and_fixes_drift():
+    krabi = Province.objects.create(name="กระบี่")
+    Product.objects.create(name="เค้ก", province=krabi, category="อาหาร")
+    out = io.StringIO()
+    call_command("check_province_counters", stdout=out)
+    assert "consistent" in out.getvalue()
+
+    # Queryset updates bypass the signals
+    Product.objects.update(category="ของฝาก")
+    with pytest.raises(CommandError):
+        call_command("check_province_counters", stdout=io.StringIO())
+    call_command("check_province_counters", "--fix", stdout=io.StringIO())
+    assert _counters(krabi) == (1, {"ของฝาก": 1})
+
+
+@pytest.mark.django_db
+def test_import_recounts_in_batch(tmp_path, capsys):
+    path = tmp_path / "otop.json"
+    path.write_text(
+        '[{"name": "ผ้าไหม", "province": "สุรินทร์", "category": "ผ้า"},'
+        ' {"name": "ผ้าทอ", "province": "สุรินทร์", "category": "ผ้า"},'
+        ' {"name": "ข้าวหลาม", "province": "ชลบุรี"}]',
+        encoding="utf-8",
+    )
+    call_command("import_otop_json", "-i", str(path))
+    assert _counters(Province.objects.get(name="สุรินทร์")) == (2, {"ผ้า": 2})
+    assert _counters(Province.objects.get(name="ชลบุรี")) == (1, {"": 1})
@@ -0,0 +1,94 @@
+import json
+import sqlite3
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.db import connections
+
+from otop_search_thailand.dbsnapshot import missing_migrations, use_db_snapshot
+from otop_search_thailand.models import Product, Province
+
+pytestmark = pytest.mark.django_db(transaction=True)
+
+
+@pytest.fixture
+def snapshot(tmp_path, settings):
+    province = Province.objects.create(name="กระบี่")
+    Product.objects.create(name="เค้กสินโอชา", province=province, latitude=8.06, longitude=98.91)
+    settings.OTOP_DB_SNAPSHOT = str(tmp_path / "otop.sqlite3")
+    call_command("build_db_snapshot")
+    return settings.OTOP_DB_SNAPSHOT
+
+
+@pytest.fixture
+def alias(tmp_path):
+    connections.settings["snapshot"] = dict(
+        connections.settings["default"], NAME=str(tmp_path / "work.sqlite3"), OPTIONS={}
+    )
+    yield "snapshot"
+    connections["snapshot"].close()
+    del connections["snapshot"]
+    del connections.settings["snapshot"]
+
+
+def _connect(alias):
+    # Bypass the test case's guard on undeclared aliases; the settings are what matter
+    wrapper = connections[alias]
+    return wrapper.get_new_connection(wrapper.get_connection_params())
+
+
+def test_snapshot_is_migrated_and_analyzed(snapshot):
+    assert missing_migrations(snapshot) == set()
+    conn = sqlite3.connect(snapshot)
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM sqlite_stat1").fetchone()[0] > 0
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize("mode", ["copy", "immutable"])
+def test_cold_start_uses_snapshot(snapshot, alias, settings, mode):
+    settings.OTOP_DB_SNAPSHOT_MODE = mode
+    assert use_db_snapshot(alias)
+    conn = _connect(alias)
+    try:
+        rows = conn.execute(f"SELECT name FROM {Product._meta.db_table}").fetchall()
+        assert rows == [("เค้กสินโอชา",)]
+        assert conn.execute("PRAGMA mmap_size").fetchone()[0] > 0
+    finally:
+        conn.close()
+
+
+def test_stale_schema_is_not_used(snapshot, alias):
+    conn = sqlite3.connect(snapshot)
+    conn.execute("DELETE FROM django_migrations WHERE app = 'otop_search_thailand'")
+    conn.commit()
+    conn.close()
+    assert missing_migrations(snapshot)
+    assert not use_db_snapshot(alias)
+
+
+def test_seed_then_snapshot(tmp_path, settings):
+    feed = tmp_path / "otop.json"
+    feed.write_text(json.dumps([{"name": "ผ้าไหม", "province": "สุรินทร์"}]), encoding="utf-8")
+    settings.OTOP_DB_SNAPSHOT = str(tmp_path / "otop.sqlite3")
+    call_command("build_db_snapshot", "--seed", str(feed))
+    conn = sqlite3.connect(settings.OTOP_DB_SNAPSHOT)
+    try:
+        rows = conn.execute(f"SELECT name FROM {Product._meta.db_table}").fetchall()
+    finally:
+        conn.close()
+    assert rows == [("ผ้าไหม",)]
+
+
+def test_skipped_on_other_backends(tmp_path, settings, monkeypatch):
+    feed = tmp_path / "otop.json"
+    feed.write_text(json.dumps([{"name": "ผ้าไหม", "province": "สุรินทร์"}]), encoding="utf-8")
+    settings.OTOP_DB_SNAPSHOT = str(tmp_path / "otop.sqlite3")
+    monkeypatch.setattr(connections["default"], "vendor", "postgresql")
+    out = StringIO()
+    call_command("build_db_snapshot", "--seed", str(feed), stdout=out)
+    assert "Skipping" in out.getvalue()
+    assert not (tmp_path / "otop.sqlite3").exists() and not Product.objects.exists()
@@ -0,0 +1,159 @@
+import json
+
+import pytest
+from django.core.management import call_command
+
+from otop_search_thailand.geo import geohash_encode
+from otop_search_thailand.importing import (
+    ImportResult,
+    import_partition,
+    partition_of,
+    write_partitions,
+)
+from otop_search_thailand.models import CatalogueStats, ImportManifest, Product
+from otop_search_thailand.versioning import get_data_version
+
+RECORDS = [
+    {"ชื่อสินค้า OTOP": "ขนมแม่สวย", "จังหวัด": "กระบี่", "เบอร์โทรศัพท์": "080-048 9899"},
+    {"ชื่อสินค้า OTOP": "เค้กสินโอชา", "จังหวัด": "กระบี่", "LAT": 8.06, "LONG": 98.91},
+    {"name": "ผ้าไหม", "province": "สุรินทร์", "category": "ผ้า", "rating": 4.5},
+    {"name": "ผ้าไหม", "province": "สุรินทร์", "price": 250},
+    "not json",
+    42,
+    {"name": "ข้าวหลาม", "province": "ชลบุรี", "rating": "bad"},
+]
+
+
+def _import(tmp_path, capsys, *args, records=RECORDS):
+    path = tmp_path / "otop.json"
+    path.write_text(json.dumps({"Sheet1": records}, ensure_ascii=False), encoding="utf-8")
+    call_command("import_otop_json", "-i", str(path), *args)
+    return capsys.readouterr().out
+
+
+def _snapshot():
+    return sorted(
+        Product.objects.values_list(
+            "name", "province__name", "category", "rating", "price", "latitude"
+        )
+    )
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("mode", ["batch", "row"])
+def test_import_modes_agree(tmp_path, capsys, mode):
+    out = _import(tmp_path, capsys, "--mode", mode, "--batch-size", "2")
+    assert "Imported 3 products. Updated 1. Skipped 3 invalid entries." in out
+    errors = [
+        json.loads(line) for line in (tmp_path / "import_errors.log").read_text().splitlines()
+    ]
+    assert [e["index"] for e in errors] == [5, 6, 7]
+    assert [e["error_type"] for e in errors] == [
+        "invalid_json_string",
+        "not_a_object",
+        "ValueError",
+    ]
+
+    silk = Product.objects.get(name="ผ้าไหม")
+    assert silk.category == "ผ้า" and float(silk.price) == 250.0
+
+    out = _import(tmp_path, capsys, "--mode", mode)
+    assert "Imported 0 products. Updated 4." in out
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("mode", ["batch", "row"])
+def test_import_fills_geo_fields(tmp_path, capsys, mode):
+    _import(tmp_path, capsys, "--mode", mode)
+    cake = Product.objects.get(name="เค้กสินโอชา")
+    assert (cake.lat, cake.lng, cake.geohash) == (8.06, 98.91, geohash_encode(8.06, 98.91))
+    assert Product.objects.get(name="ขนมแม่สวย").geohash == ""
+
+    moved = [dict(RECORDS[1], LAT=13.75, LONG=100.5)]
+    _import(tmp_path, capsys, "--mode", mode, records=moved)
+    cake.refresh_from_db()
+    assert (cake.lat, cake.lng, cake.geohash) == (13.75, 100.5, geohash_encode(13.75, 100.5))
+
+
+@pytest.mark.django_db
+def test_batch_matches_row_state(tmp_path, capsys):
+    _import(tmp_path, capsys, "--mode", "row")
+    expected = _snapshot()
+    Product.objects.all().delete()
+    _import(tmp_path, capsys, "--mode", "batch", "--batch-size", "3")
+    assert _snapshot() == expected
+
+
+@pytest.mark.django_db
+def test_dry_run_writes_nothing(tmp_path, capsys):
+    out = _import(tmp_path, capsys, "--dry-run")
+    assert "Imported 3 products. Updated 1." in out
+    assert not Product.objects.exists()
+    assert not CatalogueStats.objects.exists()
+
+
+@pytest.mark.django_db
+def test_import_refreshes_stats(tmp_path, capsys):
+    _import(tmp_path, capsys)
+    stats = CatalogueStats.objects.get()
+    assert stats.version == get_data_version(fresh=True)
+    assert (stats.total_products, stats.total_provinces) == (3, 2)
+
+
+@pytest.mark.django_db
+def test_delta_only_touches_changes(tmp_path, capsys):
+    records = [r for r in RECORDS if isinstance(r, dict)]
+    out = _import(tmp_path, capsys, "--delta", records=records)
+    assert "Imported 3 products." in out
+    assert "Source unchanged" in _import(tmp_path, capsys, "--delta", records=records)
+
+    out = _import(tmp_path, capsys, "--delta", "--force", records=records)
+    assert "Imported 0 products. Updated 0." in out
+    assert "Delta: 4 unchanged, 0 vanished, 0 deleted." in out
+    # Created outside a delta import, so it has no content hash; the feed does not list it
+    Product.objects.create(name="ข้าวหลาม", province=Product.objects.first().province)
+
+    changed = [dict(records[0], **{"เบอร์โทรศัพท์": "075-000000"})] + records[2:]
+    out = _import(tmp_path, capsys, "--delta", "--prune", records=changed)
+    assert "Imported 0 products. Updated 1." in out
+    assert "Delta: 2 unchanged, 2 vanished, 2 deleted." in out
+    assert not Product.objects.filter(name__in=["เค้กสินโอชา", "ข้าวหลาม"]).exists()
+    assert Product.objects.get(name="ขนมแม่สวย").phone == "075-000000"
+
+    manifest = ImportManifest.objects.first()
+    assert (manifest.updated, manifest.unchanged, manifest.deleted) == (1, 2, 2)
+
+
+@pytest.mark.django_db
+def test_prune_runs_on_unchanged_source(tmp_path, capsys):
+    records = [r for r in RECORDS if isinstance(r, dict)]
+    _import(tmp_path, capsys, "--delta", records=records)
+    Product.objects.create(name="ข้าวหลาม", province=Product.objects.first().province)
+
+    out = _import(tmp_path, capsys, "--delta", "--prune", records=records)
+    assert "only pruning" in out
+    assert "Imported 0 products. Updated 0." in out
+    assert "Delta: 0 unchanged, 1 vanished, 1 deleted." in out
+    assert Product.objects.count() == 3
+
+
+@pytest.mark.django_db
+def test_workers_fall_back_to_serial_on_sqlite(tmp_path, capsys):
+    out = _import(tmp_path, capsys, "--workers", "4")
+    assert "importing serially" in out
+    assert "Imported 3 products. Updated 1. Skipped 3 invalid entries." in out
+
+
+@pytest.mark.django_db
+def test_partitions_keep_provinces_together(tmp_path):
+    paths, provinces = write_partitions(RECORDS, str(tmp_path), 3)
+    assert provinces == {"กระบี่", "สุรินทร์"}
+    result = ImportResult()
+    for part, path in enumerate(paths):
+        with open(path, encoding="utf-8") as f:
+            indexes = [json.loads(line)[0] for line in f]
+        if part == partition_of("สุรินทร์", 3):
+            assert {3, 4} <= set(indexes)
+        result.merge(import_partition(path, batch_size=2))
+    assert (result.created, result.updated, result.skipped) == (3, 1, 3)
+    assert sorted(rec[0] for rec in result.errors) == [5, 6, 7]
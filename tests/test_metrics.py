@@ -0,0 +1,97 @@
+import re
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from otop_search_thailand.metrics import registry
+from otop_search_thailand.models import Product, Province
+
+TOKEN = "scrape-secret"
+
+
+@pytest.fixture(autouse=True)
+def _fresh_registry(settings):
+    settings.OTOP_VIEW_CACHE = False
+    settings.OTOP_METRICS_TOKEN = TOKEN
+    registry.clear()
+    yield
+    registry.clear()
+
+
+@pytest.fixture
+def province(db):
+    province = Province.objects.create(name="กระบี่")
+    Product.objects.create(name="เค้ก", province=province, lat=8.06, lng=98.91)
+    return province
+
+
+def _metrics(client):
+    r = client.get("/metrics", HTTP_AUTHORIZATION=f"Bearer {TOKEN}")
+    assert r.status_code == 200
+    return r.content.decode()
+
+
+def _sample(text, line):
+    match = re.search(rf"^{re.escape(line)} (\S+)$", text, re.M)
+    return float(match.group(1)) if match else None
+
+
+def test_server_timing_counts_queries(client, province):
+    with CaptureQueriesContext(connection) as context:
+        r = client.get(f"/provinces/{province.slug}/")
+    queries = len(context.captured_queries)
+    timing = r["Server-Timing"]
+    assert timing.startswith("total;dur=") and "app;dur=" in timing
+    assert f'desc="{queries} queries"' in timing
+    assert "ser;dur=" in timing and f'bytes;desc="{len(r.content)}"' in timing
+
+    text = _metrics(client)
+    view = 'view="province_detail"'
+    assert _sample(text, f'otop_requests_total{{{view},status="200"}}') == 1
+    assert _sample(text, f"otop_db_queries_sum{{{view}}}") == queries
+    assert _sample(text, f'otop_db_queries_bucket{{{view},le="100"}}') == 1
+    assert _sample(text, f"otop_response_bytes_sum{{{view}}}") == len(r.content)
+    assert _sample(text, f'otop_request_duration_seconds_bucket{{{view},le="+Inf"}}') == 1
+    # The page is a template render
+    assert _sample(text, f"otop_serialize_duration_seconds_sum{{{view}}}") > 0
+
+
+def test_streamed_feed_recorded_when_it_ends(client, province):
+    r = client.get("/api/products.json")
+    # Sent before the body is serialized
+    assert "ser;" not in r["Server-Timing"] and "bytes;" not in r["Server-Timing"]
+    text = _metrics(client)
+    assert 'otop_response_bytes_count{view="api_products_json"}' not in text
+
+    body = b"".join(r.streaming_content)
+    text = _metrics(client)
+    view = 'view="api_products_json"'
+    assert _sample(text, f"otop_serialize_duration_seconds_count{{{view}}}") == 1
+    assert _sample(text, f"otop_response_bytes_sum{{{view}}}") == len(body)
+    # The rows are fetched while the body streams
+    assert _sample(text, f"otop_db_queries_sum{{{view}}}") >= 1
+
+
+def test_unmatched_and_disabled(client, db, settings):
+    client.get("/no/such/page")
+    client.get("/wp-login.php")
+    text = _metrics(client)
+    assert _sample(text, 'otop_requests_total{view="unmatched",status="404"}') == 2
+
+    settings.OTOP_METRICS = False
+    assert not client.get("/about/").has_header("Server-Timing")
+    assert client.get("/metrics", HTTP_AUTHORIZATION=f"Bearer {TOKEN}").status_code == 404
+
+
+def test_metrics_need_the_token(client, db, settings):
+    assert client.get("/metrics").status_code == 404
+    assert client.get("/metrics", HTTP_AUTHORIZATION="Bearer wrong").status_code == 404
+    assert client.get("/metrics", HTTP_AUTHORIZATION=TOKEN).status_code == 404
+    assert "otop_requests_total" in _metrics(client)
+
+    # Without a token only a DEBUG server shows them
+    settings.OTOP_METRICS_TOKEN = ""
+    assert client.get("/metrics").status_code == 404
+    settings.DEBUG = True
+    assert client.get("/metrics").status_code == 200
@@ -0,0 +1,66 @@
+import json
+import tracemalloc
+
+import pytest
+
+from otop_search_thailand.readers import iter_records
+
+RECORDS = [{"name": "ผ้าไหม", "rating": 4.5, "LAT": 14.8818}, {"name": "ขนม", "price": 12345}]
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        RECORDS,
+        {"Sheet1": RECORDS},
+        {"meta": {"source": "x"}, "items": RECORDS, "other": [1, 2]},
+        {"meta": [1, 2], "items": RECORDS},
+        {"Sheet1": [1, 2], "results": [3], "data": RECORDS, "total": 2},
+    ],
+)
+@pytest.mark.parametrize("chunk_size", [1, 7, 64 * 1024])
+def test_wrapped_shapes(tmp_path, payload, chunk_size):
+    path = tmp_path / "otop.json"
+    path.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+    assert list(iter_records(path, chunk_size=chunk_size)) == RECORDS
+
+
+def test_object_without_list_is_one_record(tmp_path):
+    path = tmp_path / "one.json"
+    path.write_text(json.dumps(RECORDS[0]), encoding="utf-8")
+    assert list(iter_records(path, chunk_size=3)) == [RECORDS[0]]
+
+
+def test_json_lines_keeps_bad_lines(tmp_path):
+    path = tmp_path / "otop.jsonl"
+    path.write_text(json.dumps(RECORDS[0]) + "\n\n{broken\n" + json.dumps(RECORDS[1]) + "\n")
+    assert list(iter_records(path)) == [RECORDS[0], "{broken", RECORDS[1]]
+
+
+def test_unsupported_top_level(tmp_path):
+    path = tmp_path / "bad.json"
+    path.write_text("42")
+    with pytest.raises(ValueError):
+        list(iter_records(path))
+
+
+@pytest.mark.parametrize("trailer", [json.dumps(RECORDS), '{"name": "x"}', "]"])
+def test_extra_data_after_value(tmp_path, trailer):
+    path = tmp_path / "doubled.json"
+    path.write_text(json.dumps({"Sheet1": RECORDS}) + "\n" + trailer, encoding="utf-8")
+    with pytest.raises(ValueError, match="Extra data"):
+        list(iter_records(path))
+    path.write_text(json.dumps(RECORDS) + " \n\t", encoding="utf-8")
+    assert list(iter_records(path)) == RECORDS
+
+
+def test_memory_is_bounded_by_record(tmp_path):
+    path = tmp_path / "big.json"
+    record = {"name": "x" * 200, "province": "กระบี่"}
+    path.write_text(json.dumps({"Sheet1": [record] * 20000}), encoding="utf-8")
+    tracemalloc.start()
+    count = sum(1 for _ in iter_records(path))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert count == 20000
+    assert peak < path.stat().st_size / 4
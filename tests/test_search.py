@@ -0,0 +1,119 @@
+import json
+
+import pytest
+from django.core.management import call_command
+
+from otop_search_thailand import search
+from otop_search_thailand.models import Product, Province
+
+BACKENDS = ["memory", "fts5"]
+
+
+@pytest.fixture
+def products(db):
+    krabi = Province.objects.create(name="กระบี่")
+    surin = Province.objects.create(name="สุรินทร์")
+    Product.objects.create(name="ผ้าไหมมัดหมี่", province=surin, category="ผ้า")
+    Product.objects.create(
+        name="กระเป๋าสาน", province=surin, category="ของใช้", description="สานจากผ้าไหมเหลือใช้"
+    )
+    Product.objects.create(name="เค้กสินโอชา", province=krabi, category="อาหาร")
+    Product.objects.create(name="Krabi Batik", province=krabi, category="ผ้า")
+    return krabi, surin
+
+
+def _names(query, **kwargs):
+    return [p.name for p in search.search_products(query, **kwargs)]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_search_ranks_name_hits_first(products, settings, backend):
+    settings.OTOP_SEARCH_BACKEND = backend
+    assert _names("ผ้าไหม") == ["ผ้าไหมมัดหมี่", "กระเป๋าสาน"]
+    assert _names("ผ้าไหม", limit=1) == ["ผ้าไหมมัดหมี่"]
+    assert _names("สุรินทร์ สาน") == ["กระเป๋าสาน"]
+    assert _names("batik") == ["Krabi Batik"]
+    assert set(_names("ผ้")) == {"ผ้าไหมมัดหมี่", "กระเป๋าสาน", "Krabi Batik"}
+    assert _names("ไม่มีสินค้านี้") == []
+    assert _names("   ") == []
+
+
+def test_fts_index_follows_saves(products):
+    krabi, surin = products
+    assert search.get_backend().name == "fts5"
+    cake = Product.objects.get(name="เค้กสินโอชา")
+    cake.name = "เค้กมะพร้าว"
+    cake.save()
+    assert _names("มะพร้าว") == ["เค้กมะพร้าว"]
+
+    surin.name = "จังหวัดสุรินทร์"
+    surin.save()
+    assert len(_names("จังหวัดสุรินทร์")) == 2
+
+    cake.delete()
+    assert _names("มะพร้าว") == []
+
+
+def test_import_rebuilds_index_and_list_view_ranks(client, db, tmp_path, capsys):
+    path = tmp_path / "otop.json"
+    records = [
+        {"name": "ตะกร้าสาน", "province": "น่าน", "description": "ทำจากไม้ไผ่"},
+        {"name": "ไม้ไผ่แกะสลัก", "province": "น่าน"},
+    ]
+    path.write_text(json.dumps(records, ensure_ascii=False), encoding="utf-8")
+    call_command("import_otop_json", "-i", str(path), "--mode", "row")
+    assert _names("ไม้ไผ่") == ["ไม้ไผ่แกะสลัก", "ตะกร้าสาน"]
+
+    html = client.get("/products/", {"q": "ไม้ไผ่"}).content.decode()
+    assert html.index("ไม้ไผ่แกะสลัก") < html.index("ตะกร้าสาน")
+
+
+def test_import_updates_only_touched_rows(db, tmp_path, monkeypatch):
+    def rebuild(self):
+        raise AssertionError("full rebuild")
+
+    monkeypatch.setattr(search.SQLiteFTSBackend, "rebuild", rebuild)
+    path = tmp_path / "otop.json"
+
+    def run(records):
+        path.write_text(json.dumps(records, ensure_ascii=False), encoding="utf-8")
+        call_command("import_otop_json", "-i", str(path), "--delta", "--prune")
+
+    run([{"name": "ตะกร้าสาน", "province": "น่าน"}, {"name": "ผ้าทอ", "province": "น่าน"}])
+    assert sorted(_names("น่าน")) == sorted(["ตะกร้าสาน", "ผ้าทอ"])
+    run([{"name": "ตะกร้าสาน", "province": "น่าน", "category": "ไม้ไผ่"}])
+    assert _names("ไม้ไผ่") == ["ตะกร้าสาน"]
+    assert _names("ผ้าทอ") == []
+
+
+class _PostgresWithoutTrgm:
+    vendor = "postgresql"
+
+    def __init__(self):
+        self.queries = []
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.queries.append(sql)
+
+    def fetchone(self):
+        return None
+
+
+def test_pg_trgm_needs_the_extension(monkeypatch):
+    fake = _PostgresWithoutTrgm()
+    monkeypatch.setattr(search, "connection", fake)
+    monkeypatch.setitem(search.BACKENDS, "pg_trgm", search.TrigramBackend())
+    monkeypatch.setitem(search.BACKENDS, "fts5", search.SQLiteFTSBackend())
+    assert search.get_backend().name == "memory"
+    assert search.get_backend().name == "memory"
+    # The catalogue lookup is remembered
+    assert fake.queries == ["SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"]
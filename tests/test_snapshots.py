@@ -0,0 +1,119 @@
+import gzip
+import json
+
+import pytest
+from django.core.management import CommandError, call_command
+
+from otop_search_thailand.models import Product, Province
+from otop_search_thailand.versioning import get_data_version
+
+
+def _body(response):
+    return b"".join(response.streaming_content)
+
+
+@pytest.fixture
+def snapshot_dir(settings, tmp_path):
+    settings.OTOP_SNAPSHOT_DIR = str(tmp_path / "snapshots")
+    return tmp_path / "snapshots"
+
+
+@pytest.fixture
+def catalogue(db):
+    province = Province.objects.create(name="กระบี่")
+    Product.objects.create(name="เค้ก", province=province, latitude=8.06, longitude=98.91)
+    Product.objects.create(name="ขนม", province=province)
+
+
+@pytest.mark.parametrize("path", ["/api/products.json", "/api/products.geojson"])
+def test_snapshot_matches_live_output(client, catalogue, snapshot_dir, path):
+    live = _body(client.get(path))
+    call_command("build_snapshots")
+
+    r = client.get(path)
+    assert r.has_header("ETag")
+    assert _body(r) == live
+
+    r = client.get(path, HTTP_ACCEPT_ENCODING="gzip, deflate")
+    assert r["Content-Encoding"] == "gzip"
+    assert gzip.decompress(_body(r)) == live
+    assert r["Vary"] == "Accept-Encoding"
+
+    r = client.get(path, HTTP_IF_NONE_MATCH=r["ETag"])
+    assert r.status_code == 304
+
+
+def test_stale_snapshot_falls_back_to_live(client, catalogue, snapshot_dir):
+    call_command("build_snapshots")
+    version = get_data_version()
+    Product.objects.create(name="ผ้า", province=Province.objects.get())
+    assert get_data_version() == version + 1
+
+    r = client.get("/api/products.json")
+    # Live output only carries the data-version validator, not a snapshot's content hash
+    assert r["ETag"] == f'W/"v{version + 1}"'
+    assert len(json.loads(_body(r))) == 3
+
+
+def test_import_bumps_version_once(tmp_path, snapshot_dir, db):
+    path = tmp_path / "otop.json"
+    path.write_text(json.dumps([{"name": "a", "province": "x"}, {"name": "b", "province": "y"}]))
+    call_command("import_otop_json", "-i", str(path), "--mode", "row", "--build-snapshots")
+    assert get_data_version() == 1
+    manifest = json.loads((snapshot_dir / "manifest.json").read_text())
+    assert manifest["version"] == 1
+
+
+@pytest.fixture
+def raw_feed(settings, tmp_path):
+    path = tmp_path / "otop.json"
+    path.write_bytes(json.dumps([{"name": f"สินค้า {i}"} for i in range(200)]).encode())
+    settings.OTOP_JSON_PATH = str(path)
+    return path
+
+
+def test_raw_feed_ranges_and_validators(client, raw_feed):
+    data = raw_feed.read_bytes()
+    r = client.get("/api/otop.json")
+    assert r.status_code == 200 and _body(r) == data
+    assert r["Accept-Ranges"] == "bytes" and r.has_header("Last-Modified")
+    etag = r["ETag"]
+
+    assert client.get("/api/otop.json", HTTP_IF_NONE_MATCH=etag).status_code == 304
+    since = client.get("/api/otop.json", HTTP_IF_MODIFIED_SINCE=r["Last-Modified"])
+    assert since.status_code == 304
+
+    r = client.get("/api/otop.json", HTTP_RANGE="bytes=10-19")
+    assert r.status_code == 206 and _body(r) == data[10:20]
+    assert r["Content-Range"] == f"bytes 10-19/{len(data)}" and r["Content-Length"] == "10"
+    assert _body(client.get("/api/otop.json", HTTP_RANGE="bytes=-5")) == data[-5:]
+    assert _body(client.get("/api/otop.json", HTTP_RANGE=f"bytes={len(data) - 3}-")) == data[-3:]
+    assert client.get("/api/otop.json", HTTP_RANGE=f"bytes={len(data)}-").status_code == 416
+    # A stale If-Range gets the whole file
+    r = client.get("/api/otop.json", HTTP_RANGE="bytes=0-0", HTTP_IF_RANGE='"old"')
+    assert r.status_code == 200 and _body(r) == data
+
+
+def test_raw_feed_serves_fresh_sidecar(client, raw_feed, snapshot_dir, catalogue):
+    data = raw_feed.read_bytes()
+    r = client.get("/api/otop.json", HTTP_ACCEPT_ENCODING="gzip")
+    assert not r.has_header("Content-Encoding")
+
+    call_command("build_snapshots", "--sidecars")
+    r = client.get("/api/otop.json", HTTP_ACCEPT_ENCODING="gzip")
+    assert r["Content-Encoding"] == "gzip" and gzip.decompress(_body(r)) == data
+    assert client.get("/api/otop.json", HTTP_IF_NONE_MATCH=r["ETag"]).status_code == 304
+    # Ranges always address the uncompressed bytes
+    r = client.get("/api/otop.json", HTTP_ACCEPT_ENCODING="gzip", HTTP_RANGE="bytes=0-0")
+    assert not r.has_header("Content-Encoding") and _body(r) == data[:1]
+
+
+def test_raw_feed_missing(client, settings):
+    settings.OTOP_JSON_PATH = ""
+    assert client.get("/api/otop.json").status_code == 404
+
+
+def test_snapshot_dir_not_configured(settings, db):
+    settings.OTOP_SNAPSHOT_DIR = ""
+    with pytest.raises(CommandError, match="OTOP_SNAPSHOT_DIR"):
+        call_command("build_snapshots")
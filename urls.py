@@ -5,6 +5,7 @@ from otop_search_thailand import views
 
 urlpatterns = [
     path('healthz', views.healthz, name='healthz'),
+    path('metrics', views.metrics_view, name='metrics'),
     path('', views.home, name='home'),
     path('products/', views.products_list, name='products'),
     path('provinces/', views.province_list, name='province_list'),
@@ -13,6 +14,18 @@ urlpatterns = [
     path('search/', views.search_view, name='search'),
     path('api/products.json', views.api_products_json, name='api_products_json'),
     path('api/products.geojson', views.api_products_geojson, name='api_products_geojson'),
+    path('api/otop.json', views.api_file_json, name='api_file_json'),
+    path('api/clusters.geojson', views.api_clusters, name='api_clusters'),
+    path('api/tiles/<int:z>/<int:x>/<int:y>', views.api_tile, name='api_tile'),
+    path('api/suggest', views.api_suggest, name='api_suggest'),
+    path(
+        'api/products/datatables',
+        views.api_products_datatables,
+        name='api_products_datatables',
+    ),
+    path('api/products/nearby', views.api_products_nearby, name='api_products_nearby'),
+    path('api/products/changes', views.api_products_changes, name='api_products_changes'),
+    path('api/products/', views.api_products_page, name='api_products_page'),
     path('about/', views.about, name='about'),
     path('admin/', admin.site.urls),
 ]